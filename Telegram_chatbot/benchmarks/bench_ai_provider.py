@@ -0,0 +1,134 @@
+"""对比「每次调用新建 AI 客户端」与复用客户端两种模式下 analyze_message 的延迟。
+
+在本地启动一个模拟 OpenAI 接口的 HTTP 服务，统计每种模式的延迟分位数和服务端新建的 TCP 连接数。
+
+用法（在 Telegram_chatbot 目录下执行）:
+    python -m benchmarks.bench_ai_provider --requests 300 --server-delay-ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+from database.db_manager import DatabaseManager  # noqa: E402
+from database import settings as db_settings  # noqa: E402
+from services.ai_service import ai_service, OpenAIProvider  # noqa: E402
+
+
+class StubServer:
+    def __init__(self, delay_ms: float):
+        self.delay = delay_ms / 1000
+        self.connections = set()
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.runner = None
+        self.port = None
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.connections.add(request.transport.get_extra_info("peername"))
+        body = await request.json()
+        await asyncio.sleep(self.delay)
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": json.dumps({"is_spam": False, "reason": "内容未发现违规。"}, ensure_ascii=False),
+                },
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def run_round(requests: int, concurrency: int, per_call_client: bool) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        # 每条文本不同，避免命中审查缓存或被合并
+        message = SimpleNamespace(text=f"你好，请问怎么联系客服？#{per_call_client}-{i}")
+        async with semaphore:
+            started = time.perf_counter()
+            if per_call_client:
+                # 旧实现：每次分析都新建客户端
+                provider = OpenAIProvider(config.OPENAI_API_KEY, config.OPENAI_BASE_URL)
+                await provider.analyze_message(message.text)
+                await provider.aclose()
+            else:
+                await ai_service.analyze_message(message)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def describe(latencies: list) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    return f"p50 {statistics.median(ordered):6.2f} ms, p95 {p95:6.2f} ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--server-delay-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    server = StubServer(args.server_delay_ms)
+    await server.start()
+    config.ENABLE_AI_FILTER = True
+    config.AI_RPM_LIMIT = 0
+    config.AI_MAX_CONCURRENCY = max(config.AI_MAX_CONCURRENCY, args.concurrency)
+    config.OPENAI_API_KEY = "sk-bench"
+    config.OPENAI_BASE_URL = f"http://127.0.0.1:{server.port}/v1"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager()
+        manager.db_path = os.path.join(tmp, "bench.db")
+        await manager.initialize()
+        await db_settings.load()
+        await db_settings.set_value("ai_provider", "openai")
+
+        legacy = await run_round(args.requests, args.concurrency, per_call_client=True)
+        legacy_connections = len(server.connections)
+        server.connections.clear()
+
+        reused = await run_round(args.requests, args.concurrency, per_call_client=False)
+        reused_connections = len(server.connections)
+
+        await ai_service.close()
+        await manager.close()
+    await server.stop()
+
+    print(f"每次新建客户端: {describe(legacy)}, 新建连接 {legacy_connections} 个")
+    print(f"复用客户端    : {describe(reused)}, 新建连接 {reused_connections} 个")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
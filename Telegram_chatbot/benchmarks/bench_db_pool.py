@@ -0,0 +1,116 @@
+"""对比「每次调用新建连接」与连接池两种模式下，单条私聊消息的数据库往返吞吐。
+
+默认只比较连接方式：两轮都绕过写入队列，每条写入各自获取连接并提交，
+与引入写入队列之前的写法一致。加 --write-buffer 时两轮都经过写入队列，
+结果是连接池与写入队列叠加后的效果，计时包含最终刷盘。
+
+用法（在 Telegram_chatbot 目录下执行）:
+    python -m benchmarks.bench_db_pool --messages 2000 --concurrency 20
+    python -m benchmarks.bench_db_pool --messages 2000 --concurrency 20 --write-buffer
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager  # noqa: E402
+from database import models as db  # noqa: E402
+from database import settings as db_settings  # noqa: E402
+from database.user_cache import user_cache  # noqa: E402
+from database.write_buffer import write_buffer  # noqa: E402
+
+
+# 绕过写入队列时，本条消息产生的写入先记在这里，由 simulate_message 逐条直接提交
+_direct_writes = ContextVar("direct_writes", default=None)
+
+
+def bypass_write_buffer():
+    def enqueue(sql: str, params: tuple, key=None):
+        _direct_writes.get().append((sql, params))
+
+    write_buffer.enqueue = enqueue
+
+
+async def simulate_message(manager: DatabaseManager, user_id: int, message_id: int):
+    writes = []
+    _direct_writes.set(writes)
+    # 与 handlers/user_handler.handle_message 在已验证用户路径上的查询顺序一致
+    await db.is_blacklisted(user_id)
+    await db.get_user_state(user_id)
+    await db.update_user_profile(user_id, f"user{user_id}", "Bench", None, "zh")
+    await db.is_exempted(user_id)
+    await db.save_message(user_id, message_id, "hello", "incoming")
+    await db.get_autoreply_enabled()
+    for sql, params in writes:
+        async with manager.writer() as conn:
+            await conn.execute(sql, params)
+            await conn.commit()
+
+
+async def run_round(manager: DatabaseManager, messages: int, concurrency: int, users: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await simulate_message(manager, 1000 + i % users, i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    await write_buffer.flush()
+    return messages / (time.perf_counter() - started)
+
+
+def use_per_call_connections(manager: DatabaseManager):
+    @asynccontextmanager
+    async def fresh_connection():
+        async with aiosqlite.connect(manager.db_path) as conn:
+            yield conn
+
+    manager.reader = fresh_connection
+    manager.writer = fresh_connection
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--write-buffer", action="store_true", help="两轮都经过写入队列，测量叠加效果")
+    args = parser.parse_args()
+
+    # 关闭用户状态缓存，使每条消息都真实访问数据库
+    user_cache.ttl = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager()
+        manager.db_path = os.path.join(tmp, "bench.db")
+        await manager.initialize()
+        await db_settings.load()
+        for i in range(args.users):
+            await db.add_user(1000 + i, f"user{1000 + i}", "Bench", None, "zh")
+        if not args.write_buffer:
+            bypass_write_buffer()
+
+        pooled = await run_round(manager, args.messages, args.concurrency, args.users)
+        await manager.close()
+
+        use_per_call_connections(manager)
+        legacy = await run_round(manager, args.messages, args.concurrency, args.users)
+        await write_buffer.close()
+
+    mode = "连接池与写入队列叠加" if args.write_buffer else "仅连接池，不经过写入队列"
+    print(f"对比范围: {mode}")
+    print(f"每次新建连接: {legacy:8.1f} 条消息/秒")
+    print(f"连接池      : {pooled:8.1f} 条消息/秒 ({pooled / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
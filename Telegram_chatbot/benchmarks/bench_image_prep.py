@@ -0,0 +1,63 @@
+"""对比 AI 审查图片在改造前（下载最大尺寸原图直接发送）与改造后（缩放压缩为 JPEG）的载荷大小与耗时。
+
+用法（在 Telegram_chatbot 目录下执行）:
+    python -m benchmarks.bench_image_prep --width 2560 --height 1920 --count 20
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from config import config  # noqa: E402
+from utils.media_converter import prepare_image  # noqa: E402
+
+
+def make_photo(width: int, height: int) -> bytes:
+    # 带噪点的渐变图，压缩率接近真实照片
+    img = Image.radial_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    img = Image.blend(img, noise, 0.5)
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format="JPEG", quality=90)
+    return output_buffer.getvalue()
+
+
+async def run(args):
+    photo = make_photo(args.width, args.height)
+
+    started = time.perf_counter()
+    for _ in range(args.count):
+        legacy_payload = base64.b64encode(photo)
+    legacy_ms = (time.perf_counter() - started) * 1000 / args.count
+
+    started = time.perf_counter()
+    for _ in range(args.count):
+        prepared = await prepare_image(photo)
+        new_payload = base64.b64encode(prepared)
+    new_ms = (time.perf_counter() - started) * 1000 / args.count
+
+    print(f"原图: {args.width}x{args.height}, {len(photo) / 1024:.0f} KB")
+    print(f"改造前: 载荷 {len(legacy_payload) / 1024:.0f} KB, 编码 {legacy_ms:.2f} ms/张")
+    print(
+        f"改造后 (长边 {config.IMAGE_ANALYSIS_MAX_SIDE}, 质量 {config.IMAGE_ANALYSIS_JPEG_QUALITY}):"
+        f" 载荷 {len(new_payload) / 1024:.0f} KB, 预处理+编码 {new_ms:.2f} ms/张"
+    )
+    print(f"载荷缩小: {len(legacy_payload) / len(new_payload):.1f} 倍")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1920)
+    parser.add_argument("--count", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""对比旧版「全局锁 + 时间戳队列」限流器与分片 GCRA 限流器在大量不同用户下的单次检查耗时与内存占用。
+
+用法（在 Telegram_chatbot 目录下执行）:
+    python -m benchmarks.bench_rate_limiter --users 100000 --messages 5
+"""
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+from services.rate_limiter import RateLimiter  # noqa: E402
+
+
+class LegacyRateLimiter:
+    # services/rate_limiter.RateLimiter 改造前的实现
+    def __init__(self):
+        self.user_message_timestamps = defaultdict(lambda: deque())
+        self.max_messages_per_minute = config.MAX_MESSAGES_PER_MINUTE
+        self.user_warnings = {}
+        self.lock = asyncio.Lock()
+
+    async def check_user_rate_limit(self, user_id: int) -> tuple[bool, bool]:
+        async with self.lock:
+            now = time.time()
+            timestamps = self.user_message_timestamps[user_id]
+            while timestamps and timestamps[0] < now - 60.0:
+                timestamps.popleft()
+            is_over_limit = len(timestamps) >= self.max_messages_per_minute
+            if is_over_limit:
+                return True, self.user_warnings.get(user_id, False)
+            timestamps.append(now)
+            self.user_warnings.pop(user_id, None)
+            return False, False
+
+
+async def run_round(limiter, users: int, messages: int) -> list:
+    # 每轮让所有用户各发一条消息，记录每轮的平均单次耗时，观察随用户数增长是否变慢
+    per_round_ns = []
+    for _ in range(messages):
+        started = time.perf_counter_ns()
+        for user_id in range(users):
+            await limiter.check_user_rate_limit(user_id)
+        per_round_ns.append((time.perf_counter_ns() - started) / users)
+    return per_round_ns
+
+
+async def measure(name: str, factory, users: int, messages: int):
+    per_round_ns = await run_round(factory(), users, messages)
+
+    gc.collect()
+    tracemalloc.start()
+    limiter = factory()
+    await run_round(limiter, users, messages)
+    state_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rounds = ", ".join(f"{ns:.0f}" for ns in per_round_ns)
+    print(f"{name}: 每次检查 {rounds} ns (逐轮), 限流状态 {state_bytes / 1024 / 1024:.1f} MiB")
+    return state_bytes, limiter
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_bytes, _ = await measure("旧版限流器", LegacyRateLimiter, args.users, args.messages)
+    gcra_bytes, limiter = await measure("GCRA 限流器", RateLimiter, args.users, args.messages)
+
+    # 模拟所有用户空闲超过一分钟后的清理：逐批清理分片，记录单次清理的最长停顿
+    idle_at = time.monotonic() + 60 + 1
+    longest_ms = 0.0
+    ticks = 0
+    while len(limiter.user_limiter):
+        started = time.perf_counter()
+        limiter.sweep_idle(now=idle_at)
+        longest_ms = max(longest_ms, (time.perf_counter() - started) * 1000)
+        ticks += 1
+    print(f"空闲清理: {ticks} 次轮完全部分片, 单次最长 {longest_ms:.1f} ms, 剩余 {len(limiter.user_limiter)} 个用户")
+    print(f"内存占用: 旧版 / GCRA = {legacy_bytes / max(gcra_bytes, 1):.1f}x, 进程峰值 RSS {rss_mb():.0f} MiB")
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -5,7 +5,21 @@ from config import config
 from handlers import register_handlers
 from rss import setup as setup_rss
 from database.db_manager import DatabaseManager
+from database.write_buffer import write_buffer
+from database import settings as db_settings
+from database.thread_index import thread_index
+from database import models as db
 from services.telegram_commands import register_bot_commands
+from services.ai_service import ai_service
+from services.verdict_cache import verdict_cache
+from services.prefilter import prefilter
+from services.challenge_pool import challenge_pool
+from services.session_store import session_store
+from services.rate_limiter import rate_limiter
+from services.send_scheduler import outbound_scheduler
+from services.update_processor import update_processor
+from services.media_group import media_group_buffer
+from services.webhook_server import run_webhook
 
 async def post_init(app: Application):
     config.BOT_ID = app.bot.id
@@ -13,6 +27,37 @@ async def post_init(app: Application):
     print(f"Bot ID: {config.BOT_ID} 已设置")
     print(f"Bot Username: {config.BOT_USERNAME} 已设置")
     await register_bot_commands(app)
+    challenge_pool.start()
+
+async def prune_verdict_cache_job(context):
+    try:
+        await verdict_cache.prune()
+    except Exception as e:
+        logging.error(f"清理 AI 审查缓存失败: {e}")
+
+async def sweep_sessions_job(context):
+    removed = session_store.sweep()
+    if removed:
+        logging.info(f"已清理 {removed} 个过期的验证会话。")
+
+async def sweep_rate_limiter_job(context):
+    rate_limiter.sweep_idle()
+
+async def optimize_search_index_job(context):
+    try:
+        await db.optimize_search_indexes()
+    except Exception as e:
+        logging.error(f"优化消息搜索索引失败: {e}")
+
+async def post_stop(app: Application):
+    # Bot 关闭前把未到齐的相册发出去
+    await media_group_buffer.close()
+
+async def post_shutdown(app: Application):
+    await challenge_pool.close()
+    await ai_service.close()
+    await write_buffer.close()
+    await DatabaseManager().close()
 
 def main():
     logging.basicConfig(
@@ -26,16 +71,46 @@ def main():
 
     db_manager = DatabaseManager(config.DATABASE_PATH)
     loop.run_until_complete(db_manager.initialize())
+    loop.run_until_complete(db_settings.load())
+    loop.run_until_complete(thread_index.load())
+    loop.run_until_complete(prefilter.load())
+    loop.run_until_complete(challenge_pool.load())
+    loop.run_until_complete(session_store.load())
 
-    app = Application.builder().token(config.BOT_TOKEN).post_init(post_init).build()
+    app = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .rate_limiter(outbound_scheduler)
+        .concurrent_updates(update_processor)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     register_handlers(app)
     setup_rss(app)
+    app.job_queue.run_repeating(prune_verdict_cache_job, interval=3600, first=60, name="verdict_cache_prune")
+    app.job_queue.run_repeating(
+        sweep_sessions_job, interval=config.VERIFICATION_SESSION_SWEEP_INTERVAL,
+        first=config.VERIFICATION_SESSION_SWEEP_INTERVAL, name="verification_session_sweep"
+    )
+    app.job_queue.run_repeating(
+        sweep_rate_limiter_job, interval=config.RATE_LIMIT_SWEEP_INTERVAL,
+        first=config.RATE_LIMIT_SWEEP_INTERVAL, name="rate_limiter_sweep"
+    )
+    app.job_queue.run_repeating(
+        optimize_search_index_job, interval=config.SEARCH_INDEX_OPTIMIZE_INTERVAL,
+        first=config.SEARCH_INDEX_OPTIMIZE_INTERVAL, name="search_index_optimize"
+    )
 
     config.validate()
 
     logging.info("Bot启动中...")
-    app.run_polling()
+    if config.WEBHOOK_ENABLED:
+        loop.run_until_complete(run_webhook(app))
+    else:
+        app.run_polling()
 
 if __name__ == '__main__':
     try:
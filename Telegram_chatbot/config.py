@@ -36,11 +36,100 @@ class Config:
     # 性能与底层配额
     MAX_WORKERS = int(os.getenv('MAX_WORKERS', '5'))
     QUEUE_TIMEOUT = int(os.getenv('QUEUE_TIMEOUT', '30'))
+    # 并发处理更新：MAX_WORKERS 个更新同时处理，超出的最多排队 QUEUE_MAX_SIZE 个，排队超过 QUEUE_TIMEOUT 秒则丢弃
+    QUEUE_MAX_SIZE = int(os.getenv('QUEUE_MAX_SIZE', '1000'))
+
+    # AI 调用调度：每个提供商的并发上限、每分钟请求数/Token 预算（0 表示不限）和最大排队数
+    AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', str(MAX_WORKERS)))
+    AI_RPM_LIMIT = int(os.getenv('AI_RPM_LIMIT', '60'))
+    AI_TPM_LIMIT = int(os.getenv('AI_TPM_LIMIT', '0'))
+    AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', '200'))
+
+    # SQLite 连接池：1 个写连接 + N 个读连接
+    DB_READER_POOL_SIZE = int(os.getenv('DB_READER_POOL_SIZE', '4'))
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+    # 消息日志等非关键写入的批量刷盘：满 N 条或每 M 毫秒提交一次
+    WRITE_BUFFER_MAX_BATCH = int(os.getenv('WRITE_BUFFER_MAX_BATCH', '200'))
+    WRITE_BUFFER_FLUSH_MS = int(os.getenv('WRITE_BUFFER_FLUSH_MS', '500'))
+    # 积压上限（超出后丢弃新记录）与单条记录最多写入尝试次数（超出后丢弃并记录日志）
+    WRITE_BUFFER_MAX_PENDING = int(os.getenv('WRITE_BUFFER_MAX_PENDING', '20000'))
+    WRITE_BUFFER_MAX_RETRIES = int(os.getenv('WRITE_BUFFER_MAX_RETRIES', '5'))
+
+    # 活跃用户状态缓存（验证/黑名单/豁免/话题），TTL 单位为秒
+    USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', '10000'))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+    # 同一用户 last_active 的最短刷新间隔（秒）
+    LAST_ACTIVE_TOUCH_INTERVAL = int(os.getenv('LAST_ACTIVE_TOUCH_INTERVAL', '60'))
+    # 已确认存在的话题在 TTL（秒）内不再探测，0 表示每条消息都探测
+    TOPIC_HEALTH_CACHE_MAX_SIZE = int(os.getenv('TOPIC_HEALTH_CACHE_MAX_SIZE', '10000'))
+    TOPIC_HEALTH_TTL = int(os.getenv('TOPIC_HEALTH_TTL', '3600'))
+
+    # AI 审查图片：下载长边不小于该值的最小尺寸，缩放到该长边后以指定质量压缩为 JPEG
+    IMAGE_ANALYSIS_MAX_SIDE = int(os.getenv('IMAGE_ANALYSIS_MAX_SIDE', '768'))
+    IMAGE_ANALYSIS_JPEG_QUALITY = int(os.getenv('IMAGE_ANALYSIS_JPEG_QUALITY', '80'))
+
+    # 自动回复知识库检索：取 BM25 最相关的前 K 条写入提示词，没有得分高于阈值的条目时不调用 AI
+    # 阈值为 0 表示命中任意词项即可；条目较多时可调高以过滤"可以""一个"这类常见词的弱命中
+    KB_RETRIEVAL_TOP_K = int(os.getenv('KB_RETRIEVAL_TOP_K', '3'))
+    KB_RETRIEVAL_MIN_SCORE = float(os.getenv('KB_RETRIEVAL_MIN_SCORE', '0'))
+
+    # 自动回复答案缓存：同一问题在知识库未变化时直接复用答案，TTL 单位为秒
+    AUTOREPLY_CACHE_MAX_SIZE = int(os.getenv('AUTOREPLY_CACHE_MAX_SIZE', '2000'))
+    AUTOREPLY_CACHE_TTL = int(os.getenv('AUTOREPLY_CACHE_TTL', str(24 * 3600)))
+
+    # 消息全文索引的定期优化（合并索引段）间隔，单位为秒
+    SEARCH_INDEX_OPTIMIZE_INTERVAL = int(os.getenv('SEARCH_INDEX_OPTIMIZE_INTERVAL', str(24 * 3600)))
+
+    # 相册聚合窗口（毫秒）：同一相册的媒体在窗口内到齐后合并为一次发送
+    MEDIA_GROUP_WINDOW_MS = int(os.getenv('MEDIA_GROUP_WINDOW_MS', '800'))
+
+    # AI 审查结论缓存：相同文本/图片直接复用判定结果
+    VERDICT_CACHE_MAX_SIZE = int(os.getenv('VERDICT_CACHE_MAX_SIZE', '5000'))
+    VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', str(7 * 24 * 3600)))
+    VERDICT_CACHE_DB_MAX_ROWS = int(os.getenv('VERDICT_CACHE_DB_MAX_ROWS', '100000'))
+
+    # 本地预过滤：同一字符连续出现 N 次以上视为疑似刷屏并转交 AI；不超过 M 字的纯文本直接放行（0 表示关闭）
+    PREFILTER_REPEAT_LIMIT = int(os.getenv('PREFILTER_REPEAT_LIMIT', '20'))
+    PREFILTER_HAM_MAX_LENGTH = int(os.getenv('PREFILTER_HAM_MAX_LENGTH', '0'))
     
     VERIFICATION_TIMEOUT = int(os.getenv('VERIFICATION_TIMEOUT', '300'))
+    # 未完成的验证/解封会话：内存上限与过期清理间隔（秒）
+    VERIFICATION_SESSION_MAX_ENTRIES = int(os.getenv('VERIFICATION_SESSION_MAX_ENTRIES', '50000'))
+    VERIFICATION_SESSION_SWEEP_INTERVAL = int(os.getenv('VERIFICATION_SESSION_SWEEP_INTERVAL', '30'))
+    # 预生成验证题目池：低于下限时后台按批补充到上限
+    CHALLENGE_POOL_LOW_WATERMARK = int(os.getenv('CHALLENGE_POOL_LOW_WATERMARK', '20'))
+    CHALLENGE_POOL_HIGH_WATERMARK = int(os.getenv('CHALLENGE_POOL_HIGH_WATERMARK', '100'))
+    CHALLENGE_POOL_BATCH_SIZE = int(os.getenv('CHALLENGE_POOL_BATCH_SIZE', '10'))
     MAX_VERIFICATION_ATTEMPTS = int(os.getenv('MAX_VERIFICATION_ATTEMPTS', '3'))
     
     MAX_MESSAGES_PER_MINUTE = int(os.getenv('MAX_MESSAGES_PER_MINUTE', '30'))
+    # 全体用户合计每分钟消息上限（0 表示不限制）；限流状态分片数与空闲用户清理间隔（秒）
+    RATE_LIMIT_GLOBAL_PER_MINUTE = int(os.getenv('RATE_LIMIT_GLOBAL_PER_MINUTE', '0'))
+    RATE_LIMIT_SHARDS = int(os.getenv('RATE_LIMIT_SHARDS', '64'))
+    RATE_LIMIT_SWEEP_INTERVAL = int(os.getenv('RATE_LIMIT_SWEEP_INTERVAL', '10'))
+    # 出站发送限速：全局每秒、单个群组每分钟上限（0 表示不限制），以及 RetryAfter 自动重试次数
+    SEND_GLOBAL_PER_SECOND = int(os.getenv('SEND_GLOBAL_PER_SECOND', '30'))
+    SEND_GROUP_PER_MINUTE = int(os.getenv('SEND_GROUP_PER_MINUTE', '20'))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+    # 论坛群组承接所有用户转发，单独设置每分钟上限（默认与其他群组相同）
+    SEND_FORUM_GROUP_PER_MINUTE = int(os.getenv('SEND_FORUM_GROUP_PER_MINUTE', str(SEND_GROUP_PER_MINUTE)))
+    # 每个优先级最多排队的发送请求数，以及最长排队时间（秒）；超出时放弃发送并通知调用方。RSS 推送可以等待更久
+    SEND_MAX_QUEUE = int(os.getenv('SEND_MAX_QUEUE', '200'))
+    SEND_MAX_WAIT = int(os.getenv('SEND_MAX_WAIT', '60'))
+    SEND_RSS_MAX_WAIT = int(os.getenv('SEND_RSS_MAX_WAIT', '600'))
+
+    # Webhook 模式：启用后不再长轮询。WEBHOOK_URL 为对外可访问的地址（不含路径），留空时只接受本地投递
+    WEBHOOK_ENABLED = os.getenv('WEBHOOK_ENABLED', 'false').lower() == 'true'
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+    WEBHOOK_HEALTH_PATH = os.getenv('WEBHOOK_HEALTH_PATH', '/healthz')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    WEBHOOK_MAX_BODY_SIZE = int(os.getenv('WEBHOOK_MAX_BODY_SIZE', str(1024 * 1024)))
 
     # RSS 功能
     RSS_ENABLED = os.getenv('RSS_ENABLED', 'false').lower() == 'true'
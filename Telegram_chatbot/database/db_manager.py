@@ -1,7 +1,11 @@
 import aiosqlite
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
+from config import config
+from .knowledge_index import build_search_text
 
 class DatabaseManager:
     _instance = None
@@ -11,16 +15,100 @@ class DatabaseManager:
             cls._instance = super(DatabaseManager, cls).__new__(cls)
             cls._instance.db_path = db_path
             cls._instance.ensure_data_directory()
+            cls._instance._writer = None
+            cls._instance._write_lock = None
+            cls._instance._readers = []
+            cls._instance._reader_queue = None
+            cls._instance.search_available = False
+            cls._instance.knowledge_index_available = False
         return cls._instance
 
     def ensure_data_directory(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
-    def get_connection(self):
-        return aiosqlite.connect(self.db_path)
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _open_connection(self):
+        conn = await aiosqlite.connect(self.db_path)
+        await conn.execute('PRAGMA busy_timeout = 5000')
+        await conn.execute('PRAGMA synchronous = NORMAL')
+        await conn.execute(f'PRAGMA cache_size = {-int(config.DB_CACHE_SIZE_KB)}')
+        await conn.execute(f'PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}')
+        await conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    async def open(self):
+        if self._writer is not None:
+            return
+
+        writer = await self._open_connection()
+        cursor = await writer.execute('PRAGMA journal_mode = WAL')
+        row = await cursor.fetchone()
+        await cursor.close()
+        if not row or str(row[0]).lower() != 'wal':
+            logging.warning(f"数据库未能切换到 WAL 模式，当前模式: {row[0] if row else '未知'}")
+
+        reader_queue = asyncio.Queue()
+        readers = []
+        for _ in range(max(1, config.DB_READER_POOL_SIZE)):
+            reader = await self._open_connection()
+            await reader.execute('PRAGMA query_only = 1')
+            readers.append(reader)
+            reader_queue.put_nowait(reader)
+
+        self._writer = writer
+        self._write_lock = asyncio.Lock()
+        self._readers = readers
+        self._reader_queue = reader_queue
+        logging.info(f"数据库连接池已打开: 1 个写连接, {len(readers)} 个读连接。")
+
+    async def close(self):
+        if self._writer is None:
+            return
+
+        async with self._write_lock:
+            for reader in self._readers:
+                await reader.close()
+            try:
+                await self._writer.execute('PRAGMA optimize')
+            except aiosqlite.Error as e:
+                logging.warning(f"关闭数据库前执行 PRAGMA optimize 失败: {e}")
+            await self._writer.close()
+
+        self._writer = None
+        self._write_lock = None
+        self._readers = []
+        self._reader_queue = None
+        logging.info("数据库连接池已关闭。")
+
+    @asynccontextmanager
+    async def writer(self):
+        if self._writer is None:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def reader(self):
+        if self._reader_queue is None:
+            await self.open()
+        reader_queue = self._reader_queue
+        conn = await reader_queue.get()
+        try:
+            yield conn
+        finally:
+            reader_queue.put_nowait(conn)
 
     async def initialize(self):
-        async with self.get_connection() as db:
+        await self.open()
+        async with self.writer() as db:
             await self.create_users_table(db)
             await self.create_messages_table(db)
             await self.create_blacklist_table(db)
@@ -31,6 +119,10 @@ class DatabaseManager:
             await self.create_filtered_messages_table(db)
             await self.create_knowledge_base_table(db)
             await self.create_exemptions_table(db)
+            await self.create_ai_verdict_cache_table(db)
+            await self.create_prefilter_rules_table(db)
+            await self.create_verification_challenges_table(db)
+            await self.create_search_tables(db)
             await self.migrate_database(db)
             await db.commit()
         logging.info("数据库初始化完成。")
@@ -50,13 +142,16 @@ class DatabaseManager:
                 verification_attempts INTEGER DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                message_count INTEGER DEFAULT 0
+                message_count INTEGER DEFAULT 0,
+                spam_count INTEGER DEFAULT 0 NOT NULL
             )
         ''')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_users_verified ON users(is_verified)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_users_blacklisted ON users(is_blacklisted)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_users_thread ON users(thread_id)')
+        # 管理面板按 (时间, 主键) 键集分页
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_users_created_page ON users(created_at, user_id)')
 
     async def create_messages_table(self, db):
         await db.execute('''
@@ -95,7 +190,8 @@ class DatabaseManager:
                 FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
             )
         ''')
-        await db.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_blocked_at ON blacklist(blocked_at)')
+        await db.execute('DROP INDEX IF EXISTS idx_blacklist_blocked_at')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_blocked_page ON blacklist(blocked_at, user_id)')
 
     async def create_admins_table(self, db):
         await db.execute('''
@@ -115,8 +211,10 @@ class DatabaseManager:
         await db.execute('''
             CREATE TABLE IF NOT EXISTS verification_sessions (
                 user_id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL DEFAULT 'verify',
                 question TEXT NOT NULL,
                 answer TEXT NOT NULL,
+                options TEXT,
                 attempts INTEGER DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 expires_at TIMESTAMP NOT NULL,
@@ -191,6 +289,7 @@ class DatabaseManager:
             )
         ''')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_filtered_messages_user_id ON filtered_messages(user_id)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_filtered_messages_page ON filtered_messages(filtered_at, id)')
 
     async def create_knowledge_base_table(self, db):
         await db.execute('''
@@ -203,6 +302,15 @@ class DatabaseManager:
             )
         ''')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_base_title ON knowledge_base(title)')
+        # 自动回复检索用的全文索引，rowid 与 knowledge_base.id 一致，内容为切分后的词项
+        try:
+            await db.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_base_fts USING fts5(title, content)
+            ''')
+        except aiosqlite.OperationalError as e:
+            logging.warning(f"当前 SQLite 不支持 FTS5，自动回复将使用完整知识库: {e}")
+            return
+        self.knowledge_index_available = True
 
     async def create_exemptions_table(self, db):
         await db.execute('''
@@ -218,9 +326,45 @@ class DatabaseManager:
         ''')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_exemptions_expires ON exemptions(expires_at)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_exemptions_permanent ON exemptions(is_permanent)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_exemptions_created_page ON exemptions(created_at, user_id)')
+
+    async def create_ai_verdict_cache_table(self, db):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS ai_verdict_cache (
+                cache_key TEXT PRIMARY KEY,
+                is_spam INTEGER NOT NULL,
+                reason TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_ai_verdict_cache_created ON ai_verdict_cache(created_at)')
+
+    async def create_prefilter_rules_table(self, db):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS prefilter_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rule_type TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                action TEXT NOT NULL DEFAULT 'block',
+                created_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (rule_type, pattern, action)
+            )
+        ''')
+
+    async def create_verification_challenges_table(self, db):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS verification_challenges (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL UNIQUE,
+                correct_answer TEXT NOT NULL,
+                incorrect_answers TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
     async def get_filtered_messages_by_user(self, user_id, limit=5):
-        async with self.get_connection() as db:
+        async with self.reader() as db:
             cursor = await db.execute(
                 'SELECT content, reason FROM filtered_messages WHERE user_id = ? ORDER BY filtered_at DESC LIMIT ?',
                 (user_id, limit)
@@ -228,6 +372,118 @@ class DatabaseManager:
             rows = await cursor.fetchall()
             return [{"content": row[0], "reason": row[1]} for row in rows]
 
+    # 消息记录与被过滤消息的全文索引：外部内容表 + 触发器同步，trigram 分词支持中文与链接的子串搜索
+    SEARCH_INDEXES = {
+        'messages_fts': ('messages', ('content',)),
+        'filtered_messages_fts': ('filtered_messages', ('content', 'reason')),
+    }
+    # 手动重建索引时每个事务写入的行数，期间释放写连接让缓冲写入穿插进行
+    SEARCH_REBUILD_CHUNK = 5000
+
+    async def create_search_tables(self, db):
+        for fts_table, (source_table, columns) in self.SEARCH_INDEXES.items():
+            async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,)) as cursor:
+                exists = await cursor.fetchone() is not None
+            try:
+                await db.execute(f'''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                        {", ".join(columns)}, content='{source_table}', content_rowid='id', tokenize='trigram'
+                    )
+                ''')
+            except aiosqlite.OperationalError as e:
+                logging.warning(f"当前 SQLite 不支持 FTS5 trigram 分词，消息搜索功能不可用: {e}")
+                return
+
+            column_list = ", ".join(columns)
+            new_values = ", ".join(f"new.{column}" for column in columns)
+            old_values = ", ".join(f"old.{column}" for column in columns)
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN
+                    INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END
+            ''')
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN
+                    INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                END
+            ''')
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {source_table} BEGIN
+                    INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END
+            ''')
+            if not exists:
+                await db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+                logging.info(f"数据库迁移：已为 '{source_table}' 表建立全文索引。")
+        self.search_available = True
+
+    async def maintain_search_indexes(self, rebuild: bool = False):
+        if rebuild:
+            for fts_table in self.SEARCH_INDEXES:
+                await self._rebuild_search_index(fts_table)
+            return
+        async with self.writer() as db:
+            for fts_table in self.SEARCH_INDEXES:
+                await db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('optimize')")
+            await db.commit()
+
+    async def _rebuild_search_index(self, fts_table: str):
+        # 分批重建：先清空索引并记下当前最大 id，更新的行由触发器写入，之前的行按 id 区间分批补回
+        source_table, columns = self.SEARCH_INDEXES[fts_table]
+        column_list = ", ".join(columns)
+        async with self.writer() as db:
+            async with db.execute(f'SELECT MAX(id) FROM {source_table}') as cursor:
+                max_id = (await cursor.fetchone())[0] or 0
+            await db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('delete-all')")
+            await db.commit()
+
+        last_id = 0
+        while last_id < max_id:
+            upper = min(last_id + self.SEARCH_REBUILD_CHUNK, max_id)
+            async with self.writer() as db:
+                await db.execute(
+                    f'INSERT INTO {fts_table} (rowid, {column_list}) SELECT id, {column_list} FROM {source_table} WHERE id > ? AND id <= ?',
+                    (last_id, upper)
+                )
+                await db.commit()
+            last_id = upper
+        logging.info(f"已重建 '{source_table}' 的全文索引（{max_id} 行以内）。")
+
+    async def rebuild_knowledge_index(self, db):
+        if not self.knowledge_index_available:
+            return
+        # 知识库条目不多，直接比对索引内容与按当前条目切分的结果，编辑或删后再加都能发现
+        async with db.execute('SELECT id, title, content FROM knowledge_base') as cursor:
+            expected = {
+                entry_id: (build_search_text(title), build_search_text(content))
+                for entry_id, title, content in await cursor.fetchall()
+            }
+        async with db.execute('SELECT rowid, title, content FROM knowledge_base_fts') as cursor:
+            indexed = {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+        if expected == indexed:
+            return
+
+        await db.execute('DELETE FROM knowledge_base_fts')
+        await db.executemany(
+            'INSERT INTO knowledge_base_fts (rowid, title, content) VALUES (?, ?, ?)',
+            [(entry_id, title, content) for entry_id, (title, content) in expected.items()]
+        )
+        logging.info(f"数据库迁移：已为 {len(expected)} 条知识库条目重建检索索引。")
+
+    async def create_spam_count_triggers(self, db):
+        # users.spam_count 随 filtered_messages 的写入在同一事务内增减
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS filtered_messages_spam_count_ai AFTER INSERT ON filtered_messages BEGIN
+                UPDATE users SET spam_count = spam_count + 1 WHERE user_id = new.user_id;
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS filtered_messages_spam_count_ad AFTER DELETE ON filtered_messages BEGIN
+                UPDATE users SET spam_count = MAX(spam_count - 1, 0) WHERE user_id = old.user_id;
+            END
+        ''')
+
     async def migrate_database(self, db):
         try:
             await db.execute('ALTER TABLE users ADD COLUMN blacklist_strikes INTEGER DEFAULT 0 NOT NULL')
@@ -243,6 +499,29 @@ class DatabaseManager:
             if "duplicate column name" not in str(e):
                 raise e
 
+        try:
+            await db.execute('ALTER TABLE users ADD COLUMN spam_count INTEGER DEFAULT 0 NOT NULL')
+            await db.execute('''
+                UPDATE users SET spam_count = (
+                    SELECT COUNT(*) FROM filtered_messages fm WHERE fm.user_id = users.user_id
+                )
+            ''')
+            logging.info("数据库迁移：成功为 'users' 表添加 'spam_count' 列并回填计数。")
+        except aiosqlite.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                raise e
+        await self.create_spam_count_triggers(db)
+
+        for column, definition in (('kind', "TEXT NOT NULL DEFAULT 'verify'"), ('options', 'TEXT')):
+            try:
+                await db.execute(f'ALTER TABLE verification_sessions ADD COLUMN {column} {definition}')
+                logging.info(f"数据库迁移：成功为 'verification_sessions' 表添加 '{column}' 列。")
+            except aiosqlite.OperationalError as e:
+                if "duplicate column name" not in str(e):
+                    raise e
+
+        await self.rebuild_knowledge_index(db)
+
         try:
             await db.execute(
                 'INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)',
@@ -269,4 +548,7 @@ class DatabaseManager:
         except Exception as e:
             logging.warning(f"添加AI设置时出错: {e}")
 
+        await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('prefilter_enabled', '1', '是否启用本地预过滤 (1=是, 0=否)'))
+        await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('prefilter_heuristics_enabled', '1', '是否启用本地预过滤内置启发式规则 (1=是, 0=否)'))
+
 db_manager = DatabaseManager()
@@ -0,0 +1,35 @@
+import re
+import unicodedata
+
+# 中日韩文字按相邻两字切分（单字成段时保留单字），其他文字按单词切分；
+# 切分结果以空格拼接写入 FTS5，由默认的 unicode61 分词器按空格索引
+_TOKEN_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]+|[^\W_]+')
+_CJK_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]')
+
+# 单次检索最多使用的词项数，避免长消息生成过大的 MATCH 表达式
+MAX_QUERY_TERMS = 64
+
+
+def _terms(text: str) -> list:
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    terms = []
+    for token in _TOKEN_RE.findall(text):
+        if _CJK_RE.match(token):
+            if len(token) == 1:
+                terms.append(token)
+            else:
+                terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+    return terms
+
+
+def build_search_text(text: str) -> str:
+    return " ".join(_terms(text))
+
+
+def build_match_query(text: str) -> str:
+    terms = list(dict.fromkeys(_terms(text)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return ""
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
@@ -0,0 +1,58 @@
+import logging
+from .db_manager import db_manager
+
+
+# 知识库条目的内存快照；任何写入都会使版本号递增并在下次读取时重新加载
+class KnowledgeSnapshot:
+    def __init__(self):
+        self.version = 0
+        self._entries = None
+        self._content = None
+        self.reloads = 0
+
+    def invalidate(self):
+        self.version += 1
+        self._entries = None
+        self._content = None
+
+    async def entries(self) -> list:
+        if self._entries is None:
+            version = self.version
+            async with db_manager.reader() as db:
+                async with db.execute('''
+                    SELECT id, title, content, created_at, updated_at
+                    FROM knowledge_base
+                    ORDER BY updated_at DESC
+                ''') as cursor:
+                    rows = await cursor.fetchall()
+                    cols = [description[0] for description in cursor.description]
+            entries = [dict(zip(cols, row)) for row in rows]
+            # 加载期间有写入时不缓存，下次重新读取
+            if version != self.version:
+                return [dict(entry) for entry in entries]
+            self._entries = entries
+            self.reloads += 1
+            logging.info(f"知识库快照已加载 {len(entries)} 条（版本 {version}）。")
+        return [dict(entry) for entry in self._entries]
+
+    async def content(self) -> str:
+        if self._content is None:
+            version = self.version
+            entries = await self.entries()
+            content = format_knowledge_content(entries)
+            if version != self.version:
+                return content
+            self._content = content
+        return self._content
+
+
+def format_knowledge_content(entries) -> str:
+    if not entries:
+        return ""
+    parts = ["知识库内容：\n\n"]
+    for entry in entries:
+        parts.append(f"标题：{entry['title']}\n内容：{entry['content']}\n\n")
+    return "".join(parts)
+
+
+knowledge_snapshot = KnowledgeSnapshot()
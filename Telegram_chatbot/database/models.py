@@ -1,9 +1,18 @@
+import time
 from datetime import datetime, timezone, timedelta
 from .db_manager import db_manager
+from .write_buffer import write_buffer
+from .user_cache import user_cache, profile_hash
+from .thread_index import thread_index
+from .knowledge_index import build_search_text, build_match_query
+from .knowledge_snapshot import knowledge_snapshot, format_knowledge_content
+from .pagination import fetch_keyset_page
+from .row_counts import row_counts
+from . import settings as db_settings
 from config import config
 
 async def get_user(user_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute(
             'SELECT * FROM users WHERE user_id = ?',
             (user_id,)
@@ -14,105 +23,198 @@ async def get_user(user_id: int):
             return None
 
 async def add_user(user_id: int, username: str, first_name: str, last_name: str = None, language_code: str = None):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute('''
             INSERT OR REPLACE INTO users
-            (user_id, username, first_name, last_name, language_code, last_active)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, first_name, last_name, language_code, datetime.now()))
+            (user_id, username, first_name, last_name, language_code, last_active, spam_count)
+            VALUES (?, ?, ?, ?, ?, ?, (SELECT COUNT(*) FROM filtered_messages WHERE user_id = ?))
+        ''', (user_id, username, first_name, last_name, language_code, datetime.now(), user_id))
         await db.commit()
+    user_cache.invalidate(user_id)
+    row_counts.invalidate('users')
+    # INSERT OR REPLACE 会清空原有的 thread_id
+    thread_index.set(user_id, None)
+
+async def get_user_state(user_id: int):
+    return await user_cache.get(user_id)
 
 async def update_user_profile(user_id: int, username: str, first_name: str, last_name: str = None, language_code: str = None):
-    async with db_manager.get_connection() as db:
-        await db.execute(
-            '''
-            UPDATE users
-            SET username = ?, first_name = ?, last_name = ?, language_code = ?, last_active = ?
-            WHERE user_id = ?
-            ''',
-            (username, first_name, last_name, language_code, datetime.now(), user_id)
-        )
-        await db.commit()
+    state = await user_cache.get(user_id)
+    new_hash = profile_hash(username, first_name, last_name, language_code)
+    if state.profile_hash != new_hash:
+        async with db_manager.writer() as db:
+            await db.execute(
+                '''
+                UPDATE users
+                SET username = ?, first_name = ?, last_name = ?, language_code = ?
+                WHERE user_id = ?
+                ''',
+                (username, first_name, last_name, language_code, user_id)
+            )
+            await db.commit()
+        user_cache.update(user_id, profile_hash=new_hash)
+
+    # last_active 只用于展示，按间隔节流后交给写入队列合并提交
+    now = time.monotonic()
+    if now - state.touched_at >= config.LAST_ACTIVE_TOUCH_INTERVAL:
+        state.touched_at = now
+        touch_user_last_active(user_id)
+
+def touch_user_last_active(user_id: int):
+    write_buffer.enqueue(
+        'UPDATE users SET last_active = ? WHERE user_id = ?',
+        (datetime.now(), user_id),
+        key=('last_active', user_id)
+    )
 
 async def update_user_verification(user_id: int, is_verified: bool):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute(
             'UPDATE users SET is_verified = ? WHERE user_id = ?',
             (1 if is_verified else 0, user_id)
         )
         await db.commit()
+    user_cache.update(user_id, is_verified=bool(is_verified))
 
 async def update_user_thread_id(user_id: int, thread_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute(
             'UPDATE users SET thread_id = ? WHERE user_id = ?',
             (thread_id, user_id)
         )
         await db.commit()
+    user_cache.update(user_id, thread_id=thread_id)
+    thread_index.set(user_id, thread_id)
 
-async def get_user_by_thread_id(thread_id: int):
-    async with db_manager.get_connection() as db:
-        async with db.execute(
-            'SELECT * FROM users WHERE thread_id = ?',
-            (thread_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return dict(zip([col[0] for col in cursor.description], row))
-            return None
+async def _ensure_thread_index():
+    if not thread_index.loaded:
+        await thread_index.load()
 
-async def save_message(user_id: int, message_id: int, content: str, direction: str, media_type: str = None, media_file_id: str = None):
-    async with db_manager.get_connection() as db:
-        await db.execute('''
-            INSERT INTO messages
-            (user_id, message_id, content, direction, media_type, media_file_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, message_id, content, direction, media_type, media_file_id))
-        await db.commit()
+async def get_user_thread_id(user_id: int):
+    await _ensure_thread_index()
+    return thread_index.thread_for(user_id)
+
+async def get_user_id_by_thread_id(thread_id: int):
+    await _ensure_thread_index()
+    return thread_index.user_for(thread_id)
+
+async def save_message(user_id: int, message_id: int, content: str, direction: str, media_type: str = None, media_file_id: str = None, thread_id: int = None):
+    write_buffer.enqueue('''
+        INSERT INTO messages
+        (user_id, message_id, thread_id, content, direction, media_type, media_file_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, message_id, thread_id, content, direction, media_type, media_file_id))
 
 async def save_filtered_message(user_id: int, message_id: int, content: str, reason: str, media_type: str = None, media_file_id: str = None):
-    async with db_manager.get_connection() as db:
-        await db.execute('''
-            INSERT INTO filtered_messages
-            (user_id, message_id, content, reason, media_type, media_file_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, message_id, content, reason, media_type, media_file_id))
-        await db.commit()
+    write_buffer.enqueue('''
+        INSERT INTO filtered_messages
+        (user_id, message_id, content, reason, media_type, media_file_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, message_id, content, reason, media_type, media_file_id),
+        on_drop=lambda: row_counts.invalidate('filtered_messages'))
+    # 记录被写入队列丢弃时上面的回调会使缓存失效，下次读取重新 COUNT(*)
+    row_counts.adjust('filtered_messages', 1)
+
+async def get_filtered_messages(limit: int = 20, cursor: str = None, backward: bool = False):
+    return await fetch_keyset_page('''
+        SELECT fm.*, u.first_name, u.username
+        FROM filtered_messages fm
+        JOIN users u ON fm.user_id = u.user_id
+    ''', 'fm.filtered_at', 'fm.id', limit, cursor, backward)
 
-async def get_filtered_messages(limit: int = 20, offset: int = 0):
-    async with db_manager.get_connection() as db:
-        async with db.execute('''
-            SELECT fm.*, u.first_name, u.username
-            FROM filtered_messages fm
-            JOIN users u ON fm.user_id = u.user_id
-            ORDER BY fm.filtered_at DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset)) as cursor:
+async def get_filtered_messages_count() -> int:
+    return await row_counts.get('filtered_messages')
+
+# trigram 分词只能匹配不少于 3 个字符的词，更短的词（如两个字的中文词）改用 LIKE 子串匹配；
+# 多个关键词之间为 AND
+SEARCH_MIN_TERM_LENGTH = 3
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def build_search_query(text: str):
+    terms = list(dict.fromkeys((text or '').split()))
+    if not terms:
+        return None
+    long_terms = [term for term in terms if len(term) >= SEARCH_MIN_TERM_LENGTH]
+    return {
+        "match": " ".join('"' + term.replace('"', '""') + '"' for term in long_terms) or None,
+        "like": [_like_pattern(term) for term in terms if len(term) < SEARCH_MIN_TERM_LENGTH],
+    }
+
+# 每个范围：(全文索引表, 源表别名, 查询列, 源表 FROM 子句, 可做 LIKE 匹配的列)
+SEARCH_SCOPES = {
+    'messages': ('messages_fts', 'm', '''
+        m.id, m.user_id, m.content, m.direction, m.media_type, m.created_at AS created_at,
+        u.first_name, u.username
+    ''', 'messages m', ('m.content',)),
+    'filtered': ('filtered_messages_fts', 'fm', '''
+        fm.id, fm.user_id, fm.content, fm.reason, fm.media_type, fm.filtered_at AS created_at,
+        u.first_name, u.username
+    ''', 'filtered_messages fm', ('fm.content', 'fm.reason')),
+}
+
+async def search_messages(scope: str, search_query: dict, limit: int, before_id: int = None, after_id: int = None):
+    # 按 id 做键集分页：before_id 向更早翻页，after_id 向更新翻页；多取一条用于判断是否还有下一页
+    fts_table, alias, columns, source, like_columns = SEARCH_SCOPES[scope]
+    conditions, params = [], []
+    if search_query["match"]:
+        # 有长关键词时从全文索引出发，短关键词在命中结果上再过滤
+        from_clause = f"{fts_table} JOIN {source} ON {alias}.id = {fts_table}.rowid"
+        id_column = f"{fts_table}.rowid"
+        conditions.append(f"{fts_table} MATCH ?")
+        params.append(search_query["match"])
+    else:
+        from_clause = source
+        id_column = f"{alias}.id"
+    for pattern in search_query["like"]:
+        conditions.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in like_columns) + ")")
+        params.extend([pattern] * len(like_columns))
+    if before_id:
+        conditions.append(f"{id_column} < ?")
+        params.append(before_id)
+    if after_id:
+        conditions.append(f"{id_column} > ?")
+        params.append(after_id)
+    order = "ASC" if after_id else "DESC"
+    params.append(limit + 1)
+
+    async with db_manager.reader() as db:
+        async with db.execute(f'''
+            SELECT {columns}
+            FROM {from_clause}
+            LEFT JOIN users u ON u.user_id = {alias}.user_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {id_column} {order}
+            LIMIT ?
+        ''', params) as cursor:
             rows = await cursor.fetchall()
-            if not rows:
-                return []
             cols = [description[0] for description in cursor.description]
-            return [dict(zip(cols, row)) for row in rows]
 
-async def get_filtered_messages_count() -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM filtered_messages') as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+    has_more = len(rows) > limit
+    results = [dict(zip(cols, row)) for row in rows[:limit]]
+    if after_id:
+        results.reverse()
+    return results, has_more
+
+def search_available() -> bool:
+    return db_manager.search_available
+
+async def optimize_search_indexes():
+    if db_manager.search_available:
+        await db_manager.maintain_search_indexes()
+
+async def rebuild_search_indexes():
+    if db_manager.search_available:
+        await db_manager.maintain_search_indexes(rebuild=True)
 
 async def is_blacklisted(user_id: int):
-    async with db_manager.get_connection() as db:
-        async with db.execute(
-            'SELECT permanent FROM blacklist WHERE user_id = ?',
-            (user_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return True, bool(row[0])
-            return False, False
+    state = await user_cache.get(user_id)
+    return state.is_blacklisted, state.is_permanent
 
 async def add_to_blacklist(user_id: int, reason: str, blocked_by: int, permanent: bool = False):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute(
             'UPDATE users SET is_blacklisted = 1, blacklist_strikes = blacklist_strikes + 1 WHERE user_id = ?',
             (user_id,)
@@ -122,18 +224,22 @@ async def add_to_blacklist(user_id: int, reason: str, blocked_by: int, permanent
             VALUES (?, ?, ?, ?)
         ''', (user_id, reason, blocked_by, 1 if permanent else 0))
         await db.commit()
+    user_cache.update(user_id, is_blacklisted=True, is_permanent=bool(permanent))
+    row_counts.invalidate('blacklist')
 
 async def remove_from_blacklist(user_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute(
             'UPDATE users SET is_blacklisted = 0 WHERE user_id = ?',
             (user_id,)
         )
         await db.execute('DELETE FROM blacklist WHERE user_id = ?', (user_id,))
         await db.commit()
+    user_cache.update(user_id, is_blacklisted=False, is_permanent=False)
+    row_counts.invalidate('blacklist')
 
 async def get_blacklist():
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute('''
             SELECT b.user_id, u.first_name, u.username, b.reason, b.blocked_at
             FROM blacklist b
@@ -146,86 +252,59 @@ async def get_blacklist():
             cols = [description[0] for description in cursor.description]
             return [dict(zip(cols, row)) for row in rows]
 
-async def get_blacklist_paginated(limit: int = 5, offset: int = 0):
-    async with db_manager.get_connection() as db:
-        async with db.execute('''
-            SELECT b.user_id, u.first_name, u.username, b.reason, b.blocked_at
-            FROM blacklist b
-            LEFT JOIN users u ON b.user_id = u.user_id
-            ORDER BY b.blocked_at DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset)) as cursor:
-            rows = await cursor.fetchall()
-            if not rows:
-                return []
-            cols = [description[0] for description in cursor.description]
-            return [dict(zip(cols, row)) for row in rows]
+async def get_blacklist_paginated(limit: int = 5, cursor: str = None, backward: bool = False):
+    return await fetch_keyset_page('''
+        SELECT b.user_id, u.first_name, u.username, b.reason, b.blocked_at
+        FROM blacklist b
+        LEFT JOIN users u ON b.user_id = u.user_id
+    ''', 'b.blocked_at', 'b.user_id', limit, cursor, backward)
 
 async def get_blacklist_count() -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM blacklist') as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+    return await row_counts.get('blacklist')
 
 async def set_user_blacklist_strikes(user_id: int, strikes: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute(
-            'INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
-            (user_id, f"User_{user_id}")
+            'INSERT OR IGNORE INTO users (user_id, first_name, spam_count) VALUES (?, ?, (SELECT COUNT(*) FROM filtered_messages WHERE user_id = ?))',
+            (user_id, f"User_{user_id}", user_id)
         )
         await db.execute(
             'UPDATE users SET blacklist_strikes = ? WHERE user_id = ?',
             (strikes, user_id)
         )
         await db.commit()
+    user_cache.invalidate(user_id)
+    row_counts.invalidate('users')
 
 async def is_admin(user_id: int) -> bool:
     return user_id in config.ADMIN_IDS
 
 async def get_total_users_count() -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM users') as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+    return await row_counts.get('users')
 
 async def get_blocked_users_count() -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM blacklist') as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+    return await row_counts.get('blacklist')
 
 async def get_user_spam_count(user_id: int) -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM filtered_messages WHERE user_id = ?', (user_id,)) as cursor:
+    async with db_manager.reader() as db:
+        async with db.execute('SELECT spam_count FROM users WHERE user_id = ?', (user_id,)) as cursor:
             row = await cursor.fetchone()
             return row[0] if row else 0
 
-async def get_all_users_paginated(limit: int = 5, offset: int = 0):
-    async with db_manager.get_connection() as db:
-        async with db.execute('''
-            SELECT 
-                u.user_id,
-                u.first_name,
-                u.username,
-                u.is_blacklisted,
-                COALESCE(spam_count.count, 0) as spam_count
-            FROM users u
-            LEFT JOIN (
-                SELECT user_id, COUNT(*) as count
-                FROM filtered_messages
-                GROUP BY user_id
-            ) spam_count ON u.user_id = spam_count.user_id
-            ORDER BY u.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset)) as cursor:
-            rows = await cursor.fetchall()
-            if not rows:
-                return []
-            cols = [description[0] for description in cursor.description]
-            return [dict(zip(cols, row)) for row in rows]
+async def get_all_users_paginated(limit: int = 5, cursor: str = None, backward: bool = False):
+    return await fetch_keyset_page('''
+        SELECT 
+            u.user_id,
+            u.first_name,
+            u.username,
+            u.is_blacklisted,
+            u.created_at,
+            u.spam_count
+        FROM users u
+    ''', 'u.created_at', 'u.user_id', limit, cursor, backward)
 
 async def get_blacklist_user_details(user_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute('''
             SELECT 
                 b.user_id,
@@ -239,14 +318,9 @@ async def get_blacklist_user_details(user_id: int):
                 b.blocked_by,
                 b.blocked_at,
                 b.permanent,
-                COALESCE(spam_count.count, 0) as spam_count
+                COALESCE(u.spam_count, 0) as spam_count
             FROM blacklist b
             LEFT JOIN users u ON b.user_id = u.user_id
-            LEFT JOIN (
-                SELECT user_id, COUNT(*) as count
-                FROM filtered_messages
-                GROUP BY user_id
-            ) spam_count ON b.user_id = spam_count.user_id
             WHERE b.user_id = ?
         ''', (user_id,)) as cursor:
             row = await cursor.fetchone()
@@ -256,28 +330,24 @@ async def get_blacklist_user_details(user_id: int):
             return None
 
 async def add_knowledge_entry(title: str, content: str):
-    async with db_manager.get_connection() as db:
-        await db.execute('''
+    async with db_manager.writer() as db:
+        cursor = await db.execute('''
             INSERT INTO knowledge_base (title, content, updated_at)
             VALUES (?, ?, CURRENT_TIMESTAMP)
         ''', (title, content))
+        if db_manager.knowledge_index_available:
+            await db.execute(
+                'INSERT INTO knowledge_base_fts (rowid, title, content) VALUES (?, ?, ?)',
+                (cursor.lastrowid, build_search_text(title), build_search_text(content))
+            )
         await db.commit()
+    knowledge_snapshot.invalidate()
 
 async def get_all_knowledge_entries():
-    async with db_manager.get_connection() as db:
-        async with db.execute('''
-            SELECT id, title, content, created_at, updated_at
-            FROM knowledge_base
-            ORDER BY updated_at DESC
-        ''') as cursor:
-            rows = await cursor.fetchall()
-            if not rows:
-                return []
-            cols = [description[0] for description in cursor.description]
-            return [dict(zip(cols, row)) for row in rows]
+    return await knowledge_snapshot.entries()
 
 async def get_knowledge_entry(knowledge_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute('''
             SELECT id, title, content, created_at, updated_at
             FROM knowledge_base
@@ -290,96 +360,87 @@ async def get_knowledge_entry(knowledge_id: int):
             return None
 
 async def update_knowledge_entry(knowledge_id: int, title: str, content: str):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute('''
             UPDATE knowledge_base
             SET title = ?, content = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (title, content, knowledge_id))
+        if db_manager.knowledge_index_available:
+            await db.execute('DELETE FROM knowledge_base_fts WHERE rowid = ?', (knowledge_id,))
+            await db.execute(
+                'INSERT INTO knowledge_base_fts (rowid, title, content) VALUES (?, ?, ?)',
+                (knowledge_id, build_search_text(title), build_search_text(content))
+            )
         await db.commit()
+    knowledge_snapshot.invalidate()
 
 async def delete_knowledge_entry(knowledge_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute('DELETE FROM knowledge_base WHERE id = ?', (knowledge_id,))
+        if db_manager.knowledge_index_available:
+            await db.execute('DELETE FROM knowledge_base_fts WHERE rowid = ?', (knowledge_id,))
         await db.commit()
+    knowledge_snapshot.invalidate()
 
 async def get_all_knowledge_content() -> str:
-    entries = await get_all_knowledge_entries()
-    if not entries:
-        return ""
-    
-    knowledge_text = "知识库内容：\n\n"
-    for entry in entries:
-        knowledge_text += f"标题：{entry['title']}\n"
-        knowledge_text += f"内容：{entry['content']}\n\n"
-    
-    return knowledge_text
+    return await knowledge_snapshot.content()
+
+async def search_knowledge_entries(query: str, limit: int, min_score: float = 0.0):
+    match_query = build_match_query(query)
+    if not match_query or not db_manager.knowledge_index_available:
+        return []
+    # bm25() 越小越相关，取反后作为得分；标题权重为内容的 2 倍
+    async with db_manager.reader() as db:
+        async with db.execute('''
+            SELECT kb.id, kb.title, kb.content, -bm25(knowledge_base_fts, 2.0, 1.0) AS score
+            FROM knowledge_base_fts
+            JOIN knowledge_base kb ON kb.id = knowledge_base_fts.rowid
+            WHERE knowledge_base_fts MATCH ?
+            ORDER BY bm25(knowledge_base_fts, 2.0, 1.0)
+            LIMIT ?
+        ''', (match_query, limit)) as cursor:
+            rows = await cursor.fetchall()
+            cols = [description[0] for description in cursor.description]
+    return [dict(zip(cols, row)) for row in rows if row[3] >= min_score]
+
+async def get_relevant_knowledge_content(query: str) -> str:
+    # 没有全文索引时退回到把完整知识库放进提示词
+    if not db_manager.knowledge_index_available:
+        return await knowledge_snapshot.content()
+    entries = await search_knowledge_entries(query, config.KB_RETRIEVAL_TOP_K, config.KB_RETRIEVAL_MIN_SCORE)
+    return format_knowledge_content(entries)
 
 async def get_autoreply_enabled() -> bool:
-    async with db_manager.get_connection() as db:
-        async with db.execute(
-            'SELECT value FROM settings WHERE key = ?',
-            ('autoreply_enabled',)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return row[0] == '1'
-            return False
+    return db_settings.get_bool('autoreply_enabled')
 
 async def set_autoreply_enabled(enabled: bool):
-    async with db_manager.get_connection() as db:
-        await db.execute(
-            'UPDATE settings SET value = ?, updated_at = CURRENT_TIMESTAMP WHERE key = ?',
-            ('1' if enabled else '0', 'autoreply_enabled')
-        )
-        await db.commit()
+    await db_settings.set_bool('autoreply_enabled', enabled)
 
 async def is_exempted(user_id: int) -> bool:
-    async with db_manager.get_connection() as db:
-        async with db.execute('''
-            SELECT is_permanent, expires_at 
-            FROM exemptions 
-            WHERE user_id = ?
-        ''', (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return False
-            
-            is_permanent = bool(row[0])
-            expires_at = row[1]
-            
-            if is_permanent:
-                return True
-            
-            if expires_at:
-                try:
-                    expires_datetime = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                    if expires_datetime.tzinfo is None:
-                        expires_datetime = expires_datetime.replace(tzinfo=timezone.utc)
-                    now = datetime.now(timezone.utc)
-                    return expires_datetime > now
-                except Exception as e:
-                    print(f"解析豁免过期时间失败: {e}")
-                    return False
-            
-            return False
+    state = await user_cache.get(user_id)
+    return state.is_exempted
 
 async def add_exemption(user_id: int, is_permanent: bool, exempted_by: int, reason: str = None, expires_at: str = None):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute('''
             INSERT OR REPLACE INTO exemptions 
             (user_id, is_permanent, expires_at, exempted_by, reason, created_at)
             VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
         ''', (user_id, 1 if is_permanent else 0, expires_at, exempted_by, reason))
         await db.commit()
+    user_cache.invalidate(user_id)
+    row_counts.invalidate('exemptions')
 
 async def remove_exemption(user_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.writer() as db:
         await db.execute('DELETE FROM exemptions WHERE user_id = ?', (user_id,))
         await db.commit()
+    user_cache.update(user_id, exempt_until=0.0)
+    row_counts.invalidate('exemptions')
 
 async def get_exemption(user_id: int):
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute('''
             SELECT user_id, is_permanent, expires_at, exempted_by, reason, created_at
             FROM exemptions
@@ -392,7 +453,7 @@ async def get_exemption(user_id: int):
             return None
 
 async def get_all_exemptions():
-    async with db_manager.get_connection() as db:
+    async with db_manager.reader() as db:
         async with db.execute('''
             SELECT e.user_id, u.first_name, u.username, e.is_permanent, e.expires_at, 
                    e.exempted_by, e.reason, e.created_at
@@ -406,24 +467,41 @@ async def get_all_exemptions():
             cols = [description[0] for description in cursor.description]
             return [dict(zip(cols, row)) for row in rows]
 
-async def get_exemptions_paginated(limit: int = 5, offset: int = 0):
-    async with db_manager.get_connection() as db:
+async def get_exemptions_paginated(limit: int = 5, cursor: str = None, backward: bool = False):
+    return await fetch_keyset_page('''
+        SELECT e.user_id, u.first_name, u.username, e.is_permanent, e.expires_at, 
+               e.exempted_by, e.reason, e.created_at
+        FROM exemptions e
+        LEFT JOIN users u ON e.user_id = u.user_id
+    ''', 'e.created_at', 'e.user_id', limit, cursor, backward)
+
+async def get_exemptions_count() -> int:
+    return await row_counts.get('exemptions')
+
+async def get_prefilter_rules():
+    async with db_manager.reader() as db:
         async with db.execute('''
-            SELECT e.user_id, u.first_name, u.username, e.is_permanent, e.expires_at, 
-                   e.exempted_by, e.reason, e.created_at
-            FROM exemptions e
-            LEFT JOIN users u ON e.user_id = u.user_id
-            ORDER BY e.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset)) as cursor:
+            SELECT id, rule_type, pattern, action, created_by, created_at
+            FROM prefilter_rules
+            ORDER BY id
+        ''') as cursor:
             rows = await cursor.fetchall()
             if not rows:
                 return []
             cols = [description[0] for description in cursor.description]
             return [dict(zip(cols, row)) for row in rows]
 
-async def get_exemptions_count() -> int:
-    async with db_manager.get_connection() as db:
-        async with db.execute('SELECT COUNT(*) FROM exemptions') as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+async def add_prefilter_rule(rule_type: str, pattern: str, action: str, created_by: int) -> bool:
+    async with db_manager.writer() as db:
+        cursor = await db.execute('''
+            INSERT OR IGNORE INTO prefilter_rules (rule_type, pattern, action, created_by)
+            VALUES (?, ?, ?, ?)
+        ''', (rule_type, pattern, action, created_by))
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def delete_prefilter_rule(rule_id: int) -> bool:
+    async with db_manager.writer() as db:
+        cursor = await db.execute('DELETE FROM prefilter_rules WHERE id = ?', (rule_id,))
+        await db.commit()
+        return cursor.rowcount > 0
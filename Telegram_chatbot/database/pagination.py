@@ -0,0 +1,90 @@
+import re
+from .db_manager import db_manager
+
+# 键集分页游标：(排序时间, 主键) 编码为 "YYYYMMDDHHMMSS.id"，放进 callback_data（上限 64 字节）
+# 排序列均为 CURRENT_TIMESTAMP 写入的 "YYYY-MM-DD HH:MM:SS"，编码可逆
+_CURSOR_RE = re.compile(r'^(\d{14})\.(-?\d+)$')
+
+
+def encode_cursor(sort_key, row_id) -> str:
+    digits = re.sub(r'\D', '', str(sort_key or ''))[:14].ljust(14, '0')
+    return f"{digits}.{row_id}"
+
+
+def decode_cursor(token: str):
+    match = _CURSOR_RE.match(token or '')
+    if not match:
+        return None
+    digits, row_id = match.groups()
+    sort_key = f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}:{digits[12:14]}"
+    return sort_key, int(row_id)
+
+
+async def fetch_keyset_page(select_sql: str, sort_column: str, id_column: str, limit: int, cursor: str = None, backward: bool = False):
+    # 按 (sort_column, id_column) 倒序分页：向后翻页取游标之后（更早）的行，backward 时取游标之前（更新）的行
+    # 多取一行判断同方向上是否还有数据；返回 (rows, has_more)，rows 始终按倒序排列
+    decoded = decode_cursor(cursor)
+    where, params = "", []
+    if decoded:
+        where = f"WHERE ({sort_column}, {id_column}) {'>' if backward else '<'} (?, ?)"
+        params.extend(decoded)
+    order = "ASC" if backward else "DESC"
+    params.append(limit + 1)
+
+    async with db_manager.reader() as db:
+        async with db.execute(f'''
+            {select_sql}
+            {where}
+            ORDER BY {sort_column} {order}, {id_column} {order}
+            LIMIT ?
+        ''', params) as cursor_:
+            rows = await cursor_.fetchall()
+            cols = [description[0] for description in cursor_.description]
+
+    has_more = len(rows) > limit
+    results = [dict(zip(cols, row)) for row in rows[:limit]]
+    if backward:
+        results.reverse()
+    return results, has_more
+
+
+async def load_page(fetch, per_page: int, page: int = 1, cursor: str = None, backward: bool = False):
+    # fetch 为 models 中的分页查询；返回 (rows, page, has_prev, has_next)
+    if not decode_cursor(cursor):
+        page, cursor, backward = 1, None, False
+    rows, has_more = await fetch(limit=per_page, cursor=cursor, backward=backward)
+    if (backward and not has_more) or (cursor and not rows):
+        # 已回到最前面，或游标之后的行都已删除：不带游标重新取第一页
+        page, cursor, backward = 1, None, False
+        rows, has_more = await fetch(limit=per_page)
+    if backward:
+        return rows, max(page, 2), True, True
+    return rows, page, cursor is not None, has_more
+
+
+def page_callback(prefix: str, page: int, row: dict, sort_field: str, id_field: str, backward: bool = False) -> str:
+    # 形如 "{prefix}{页码}_{n|p}{游标}"，页码仅用于显示
+    return f"{prefix}{page}_{'p' if backward else 'n'}{encode_cursor(row[sort_field], row[id_field])}"
+
+
+def parse_page_callback(data: str, prefix: str):
+    # 返回 (page, cursor, backward)；页码无效时抛出 ValueError，旧格式按钮没有游标
+    page_text, _, token = data[len(prefix):].partition("_")
+    page = int(page_text)
+    if token[:1] in ("n", "p") and decode_cursor(token[1:]):
+        return page, token[1:], token[0] == "p"
+    return page, None, False
+
+
+def current_page_cursor(reply_markup):
+    # 由当前键盘“上一页”按钮的游标（本页首行）还原本页：从 (首行排序键, 首行 id + 1) 向后取
+    if not reply_markup:
+        return None
+    for row in reply_markup.inline_keyboard:
+        for button in row:
+            data = button.callback_data or ""
+            match = re.search(r'_p(\d{14}\.-?\d+)$', data) if isinstance(data, str) else None
+            if match:
+                sort_key, row_id = decode_cursor(match.group(1))
+                return encode_cursor(sort_key, row_id + 1)
+    return None
@@ -0,0 +1,32 @@
+from .db_manager import db_manager
+
+
+# 列表页总数的内存缓存：首次读取时 COUNT(*)，之后由写入路径增减或失效
+class RowCounts:
+    def __init__(self):
+        self._counts = {}
+        self.queries = 0
+
+    async def get(self, table: str) -> int:
+        count = self._counts.get(table)
+        if count is None:
+            async with db_manager.reader() as db:
+                async with db.execute(f'SELECT COUNT(*) FROM {table}') as cursor:
+                    row = await cursor.fetchone()
+            count = row[0] if row else 0
+            self._counts[table] = count
+            self.queries += 1
+        return count
+
+    def adjust(self, table: str, delta: int):
+        if table in self._counts:
+            self._counts[table] = max(0, self._counts[table] + delta)
+
+    def invalidate(self, table: str):
+        self._counts.pop(table, None)
+
+    def stats(self) -> dict:
+        return {"cached": len(self._counts), "queries": self.queries}
+
+
+row_counts = RowCounts()
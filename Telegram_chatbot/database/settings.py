@@ -0,0 +1,76 @@
+from typing import Callable, Dict, List, Optional
+from .db_manager import db_manager
+
+_values: Dict[str, str] = {}
+_listeners: List[Callable[[str, Optional[str]], None]] = []
+_loaded = False
+
+
+async def load() -> None:
+    global _loaded
+    async with db_manager.reader() as db:
+        async with db.execute('SELECT key, value FROM settings') as cursor:
+            rows = await cursor.fetchall()
+    _values.clear()
+    _values.update({key: value for key, value in rows})
+    _loaded = True
+    _notify(None, None)
+
+
+def is_loaded() -> bool:
+    return _loaded
+
+
+def get(key: str, default: str = None) -> Optional[str]:
+    return _values.get(key, default)
+
+
+def get_bool(key: str, default: bool = False) -> bool:
+    value = _values.get(key)
+    if value is None:
+        return default
+    return value == '1'
+
+
+def get_int(key: str, default: int = 0) -> int:
+    try:
+        return int(_values.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_all() -> Dict[str, str]:
+    return dict(_values)
+
+
+async def set_value(key: str, value: str) -> None:
+    value = str(value)
+    async with db_manager.writer() as db:
+        await db.execute('''
+            INSERT INTO settings (key, value, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        ''', (key, value))
+        await db.commit()
+    if _values.get(key) == value:
+        return
+    _values[key] = value
+    _notify(key, value)
+
+
+async def set_bool(key: str, value: bool) -> None:
+    await set_value(key, '1' if value else '0')
+
+
+def subscribe(callback: Callable[[str, Optional[str]], None]) -> None:
+    # 回调参数为 (key, value)；整体重新加载时 key 为 None
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def _notify(key: Optional[str], value: Optional[str]) -> None:
+    for callback in list(_listeners):
+        try:
+            callback(key, value)
+        except Exception as e:
+            print(f"设置变更回调执行失败: {e}")
@@ -0,0 +1,46 @@
+import logging
+from .db_manager import db_manager
+
+
+# user_id <-> thread_id 双向映射，启动时全量加载，之后由 update_user_thread_id / add_user 维护
+class ThreadIndex:
+    def __init__(self):
+        self._by_user = {}
+        self._by_thread = {}
+        self.loaded = False
+
+    async def load(self):
+        async with db_manager.reader() as db:
+            async with db.execute('SELECT user_id, thread_id FROM users WHERE thread_id IS NOT NULL') as cursor:
+                rows = await cursor.fetchall()
+        self._by_user.clear()
+        self._by_thread.clear()
+        for user_id, thread_id in rows:
+            self.set(user_id, thread_id)
+        self.loaded = True
+        logging.info(f"话题索引已加载 {len(self._by_user)} 个用户话题。")
+
+    def set(self, user_id: int, thread_id):
+        old_thread_id = self._by_user.pop(user_id, None)
+        if old_thread_id is not None and self._by_thread.get(old_thread_id) == user_id:
+            del self._by_thread[old_thread_id]
+        if thread_id is None:
+            return
+        # 同一话题只能属于一个用户
+        old_user_id = self._by_thread.get(thread_id)
+        if old_user_id is not None and old_user_id != user_id:
+            self._by_user.pop(old_user_id, None)
+        self._by_user[user_id] = thread_id
+        self._by_thread[thread_id] = user_id
+
+    def thread_for(self, user_id: int):
+        return self._by_user.get(user_id)
+
+    def user_for(self, thread_id: int):
+        return self._by_thread.get(thread_id)
+
+    def __len__(self):
+        return len(self._by_user)
+
+
+thread_index = ThreadIndex()
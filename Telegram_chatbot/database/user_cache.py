@@ -0,0 +1,151 @@
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config import config
+from .db_manager import db_manager
+
+
+def profile_hash(username, first_name, last_name, language_code) -> int:
+    return hash((username, first_name, last_name, language_code))
+
+
+def parse_expires_at(expires_at) -> float:
+    if not expires_at:
+        return 0.0
+    try:
+        expires_datetime = datetime.fromisoformat(str(expires_at).replace('Z', '+00:00'))
+        if expires_datetime.tzinfo is None:
+            expires_datetime = expires_datetime.replace(tzinfo=timezone.utc)
+        return expires_datetime.timestamp()
+    except Exception as e:
+        print(f"解析豁免过期时间失败: {e}")
+        return 0.0
+
+
+class UserState:
+    __slots__ = (
+        "exists",
+        "is_verified",
+        "thread_id",
+        "is_blacklisted",
+        "is_permanent",
+        "exempt_until",
+        "profile_hash",
+        "touched_at",
+        "loaded_at",
+    )
+
+    def __init__(self, exists=False, is_verified=False, thread_id=None, is_blacklisted=False,
+                 is_permanent=False, exempt_until=0.0, profile_hash=None):
+        self.exists = exists
+        self.is_verified = is_verified
+        self.thread_id = thread_id
+        self.is_blacklisted = is_blacklisted
+        self.is_permanent = is_permanent
+        self.exempt_until = exempt_until
+        self.profile_hash = profile_hash
+        self.touched_at = 0.0
+        self.loaded_at = time.monotonic()
+
+    @property
+    def is_exempted(self) -> bool:
+        return self.exempt_until > time.time()
+
+
+class UserStateCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: int) -> UserState:
+        state = self._entries.get(user_id)
+        if state is not None and time.monotonic() - state.loaded_at < self.ttl:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return state
+
+        self.misses += 1
+        version = self._version
+        state = await self._load(user_id)
+        # 加载期间若有写入使缓存失效，则本次结果可能已过时，不写回缓存
+        if version == self._version:
+            self._entries[user_id] = state
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return state
+
+    async def _load(self, user_id: int) -> UserState:
+        async with db_manager.reader() as db:
+            async with db.execute('''
+                SELECT
+                    u.user_id,
+                    u.is_verified,
+                    u.thread_id,
+                    u.username,
+                    u.first_name,
+                    u.last_name,
+                    u.language_code,
+                    b.user_id,
+                    b.permanent,
+                    e.is_permanent,
+                    e.expires_at
+                FROM (SELECT ? AS id) q
+                LEFT JOIN users u ON u.user_id = q.id
+                LEFT JOIN blacklist b ON b.user_id = q.id
+                LEFT JOIN exemptions e ON e.user_id = q.id
+            ''', (user_id,)) as cursor:
+                row = await cursor.fetchone()
+
+        (found_user, is_verified, thread_id, username, first_name, last_name, language_code,
+         blacklisted_user, permanent, exempt_permanent, expires_at) = row
+
+        if exempt_permanent:
+            exempt_until = math.inf
+        elif exempt_permanent is not None:
+            exempt_until = parse_expires_at(expires_at)
+        else:
+            exempt_until = 0.0
+
+        return UserState(
+            exists=found_user is not None,
+            is_verified=bool(is_verified),
+            thread_id=thread_id,
+            is_blacklisted=blacklisted_user is not None,
+            is_permanent=bool(permanent),
+            exempt_until=exempt_until,
+            profile_hash=profile_hash(username, first_name, last_name, language_code) if found_user is not None else None,
+        )
+
+    def update(self, user_id: int, **fields):
+        self._version += 1
+        state = self._entries.get(user_id)
+        if state is None:
+            return
+        for name, value in fields.items():
+            setattr(state, name, value)
+
+    def invalidate(self, user_id: int):
+        self._version += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+user_cache = UserStateCache(config.USER_CACHE_MAX_SIZE, config.USER_CACHE_TTL)
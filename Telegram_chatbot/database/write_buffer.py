@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import aiosqlite
+import time
+from itertools import groupby
+from config import config
+from .db_manager import db_manager
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_batch: int, flush_interval_ms: int, max_pending: int, max_retries: int):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.max_pending = max(self.max_batch, max_pending)
+        self.max_retries = max(1, max_retries)
+        self._pending = []
+        self._keyed = {}
+        self._has_items = None
+        self._batch_full = None
+        self._flush_lock = None
+        self._task = None
+        self._closed = False
+
+        self.enqueued_rows = 0
+        self.coalesced_rows = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self._failure_streak = 0
+        self._overflowing = False
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending) + len(self._keyed)
+
+    def enqueue(self, sql: str, params: tuple, key=None, on_drop=None):
+        # 积压达到上限时丢弃新记录（覆盖已有键的记录不增加积压），避免数据库长时间不可用时内存无限增长
+        if self.queue_depth >= self.max_pending and (key is None or key not in self._keyed):
+            self._drop(on_drop)
+            if not self._overflowing:
+                self._overflowing = True
+                logging.error(f"写入队列积压已达上限 {self.max_pending} 条，新记录将被丢弃。")
+            return
+
+        # 每条记录附带已失败次数；on_drop 在记录最终未写入时调用，供调用方修正据此维护的缓存
+        if key is None:
+            self._pending.append((sql, params, 0, on_drop))
+        else:
+            if key in self._keyed:
+                self.coalesced_rows += 1
+            self._keyed[key] = (sql, params, 0, on_drop)
+        self.enqueued_rows += 1
+
+        if self._closed:
+            return
+        self._ensure_task()
+        self._has_items.set()
+        if self.queue_depth >= self.max_batch:
+            self._batch_full.set()
+
+    def _drop(self, on_drop):
+        self.dropped_rows += 1
+        if on_drop is not None:
+            try:
+                on_drop()
+            except Exception as e:
+                logging.error(f"写入队列丢弃回调出错: {e}")
+
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flush_lock = self._flush_lock or asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._closed:
+            await self._has_items.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            # 连续失败时指数退避，给数据库恢复的时间
+            if self._failure_streak:
+                await asyncio.sleep(min(self.flush_interval * 2 ** self._failure_streak, 30))
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.queue_depth:
+                return
+
+            pending, keyed = self._pending, self._keyed
+            self._pending, self._keyed = [], {}
+            if self._has_items is not None:
+                self._has_items.clear()
+                self._batch_full.clear()
+
+            batch = [(None, item) for item in pending] + list(keyed.items())
+            started = time.perf_counter()
+            try:
+                async with db_manager.writer() as db:
+                    for sql, rows in groupby(batch, key=lambda entry: entry[1][0]):
+                        await db.executemany(sql, [item[1] for _, item in rows])
+                    await db.commit()
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failure_streak += 1
+                logging.error(f"写入队列刷盘失败（{len(batch)} 条记录），改为逐条写入以隔离出错记录: {e}")
+                failed = await self._write_rows(batch) if len(batch) > 1 else [(batch[0], e)]
+                self.flushed_rows += len(batch) - len(failed)
+                self._requeue(failed)
+                return
+
+            self._failure_streak = 0
+            self._overflowing = False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flush_count += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    async def _write_rows(self, batch) -> list:
+        # 逐条提交，返回 [(entry, error)]；数据库本身出错时其余记录不再逐条尝试
+        failed = []
+        try:
+            async with db_manager.writer() as db:
+                for index, entry in enumerate(batch):
+                    sql, params = entry[1][:2]
+                    try:
+                        await db.execute(sql, params)
+                        await db.commit()
+                    except aiosqlite.OperationalError as e:
+                        await db.rollback()
+                        failed.extend((item, e) for item in batch[index:])
+                        break
+                    except Exception as e:
+                        await db.rollback()
+                        failed.append((entry, e))
+        except Exception as e:
+            done = {id(item) for item, _ in failed}
+            failed.extend((entry, e) for entry in batch if id(entry) not in done)
+        return failed
+
+    def _requeue(self, failed):
+        retry = []
+        for (key, (sql, params, attempts, on_drop)), error in failed:
+            attempts += 1
+            if attempts >= self.max_retries:
+                self._drop(on_drop)
+                logging.error(f"写入队列记录连续 {attempts} 次写入失败，已丢弃: {sql.split()[:4]} {params!r}: {error}")
+            elif key is None:
+                retry.append((sql, params, attempts, on_drop))
+            else:
+                self._keyed.setdefault(key, (sql, params, attempts, on_drop))
+        self._pending[:0] = retry
+        if self.queue_depth and self._has_items is not None:
+            self._has_items.set()
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._has_items.set()
+            self._batch_full.set()
+            try:
+                await self._task
+            except Exception as e:
+                logging.error(f"写入队列后台任务异常退出: {e}")
+        await self.flush()
+        if self.queue_depth:
+            logging.error(f"写入队列关闭时仍有 {self.queue_depth} 条记录未能写入。")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "enqueued_rows": self.enqueued_rows,
+            "coalesced_rows": self.coalesced_rows,
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "dropped_rows": self.dropped_rows,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self._total_flush_ms / self.flush_count if self.flush_count else 0.0,
+        }
+
+
+write_buffer = WriteBehindBuffer(
+    config.WRITE_BUFFER_MAX_BATCH,
+    config.WRITE_BUFFER_FLUSH_MS,
+    config.WRITE_BUFFER_MAX_PENDING,
+    config.WRITE_BUFFER_MAX_RETRIES,
+)
@@ -1,8 +1,8 @@
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from .command_handler import start, help_command, block, unblock, blacklist, stats, getid, autoreply, panel, exempt
+from .command_handler import start, help_command, block, unblock, blacklist, stats, getid, autoreply, panel, exempt, prefilter_command
 from .user_handler import handle_message
 from .callback_handler import handle_callback
-from .admin_handler import handle_admin_reply, view_filtered
+from .admin_handler import handle_admin_reply, view_filtered, handle_topic_status, search
 from config import config
 from network_test.commands import (
     ping_command, nexttrace_command, add_user_command, rm_user_command,
@@ -31,6 +31,14 @@ def register_handlers(app: Application):
         app.add_handler(CommandHandler("view_filtered", view_filtered))
         app.add_handler(CommandHandler("autoreply", autoreply))
         app.add_handler(CommandHandler("exempt", exempt))
+        app.add_handler(CommandHandler("prefilter", prefilter_command))
+        app.add_handler(CommandHandler("search", search))
+        
+        app.add_handler(MessageHandler(
+            filters.Chat(chat_id=config.FORUM_GROUP_ID) &
+            (filters.StatusUpdate.FORUM_TOPIC_CLOSED | filters.StatusUpdate.FORUM_TOPIC_REOPENED),
+            handle_topic_status
+        ))
         
         app.add_handler(MessageHandler(
             filters.Chat(chat_id=config.FORUM_GROUP_ID) & filters.REPLY & ~filters.COMMAND,
@@ -1,10 +1,47 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 from database import models as db
-from utils.message_sender import send_message_by_type
+from database.pagination import load_page, page_callback
+from utils.message_sender import send_message_by_type, get_media_info, build_input_media, send_media_group_by_messages
+from services.media_group import media_group_buffer
+from services.topic_health import topic_health
+from services.send_scheduler import PRIORITY_ADMIN_REPLY, SendRejected
+
+async def _log_outgoing_message(message, user_id: int):
+    media_type, media_file_id = get_media_info(message)
+    await db.save_message(
+        user_id=user_id,
+        message_id=message.message_id,
+        content=message.text or message.caption,
+        direction='outgoing',
+        media_type=media_type,
+        media_file_id=media_file_id,
+        thread_id=message.message_thread_id
+    )
 
 async def _send_reply_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    await send_message_by_type(context.bot, update.message, user_id, None, True)
+    message = update.message
+    try:
+        sent_message = await send_message_by_type(context.bot, message, user_id, None, True, rate_limit_args=PRIORITY_ADMIN_REPLY)
+    except SendRejected as e:
+        print(f"向用户 {user_id} 发送回复被发送调度器放弃: {e}")
+        return
+    if not sent_message:
+        return
+
+    await _log_outgoing_message(message, user_id)
+
+async def _send_media_group_to_user(items):
+    update, context, user_id = items[0]
+    messages = [item[0].message for item in items]
+    try:
+        await send_media_group_by_messages(context.bot, messages, user_id, rate_limit_args=PRIORITY_ADMIN_REPLY)
+    except TelegramError as e:
+        print(f"向用户 {user_id} 发送相册失败: {e}")
+        return
+    for message in messages:
+        await _log_outgoing_message(message, user_id)
 
 async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.is_topic_message:
@@ -12,14 +49,24 @@ async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     thread_id = update.message.message_thread_id
     
-    user = await db.get_user_by_thread_id(thread_id)
-    if not user:
+    user_id = await db.get_user_id_by_thread_id(thread_id)
+    if user_id is None:
         return
     
-    user_id = user['user_id']
-    
+    # 管理员发送的相册同样合并为一次 sendMediaGroup
+    message = update.message
+    if message.media_group_id and build_input_media(message) is not None:
+        media_group_buffer.add(("admin", thread_id), message.media_group_id, (update, context, user_id), _send_media_group_to_user)
+        return
+    await media_group_buffer.wait_idle(("admin", thread_id))
+
     await _send_reply_to_user(update, context, user_id)
 
+async def handle_topic_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 话题被关闭或重新打开后，下次转发前重新探测
+    if update.message and update.message.message_thread_id:
+        topic_health.invalidate(update.message.message_thread_id)
+
 async def _format_filtered_messages(messages, page: int, total_pages: int):
     response = f"被过滤的消息 (第 {page}/{total_pages} 页):\n\n"
     
@@ -43,54 +90,132 @@ async def _format_filtered_messages(messages, page: int, total_pages: int):
     
     return response
 
-async def _get_filtered_messages_keyboard(page: int, total_pages: int, callback_prefix: str = "filtered_page_"):
-    keyboard = []
-    
-    if total_pages <= 1:
-        return None
-    
+def _get_filtered_messages_keyboard(messages, page: int, has_prev: bool, has_next: bool, callback_prefix: str = "filtered_page_"):
     buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("上一页", callback_data=page_callback(callback_prefix, page - 1, messages[0], 'filtered_at', 'id', backward=True)))
+    if has_next:
+        buttons.append(InlineKeyboardButton("下一页", callback_data=page_callback(callback_prefix, page + 1, messages[-1], 'filtered_at', 'id')))
     
-    if page > 1:
-        buttons.append(InlineKeyboardButton("上一页", callback_data=f"{callback_prefix}{page - 1}"))
-    
-    if page < total_pages:
-        buttons.append(InlineKeyboardButton("下一页", callback_data=f"{callback_prefix}{page + 1}"))
-    
-    if buttons:
-        keyboard.append(buttons)
-    
-    return InlineKeyboardMarkup(keyboard) if keyboard else None
-
-async def view_filtered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not await db.is_admin(update.effective_user.id):
-        await update.message.reply_text("您没有权限执行此操作。")
-        return
+    return InlineKeyboardMarkup([buttons]) if buttons else None
 
-    MESSAGES_PER_PAGE = 5
-    page = 1
+FILTERED_MESSAGES_PER_PAGE = 5
 
+async def build_filtered_view(page: int = 1, cursor: str = None, backward: bool = False, callback_prefix: str = "filtered_page_"):
+    # 返回 (response, keyboard)；没有被过滤消息时 response 为 None
     total_count = await db.get_filtered_messages_count()
-    
     if total_count == 0:
-        await update.message.reply_text("没有找到被过滤的消息。")
-        return
-    
-    total_pages = (total_count + MESSAGES_PER_PAGE - 1) // MESSAGES_PER_PAGE
+        return None, None
 
-    offset = (page - 1) * MESSAGES_PER_PAGE
-
-    messages = await db.get_filtered_messages(MESSAGES_PER_PAGE, offset)
-    
+    messages, page, has_prev, has_next = await load_page(db.get_filtered_messages, FILTERED_MESSAGES_PER_PAGE, page, cursor, backward)
     if not messages:
-        await update.message.reply_text("没有找到被过滤的消息。")
-        return
+        return None, None
 
+    total_pages = max((total_count + FILTERED_MESSAGES_PER_PAGE - 1) // FILTERED_MESSAGES_PER_PAGE, page)
     response = await _format_filtered_messages(messages, page, total_pages)
+    return response, _get_filtered_messages_keyboard(messages, page, has_prev, has_next, callback_prefix)
 
-    keyboard = await _get_filtered_messages_keyboard(page, total_pages)
+async def view_filtered(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await db.is_admin(update.effective_user.id):
+        await update.message.reply_text("您没有权限执行此操作。")
+        return
+
+    response, keyboard = await build_filtered_view()
+    if response is None:
+        await update.message.reply_text("没有找到被过滤的消息。")
+        return
 
     if keyboard:
         await update.message.reply_text(response, reply_markup=keyboard)
     else:
         await update.message.reply_text(response)
+
+SEARCH_RESULTS_PER_PAGE = 5
+SEARCH_STATE_KEY = "message_search"
+SEARCH_SCOPE_LABELS = {"messages": "消息记录", "filtered": "被过滤消息"}
+SEARCH_USAGE = (
+    "用法:\n"
+    "/search <关键词> - 搜索消息记录\n"
+    "/search -f <关键词> - 搜索被过滤消息（内容与拦截原因）\n\n"
+    "多个关键词用空格分隔，需同时命中。少于 3 个字符的关键词（如两个字的中文词）按子串逐条匹配，范围较大时会慢一些。"
+)
+
+def _format_search_results(results, query_text: str, scope: str) -> str:
+    response = f"搜索「{query_text}」· {SEARCH_SCOPE_LABELS[scope]}\n\n"
+    for result in results:
+        first_name = result.get('first_name') or 'N/A'
+        username = result.get('username') or 'N/A'
+        content = result.get('content') or 'N/A'
+        if len(content) > 100:
+            content = content[:100] + "..."
+
+        response += f"【#{result['id']}】\n用户: {first_name} (@{username}) {result['user_id']}\n"
+        if scope == "filtered":
+            response += f"原因: {result.get('reason') or 'N/A'}\n"
+        else:
+            response += f"方向: {'用户 → 管理员' if result.get('direction') == 'incoming' else '管理员 → 用户'}\n"
+        response += f"内容: {content}\n时间: {result.get('created_at') or 'N/A'}\n\n"
+    return response
+
+async def build_search_view(context: ContextTypes.DEFAULT_TYPE, before_id: int = None, after_id: int = None):
+    state = context.user_data.get(SEARCH_STATE_KEY)
+    back_row = [InlineKeyboardButton("返回主面板", callback_data="panel_back")]
+    if not state:
+        return SEARCH_USAGE, InlineKeyboardMarkup([back_row])
+
+    scope, query_text = state["scope"], state["query"]
+    match_query = db.build_search_query(query_text)
+    results, has_more = await db.search_messages(scope, match_query, SEARCH_RESULTS_PER_PAGE, before_id=before_id, after_id=after_id)
+
+    other_scope = "filtered" if scope == "messages" else "messages"
+    keyboard = []
+    if results:
+        text = _format_search_results(results, query_text, scope)
+        # 向更新翻页时 has_more 表示前面还有结果；向更早翻页时表示后面还有结果
+        has_newer = has_more if after_id else bool(before_id)
+        has_older = True if after_id else has_more
+        buttons = []
+        if has_newer:
+            buttons.append(InlineKeyboardButton("上一页", callback_data=f"search_page_p_{results[0]['id']}"))
+        if has_older:
+            buttons.append(InlineKeyboardButton("下一页", callback_data=f"search_page_n_{results[-1]['id']}"))
+        if buttons:
+            keyboard.append(buttons)
+    else:
+        text = f"搜索「{query_text}」· {SEARCH_SCOPE_LABELS[scope]}\n\n没有找到匹配的消息。"
+    keyboard.append([InlineKeyboardButton(f"改为搜索{SEARCH_SCOPE_LABELS[other_scope]}", callback_data=f"search_scope_{other_scope}")])
+    keyboard.append(back_row)
+    return text, InlineKeyboardMarkup(keyboard)
+
+def build_search_panel():
+    message = "消息搜索\n\n" + SEARCH_USAGE
+    if not db.search_available():
+        message += "\n\n当前 SQLite 不支持 FTS5 trigram 分词，搜索功能不可用。"
+    keyboard = [
+        [InlineKeyboardButton("优化索引", callback_data="search_index_optimize"), InlineKeyboardButton("重建索引", callback_data="search_index_rebuild")],
+        [InlineKeyboardButton("返回主面板", callback_data="panel_back")],
+    ]
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await db.is_admin(update.effective_user.id):
+        await update.message.reply_text("您没有权限执行此操作。")
+        return
+    if not db.search_available():
+        await update.message.reply_text("当前 SQLite 不支持 FTS5 trigram 分词，搜索功能不可用。")
+        return
+
+    args = list(context.args or [])
+    scope = "messages"
+    if args and args[0] == "-f":
+        scope = "filtered"
+        args = args[1:]
+    query_text = " ".join(args).strip()
+    if not db.build_search_query(query_text):
+        await update.message.reply_text(SEARCH_USAGE)
+        return
+
+    context.user_data[SEARCH_STATE_KEY] = {"scope": scope, "query": query_text}
+    text, keyboard = await build_search_view(context)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
@@ -4,11 +4,14 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from services.verification import verify_answer, create_verification
-from services.gemini_service import gemini_service
 from database import models as db
-from utils.media_converter import sticker_to_image
+from database import settings as db_settings
+from database.pagination import parse_page_callback, current_page_cursor
 from services.thread_manager import get_or_create_thread, build_user_info_card_keyboard
-from .user_handler import _resend_message
+from services.runtime_metrics import build_runtime_metrics_text
+from services.prefilter import build_prefilter_panel
+from services.topic_health import topic_health
+from .user_handler import _forward_user_message, _screen_message
 from config import config
 from rss import data_manager as rss_data_manager, settings as rss_settings
 from rss import enable_feature as rss_enable_feature, disable_feature as rss_disable_feature
@@ -305,49 +308,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if 'pending_update' in context.user_data:
                 pending_update = context.user_data.pop('pending_update')
                 message = pending_update.message
-                image_bytes = None
-
-                if message.photo:
-                    photo_file = await message.photo[-1].get_file()
-                    image_bytes = await photo_file.download_as_bytearray()
-                elif message.sticker and not message.sticker.is_animated and not message.sticker.is_video:
-                    sticker_file = await message.sticker.get_file()
-                    sticker_bytes = await sticker_file.download_as_bytearray()
-                    image_bytes = await sticker_to_image(sticker_bytes)
 
                 should_forward = True
                 if message.video or message.animation:
                     pass
                 else:
-                    analyzing_message = await context.bot.send_message(
-                        chat_id=message.chat_id,
-                        text="正在通过AI分析内容是否包含垃圾信息...",
-                        reply_to_message_id=message.message_id
-                    )
-                    analysis_result = await gemini_service.analyze_message(message, image_bytes)
-                    if analysis_result.get("is_spam"):
-                        should_forward = False
-                        media_type = None
-                        media_file_id = None
-                        if message.photo:
-                            media_type = "photo"
-                            media_file_id = message.photo[-1].file_id
-                        elif message.sticker:
-                            media_type = "sticker"
-                            media_file_id = message.sticker.file_id
-
-                        await db.save_filtered_message(
-                            user_id=user_id,
-                            message_id=message.message_id,
-                            content=message.text or message.caption,
-                            reason=analysis_result.get("reason"),
-                            media_type=media_type,
-                            media_file_id=media_file_id,
-                        )
-                        reason = analysis_result.get("reason", "未提供原因")
-                        await analyzing_message.edit_text(f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}")
-                    else:
-                        await analyzing_message.delete()
+                    should_forward = await _screen_message(context, message, user_id)
 
                 if should_forward:
                     thread_id, is_new = await get_or_create_thread(pending_update, context)
@@ -357,9 +323,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     
                     try:
                         if not is_new:
-                            await _resend_message(pending_update, context, thread_id)
+                            await _forward_user_message(pending_update, context, thread_id)
                     except BadRequest as e:
                         if "Message thread not found" in e.message:
+                            topic_health.invalidate(thread_id)
                             await db.update_user_thread_id(user_id, None)
                             await db.update_user_verification(user_id, False)
                             
@@ -406,6 +373,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("被过滤消息", callback_data="panel_filtered_page_1"), InlineKeyboardButton("自动回复管理", callback_data="panel_autoreply")],
             [InlineKeyboardButton("豁免名单管理", callback_data="panel_exemptions_page_1"), InlineKeyboardButton("网络测试管理", callback_data="panel_network_test")],
             [InlineKeyboardButton("RSS 功能管理", callback_data="panel_rss")],
+            [InlineKeyboardButton("本地过滤规则", callback_data="panel_prefilter"), InlineKeyboardButton("消息搜索", callback_data="panel_search")],
         ]
         
         await query.edit_message_text(
@@ -422,12 +390,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[3])
+            page, cursor, backward = parse_page_callback(data, "panel_blacklist_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await blacklist.get_blacklist_keyboard(page=page)
+        message, keyboard = await blacklist.get_blacklist_keyboard(page=page, cursor=cursor, backward=backward)
         
         if keyboard:
             keyboard_buttons = list(keyboard.inline_keyboard)
@@ -477,13 +445,15 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[5])
+            page, cursor, backward = parse_page_callback(data, "panel_stats_all_users_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
         message, keyboard = await get_all_users_keyboard(
             page=page,
+            cursor=cursor,
+            backward=backward,
             callback_prefix="panel_stats_all_users_page_",
             back_callback="panel_back",
             back_text="返回主面板"
@@ -511,12 +481,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[4])
+            page, cursor, backward = parse_page_callback(data, "panel_stats_blacklist_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await get_blacklist_keyboard_detailed(page=page)
+        message, keyboard = await get_blacklist_keyboard_detailed(page=page, cursor=cursor, backward=backward)
         
         if keyboard:
             keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
@@ -538,47 +508,25 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(text=message, reply_markup=back_keyboard, parse_mode='Markdown')
     
     elif data.startswith("panel_filtered_page_"):
-        from .admin_handler import _format_filtered_messages, _get_filtered_messages_keyboard
+        from .admin_handler import build_filtered_view
         
         if not await db.is_admin(user_id):
             await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
             return
         
         try:
-            page = int(data.split("_")[3])
+            page, cursor, backward = parse_page_callback(data, "panel_filtered_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        MESSAGES_PER_PAGE = 5
-
-        total_count = await db.get_filtered_messages_count()
+        response, keyboard = await build_filtered_view(page, cursor, backward, callback_prefix="panel_filtered_page_")
         
-        if total_count == 0:
+        if response is None:
             back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("返回主面板", callback_data="panel_back")]])
             await query.edit_message_text("没有找到被过滤的消息。", reply_markup=back_keyboard)
             return
         
-        total_pages = (total_count + MESSAGES_PER_PAGE - 1) // MESSAGES_PER_PAGE
-
-        if page < 1:
-            page = 1
-        elif page > total_pages:
-            page = total_pages
-
-        offset = (page - 1) * MESSAGES_PER_PAGE
-
-        messages = await db.get_filtered_messages(MESSAGES_PER_PAGE, offset)
-        
-        if not messages:
-            back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("返回主面板", callback_data="panel_back")]])
-            await query.edit_message_text("没有找到被过滤的消息。", reply_markup=back_keyboard)
-            return
-
-        response = await _format_filtered_messages(messages, page, total_pages)
-
-        keyboard = await _get_filtered_messages_keyboard(page, total_pages, callback_prefix="panel_filtered_page_")
-        
         if keyboard:
             keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
             keyboard_buttons.append([InlineKeyboardButton("返回主面板", callback_data="panel_back")])
@@ -628,21 +576,84 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message, keyboard = _build_rss_panel_view()
         await query.edit_message_text(message, reply_markup=keyboard)
 
+    elif data == "panel_prefilter":
+        if not await db.is_admin(user_id):
+            await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
+            return
+
+        message, keyboard = build_prefilter_panel()
+        await query.edit_message_text(message, reply_markup=keyboard)
+
+    elif data == "panel_search":
+        from .admin_handler import build_search_panel
+
+        if not await db.is_admin(user_id):
+            await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
+            return
+
+        message, keyboard = build_search_panel()
+        await query.edit_message_text(message, reply_markup=keyboard)
+
+    elif data.startswith("search_"):
+        from .admin_handler import build_search_panel, build_search_view, SEARCH_STATE_KEY
+
+        if not await db.is_admin(user_id):
+            await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
+            return
+
+        if data.startswith("search_index_"):
+            rebuild = data == "search_index_rebuild"
+            if rebuild:
+                await db.rebuild_search_indexes()
+            else:
+                await db.optimize_search_indexes()
+            message, keyboard = build_search_panel()
+            await query.edit_message_text(f"{'索引已重建' if rebuild else '索引已优化'}。\n\n{message}", reply_markup=keyboard)
+            return
+
+        state = context.user_data.get(SEARCH_STATE_KEY)
+        if data.startswith("search_scope_") and state:
+            scope = data[len("search_scope_"):]
+            if scope in ("messages", "filtered"):
+                state["scope"] = scope
+            message, keyboard = await build_search_view(context)
+        elif data.startswith("search_page_"):
+            try:
+                _, _, direction, cursor_id = data.split("_")
+                cursor_id = int(cursor_id)
+            except ValueError:
+                await query.answer("无效的页码。", show_alert=True)
+                return
+            if direction == "p":
+                message, keyboard = await build_search_view(context, after_id=cursor_id)
+            else:
+                message, keyboard = await build_search_view(context, before_id=cursor_id)
+        else:
+            message, keyboard = await build_search_view(context)
+        await query.edit_message_text(message, reply_markup=keyboard)
+
+    elif data.startswith("prefilter_toggle_"):
+        if not await db.is_admin(user_id):
+            await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
+            return
+
+        setting_key = {
+            "enabled": "prefilter_enabled",
+            "heuristics": "prefilter_heuristics_enabled",
+        }.get(data.split("_")[2])
+        if not setting_key:
+            return
+        await db_settings.set_bool(setting_key, not db_settings.get_bool(setting_key, True))
+
+        message, keyboard = build_prefilter_panel()
+        await query.edit_message_text(message, reply_markup=keyboard)
+
     elif data == "panel_ai_settings":
         if not await db.is_admin(user_id):
             await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
             return
             
-        async with db.db_manager.get_connection() as conn:
-             cursor = await conn.execute("""
-                SELECT key, value FROM settings 
-                WHERE key IN (
-                    'ai_provider', 
-                    'gemini_model_filter', 'gemini_model_verification', 'gemini_model_autoreply',
-                    'openai_model_filter', 'openai_model_verification', 'openai_model_autoreply'
-                )
-             """)
-             settings = {row[0]: row[1] for row in await cursor.fetchall()}
+        settings = db_settings.get_all()
              
         current_provider = settings.get('ai_provider', 'gemini')
         
@@ -680,22 +691,11 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await db.is_admin(user_id): return
         
         new_provider = data.split("_")[3]
-        async with db.db_manager.get_connection() as conn:
-            await conn.execute("UPDATE settings SET value = ? WHERE key = 'ai_provider'", (new_provider,))
-            await conn.commit()
+        await db_settings.set_value('ai_provider', new_provider)
             
         await query.answer(f"已切换 AI 提供商为 {new_provider.upper()}")
         
-        async with db.db_manager.get_connection() as conn:
-             cursor = await conn.execute("""
-                SELECT key, value FROM settings 
-                WHERE key IN (
-                    'ai_provider', 
-                    'gemini_model_filter', 'gemini_model_verification', 'gemini_model_autoreply',
-                    'openai_model_filter', 'openai_model_verification', 'openai_model_autoreply'
-                )
-             """)
-             settings = {row[0]: row[1] for row in await cursor.fetchall()}
+        settings = db_settings.get_all()
              
         current_provider = settings.get('ai_provider', 'gemini')
         provider_name = "Gemini" if current_provider == 'gemini' else "OpenAI"
@@ -794,9 +794,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         model_name = payload["model_name"]
         setting_key = f"{provider_type}_model_{feature_type}"
 
-        async with db.db_manager.get_connection() as conn:
-            await conn.execute("UPDATE settings SET value = ? WHERE key = ?", (model_name, setting_key))
-            await conn.commit()
+        await db_settings.set_value(setting_key, model_name)
 
         await query.answer(f"已设置 {provider_type.upper()} {feature_type} 模型为 {model_name}")
 
@@ -826,9 +824,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         setting_key = f"{provider_type}_model_{feature_type}"
         
-        async with db.db_manager.get_connection() as conn:
-            await conn.execute("UPDATE settings SET value = ? WHERE key = ?", (model_name, setting_key))
-            await conn.commit()
+        await db_settings.set_value(setting_key, model_name)
             
         await query.answer(f"已设置 {provider_type.upper()} {feature_type} 模型为 {model_name}")
         
@@ -1560,8 +1556,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except:
                 pass
         
+        cursor = current_page_cursor(query.message.reply_markup)
+        
         if is_panel:
-            message, keyboard = await blacklist.get_blacklist_keyboard(page=current_page)
+            message, keyboard = await blacklist.get_blacklist_keyboard(page=current_page, cursor=cursor)
             if keyboard:
                 keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
                 keyboard_buttons.append([InlineKeyboardButton("返回主面板", callback_data="panel_back")])
@@ -1574,7 +1572,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='Markdown'
             )
         elif is_stats_page:
-            message, keyboard = await blacklist.get_blacklist_keyboard_detailed(page=current_page)
+            message, keyboard = await blacklist.get_blacklist_keyboard_detailed(page=current_page, cursor=cursor)
             if keyboard:
                 keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
                 for i, row in enumerate(keyboard_buttons):
@@ -1591,7 +1589,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='Markdown'
             )
         else:
-            message, keyboard = await blacklist.get_blacklist_keyboard(page=current_page)
+            message, keyboard = await blacklist.get_blacklist_keyboard(page=current_page, cursor=cursor)
             if keyboard:
                 await query.edit_message_text(
                     text=message,
@@ -1609,12 +1607,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[2])
+            page, cursor, backward = parse_page_callback(data, "blacklist_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await blacklist.get_blacklist_keyboard(page=page)
+        message, keyboard = await blacklist.get_blacklist_keyboard(page=page, cursor=cursor, backward=backward)
         if keyboard:
             await query.edit_message_text(
                 text=message,
@@ -1625,45 +1623,24 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(text=message)
     
     elif data.startswith("filtered_page_"):
-        from .admin_handler import _format_filtered_messages, _get_filtered_messages_keyboard
+        from .admin_handler import build_filtered_view
         
         if not await db.is_admin(user_id):
             await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
             return
         
         try:
-            page = int(data.split("_")[2])
+            page, cursor, backward = parse_page_callback(data, "filtered_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        MESSAGES_PER_PAGE = 5
-
-        total_count = await db.get_filtered_messages_count()
-        
-        if total_count == 0:
-            await query.edit_message_text("没有找到被过滤的消息。")
-            return
-        
-        total_pages = (total_count + MESSAGES_PER_PAGE - 1) // MESSAGES_PER_PAGE
-
-        if page < 1:
-            page = 1
-        elif page > total_pages:
-            page = total_pages
-
-        offset = (page - 1) * MESSAGES_PER_PAGE
-
-        messages = await db.get_filtered_messages(MESSAGES_PER_PAGE, offset)
+        response, keyboard = await build_filtered_view(page, cursor, backward)
         
-        if not messages:
+        if response is None:
             await query.edit_message_text("没有找到被过滤的消息。")
             return
 
-        response = await _format_filtered_messages(messages, page, total_pages)
-
-        keyboard = await _get_filtered_messages_keyboard(page, total_pages)
-
         if keyboard:
             await query.edit_message_text(response, reply_markup=keyboard)
         else:
@@ -1677,12 +1654,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[3])
+            page, cursor, backward = parse_page_callback(data, "panel_exemptions_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await blacklist.get_exemptions_keyboard(page=page)
+        message, keyboard = await blacklist.get_exemptions_keyboard(page=page, cursor=cursor, backward=backward)
         
         if keyboard:
             keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
@@ -1726,7 +1703,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except:
                 pass
         
-        message, keyboard = await blacklist.get_exemptions_keyboard(page=current_page)
+        cursor = current_page_cursor(query.message.reply_markup)
+        message, keyboard = await blacklist.get_exemptions_keyboard(page=current_page, cursor=cursor)
         
         if keyboard:
             keyboard_buttons = [list(row) for row in keyboard.inline_keyboard]
@@ -1752,12 +1730,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[5])
+            page, cursor, backward = parse_page_callback(data, "stats_list_all_users_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await get_all_users_keyboard(page=page)
+        message, keyboard = await get_all_users_keyboard(page=page, cursor=cursor, backward=backward)
         if keyboard:
             await query.edit_message_text(
                 text=message,
@@ -1775,12 +1753,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            page = int(data.split("_")[4])
+            page, cursor, backward = parse_page_callback(data, "stats_list_blacklist_page_")
         except (ValueError, IndexError):
             await query.answer("无效的页码。", show_alert=True)
             return
         
-        message, keyboard = await get_blacklist_keyboard_detailed(page=page)
+        message, keyboard = await get_blacklist_keyboard_detailed(page=page, cursor=cursor, backward=backward)
         if keyboard:
             await query.edit_message_text(
                 text=message,
@@ -1805,6 +1783,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"---------------------\n"
             f"总用户数: {total_users}\n"
             f"黑名单用户数: {blocked_users}\n\n"
+            f"{build_runtime_metrics_text()}\n\n"
             f"请选择要查看的列表："
         )
         
@@ -1815,8 +1794,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await query.edit_message_text(
             text=stats_message,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+            reply_markup=InlineKeyboardMarkup(keyboard)
         )
     
     elif data.startswith("autoreply_"):
@@ -1,8 +1,11 @@
+import re
 from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from database import models as db
 from services.blacklist import block_user, unblock_user, get_blacklist_keyboard
+from services.runtime_metrics import build_runtime_metrics_text
+from services.prefilter import prefilter, build_prefilter_panel, RULE_TYPES, RULE_ACTIONS
 from utils.decorators import admin_only
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -39,6 +42,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "- `/stats` - 查看统计信息\n"
         "- `/view_filtered` - 查看被拦截信息及发送者\n"
         "- `/exempt` - 豁免用户内容审查（临时或永久）\n"
+        "- `/prefilter` - 管理本地过滤规则\n"
+        "- `/search` - 全文搜索消息记录与被过滤消息\n"
     )
     
     await update.message.reply_text(help_text, parse_mode='Markdown')
@@ -57,10 +62,9 @@ async def block(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if message.is_topic_message and message.reply_to_message:
         thread_id = message.message_thread_id
-        user_to_block = await db.get_user_by_thread_id(thread_id)
+        user_id_to_block = await db.get_user_id_by_thread_id(thread_id)
         
-        if user_to_block:
-            user_id_to_block = user_to_block['user_id']
+        if user_id_to_block is not None:
             reason = " ".join(context.args) if context.args else "无"
             
             response = await block_user(user_id_to_block, reason, update.effective_user.id, permanent=True)
@@ -104,6 +108,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"---------------------\n"
         f"总用户数: {total_users}\n"
         f"黑名单用户数: {blocked_users}\n\n"
+        f"{build_runtime_metrics_text()}\n\n"
         f"请选择要查看的列表："
     )
     
@@ -114,8 +119,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(
         stats_message, 
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
+        reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
 async def getid(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -155,6 +159,7 @@ async def panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("被过滤消息", callback_data="panel_filtered_page_1"), InlineKeyboardButton("自动回复管理", callback_data="panel_autoreply")],
         [InlineKeyboardButton("豁免名单管理", callback_data="panel_exemptions_page_1"), InlineKeyboardButton("网络测试管理", callback_data="panel_network_test")],
         [InlineKeyboardButton("RSS 功能管理", callback_data="panel_rss"), InlineKeyboardButton("AI 模型设置", callback_data="panel_ai_settings")],
+        [InlineKeyboardButton("本地过滤规则", callback_data="panel_prefilter"), InlineKeyboardButton("消息搜索", callback_data="panel_search")],
     ]
     
     await update.message.reply_text(
@@ -170,14 +175,12 @@ async def exempt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if message.is_topic_message:
         thread_id = message.message_thread_id
-        user_to_exempt = await db.get_user_by_thread_id(thread_id)
+        user_id_to_exempt = await db.get_user_id_by_thread_id(thread_id)
         
-        if not user_to_exempt:
+        if user_id_to_exempt is None:
             await update.message.reply_text("无法找到该话题对应的用户。")
             return
         
-        user_id_to_exempt = user_to_exempt['user_id']
-        
         if not context.args:
             exemption_info = await db.get_exemption(user_id_to_exempt)
             if exemption_info:
@@ -423,3 +426,52 @@ async def autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "/autoreply delete <ID> - 删除知识条目\n"
             "/autoreply list - 列出所有知识条目"
         )
+
+@admin_only
+async def prefilter_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    usage = (
+        "用法:\n"
+        "/prefilter - 查看规则与开关\n"
+        "/prefilter add <keyword|regex|domain> <block|allow> <内容> - 添加规则\n"
+        "/prefilter delete <ID> - 删除规则"
+    )
+    if not context.args:
+        message, keyboard = build_prefilter_panel()
+        await update.message.reply_text(message, reply_markup=keyboard)
+        return
+
+    subcommand = context.args[0].lower()
+    if subcommand == "add":
+        if len(context.args) < 4:
+            await update.message.reply_text(usage)
+            return
+        rule_type = context.args[1].lower()
+        action = context.args[2].lower()
+        pattern = " ".join(context.args[3:]).strip()
+        if rule_type not in RULE_TYPES or action not in RULE_ACTIONS or not pattern:
+            await update.message.reply_text(usage)
+            return
+        if rule_type == "regex":
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                await update.message.reply_text(f"正则表达式无效: {e}")
+                return
+
+        added = await db.add_prefilter_rule(rule_type, pattern, action, update.effective_user.id)
+        await prefilter.load()
+        if added:
+            await update.message.reply_text(f"已添加{RULE_ACTIONS[action]}{RULE_TYPES[rule_type]}规则: {pattern}")
+        else:
+            await update.message.reply_text("该规则已存在。")
+    elif subcommand == "delete":
+        try:
+            rule_id = int(context.args[1])
+        except (IndexError, ValueError):
+            await update.message.reply_text("无效的规则ID")
+            return
+        deleted = await db.delete_prefilter_rule(rule_id)
+        await prefilter.load()
+        await update.message.reply_text(f"已删除规则 #{rule_id}" if deleted else f"规则ID {rule_id} 不存在")
+    else:
+        await update.message.reply_text(usage)
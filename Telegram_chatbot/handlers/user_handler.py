@@ -1,3 +1,5 @@
+import asyncio
+import io
 from telegram import Update, constants
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
@@ -5,12 +7,20 @@ from database import models as db
 from services.verification import create_verification, is_verification_pending, get_pending_verification_message
 from services.thread_manager import get_or_create_thread
 from services.gemini_service import gemini_service
-from utils.media_converter import sticker_to_image
-from utils.message_sender import send_message_by_type
+from services.prefilter import prefilter
+from utils.media_converter import sticker_to_image, download_photo_for_analysis
+from utils.message_sender import send_message_by_type, get_media_info, build_input_media, send_media_group_by_messages
 from services.rate_limiter import rate_limiter
+from services.topic_health import topic_health
+from services.media_group import media_group_buffer
+from services.autoreply_cache import autoreply_cache
+from services.send_scheduler import SendRejected
+from database.knowledge_snapshot import knowledge_snapshot
 from config import config
 
-async def handle_invalid_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+async def handle_invalid_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, thread_id: int = None):
+    if thread_id:
+        topic_health.invalidate(thread_id)
     await db.update_user_thread_id(user_id, None)
     await db.update_user_verification(user_id, False)
     context.user_data['pending_update'] = update
@@ -27,6 +37,221 @@ async def handle_invalid_thread(update: Update, context: ContextTypes.DEFAULT_TY
 async def _resend_message(update: Update, context: ContextTypes.DEFAULT_TYPE, thread_id: int):
     return await send_message_by_type(context.bot, update.message, config.FORUM_GROUP_ID, thread_id, True)
 
+async def _log_incoming_message(message, user_id: int, thread_id: int):
+    media_type, media_file_id = get_media_info(message)
+    await db.save_message(
+        user_id=user_id,
+        message_id=message.message_id,
+        content=message.text or message.caption,
+        direction='incoming',
+        media_type=media_type,
+        media_file_id=media_file_id,
+        thread_id=thread_id
+    )
+
+async def _forward_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, thread_id: int):
+    await _resend_message(update, context, thread_id)
+    await _log_incoming_message(update.message, update.effective_user.id, thread_id)
+
+SEND_BUSY_TEXT = "当前消息较多，您的消息暂未送达管理员，请稍后重新发送。"
+
+async def _send_user_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE, messages, thread_id: int):
+    user_id = update.effective_user.id
+    try:
+        await send_media_group_by_messages(context.bot, messages, config.FORUM_GROUP_ID, thread_id)
+    except SendRejected as e:
+        print(f"转发相册被发送调度器放弃: {e}")
+        await update.message.reply_text(SEND_BUSY_TEXT)
+        return
+    except BadRequest as e:
+        if "thread not found" in e.message.lower() or "topic not found" in e.message.lower():
+            await handle_invalid_thread(update, context, user_id, thread_id)
+            return
+        print(f"发送相册时发生未知错误: {e}")
+        await update.message.reply_text("发送消息时发生未知错误，请稍后再试。")
+        return
+    for message in messages:
+        await _log_incoming_message(message, user_id, thread_id)
+
+async def _download_image_for_analysis(message):
+    if message.photo:
+        return await download_photo_for_analysis(message.photo)
+    if message.sticker and not message.sticker.is_animated and not message.sticker.is_video:
+        sticker_file = await message.sticker.get_file()
+        buffer = io.BytesIO()
+        await sticker_file.download_to_memory(buffer)
+        return await sticker_to_image(buffer.getvalue())
+    return None
+
+STAGE_LABELS = {"prefilter": "本地规则", "cache": "AI缓存", "ai": "AI"}
+
+def _filtered_reason(analysis_result: dict) -> str:
+    reason = analysis_result.get("reason")
+    label = STAGE_LABELS.get(analysis_result.get("stage"))
+    return f"[{label}] {reason}" if label else reason
+
+async def _analyze_with_notice(context: ContextTypes.DEFAULT_TYPE, message):
+    verdict = prefilter.evaluate(message)
+    if verdict is not None:
+        return verdict, None
+
+    # 命中审查缓存时不下载图片，也不发送"正在分析"提示
+    cached = await gemini_service.get_cached_verdict(message)
+    if cached is not None:
+        return dict(cached, stage="cache"), None
+
+    image_bytes = await _download_image_for_analysis(message)
+    analyzing_message = await context.bot.send_message(
+        chat_id=message.chat_id,
+        text="正在通过AI分析内容是否包含垃圾信息...",
+        reply_to_message_id=message.message_id
+    )
+    analysis_result = await gemini_service.analyze_message(message, image_bytes, check_cache=False)
+    return dict(analysis_result, stage="ai"), analyzing_message
+
+async def _analyze_group_with_notice(context: ContextTypes.DEFAULT_TYPE, messages):
+    for message in messages:
+        verdict = prefilter.evaluate(message)
+        if verdict is not None and verdict.get("is_spam"):
+            return verdict, None
+
+    photos = [message for message in messages if message.photo]
+    if not photos and not any(message.caption for message in messages):
+        return {"is_spam": False}, None
+
+    cached = await gemini_service.get_cached_group_verdict(messages)
+    if cached is not None:
+        return dict(cached, stage="cache"), None
+
+    images = [image for image in await asyncio.gather(*(_download_image_for_analysis(message) for message in photos)) if image]
+    analyzing_message = await context.bot.send_message(
+        chat_id=messages[0].chat_id,
+        text="正在通过AI分析内容是否包含垃圾信息...",
+        reply_to_message_id=messages[0].message_id
+    )
+    analysis_result = await gemini_service.analyze_media_group(messages, images, check_cache=False)
+    return dict(analysis_result, stage="ai"), analyzing_message
+
+async def _reply_blocked(message, analyzing_message, reason: str):
+    text = f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}"
+    if analyzing_message:
+        await analyzing_message.edit_text(text)
+    else:
+        await message.reply_text(text)
+
+async def _reply_deferred(message, analyzing_message):
+    text = "当前内容审查繁忙，您的消息暂未转发，请稍后重新发送。"
+    if analyzing_message:
+        await analyzing_message.edit_text(text)
+    else:
+        await message.reply_text(text)
+
+async def _screen_message(context: ContextTypes.DEFAULT_TYPE, message, user_id: int) -> bool:
+    # 返回是否可以转发；被拦截或审查未完成时已回复用户
+    analysis_result, analyzing_message = await _analyze_with_notice(context, message)
+    if analysis_result.get("is_spam"):
+        media_type, media_file_id = get_media_info(message)
+        await db.save_filtered_message(
+            user_id=user_id,
+            message_id=message.message_id,
+            content=message.text or message.caption,
+            reason=_filtered_reason(analysis_result),
+            media_type=media_type,
+            media_file_id=media_file_id,
+        )
+        reason = analysis_result.get("reason", "未提供原因")
+        await _reply_blocked(message, analyzing_message, reason)
+        return False
+    # 审查服务过载或出错时不放行未经审查的消息，也不计入拦截记录
+    if analysis_result.get("deferred"):
+        await _reply_deferred(message, analyzing_message)
+        return False
+    if analyzing_message:
+        await analyzing_message.delete()
+    return True
+
+async def _ensure_topic_alive(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, thread_id: int) -> bool:
+    # 话题近期已确认存在时跳过 forward/delete 探测，稳定状态下每条消息只需一次发送
+    if topic_health.is_alive(thread_id):
+        return True
+    try:
+        probe_msg = await context.bot.forward_message(
+            chat_id=config.FORUM_GROUP_ID,
+            from_chat_id=config.FORUM_GROUP_ID,
+            message_id=thread_id,
+            message_thread_id=thread_id,
+            disable_notification=True
+        )
+        await context.bot.delete_message(
+            chat_id=config.FORUM_GROUP_ID,
+            message_id=probe_msg.message_id
+        )
+        topic_health.mark_alive(thread_id)
+    except BadRequest as e:
+        error_text = e.message.lower()
+        if "message to forward not found" in error_text or \
+           "message not found" in error_text or \
+           "thread not found" in error_text or \
+           "topic not found" in error_text:
+            await handle_invalid_thread(update, context, user_id, thread_id)
+            return False
+        print(f"Topic probe failed with unexpected error: {e}")
+    return True
+
+async def _process_user_media_group(items):
+    update, context = items[0]
+    user = update.effective_user
+    messages = sorted((item[0].message for item in items), key=lambda message: message.message_id)
+
+    if not await db.is_exempted(user.id):
+        analysis_result, analyzing_message = await _analyze_group_with_notice(context, messages)
+        if analysis_result.get("is_spam"):
+            for message in messages:
+                media_type, media_file_id = get_media_info(message)
+                await db.save_filtered_message(
+                    user_id=user.id,
+                    message_id=message.message_id,
+                    content=message.caption,
+                    reason=_filtered_reason(analysis_result),
+                    media_type=media_type,
+                    media_file_id=media_file_id,
+                )
+            reason = analysis_result.get("reason", "未提供原因")
+            await _reply_blocked(messages[0], analyzing_message, reason)
+            return
+        elif analysis_result.get("deferred"):
+            await _reply_deferred(messages[0], analyzing_message)
+            return
+        elif analyzing_message:
+            await analyzing_message.delete()
+
+    thread_id, is_new = await get_or_create_thread(
+        update, context,
+        forward=lambda thread_id: _send_user_media_group(update, context, messages, thread_id)
+    )
+    if not thread_id:
+        await update.message.reply_text("无法创建或找到您的话题，请联系管理员。")
+        return
+    if is_new:
+        return
+    if not await _ensure_topic_alive(update, context, user.id, thread_id):
+        return
+    await _send_user_media_group(update, context, messages, thread_id)
+
+async def _generate_autoreply(question: str):
+    kb_version = knowledge_snapshot.version
+    cached = autoreply_cache.get(question, kb_version)
+    if cached is not None:
+        return cached
+
+    # 只把与消息相关的条目放进提示词；没有相关条目时不调用 AI
+    knowledge_base_content = await db.get_relevant_knowledge_content(question)
+    if not knowledge_base_content:
+        return None
+    autoreply_text = await gemini_service.generate_autoreply(question, knowledge_base_content)
+    autoreply_cache.put(question, kb_version, autoreply_text)
+    return autoreply_text
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from network_test.handlers import handle_message as network_handle_message
     handled = await network_handle_message(update, context)
@@ -35,6 +260,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = update.effective_user
     
+    # 相册在后台审查和转发，之后的普通消息要等该用户的相册处理完，避免先于相册转发
+    if not update.message.media_group_id:
+        await media_group_buffer.wait_idle(user.id)
+    
     is_over_limit, was_warned = await rate_limiter.check_user_rate_limit(user.id)
     
     if is_over_limit:
@@ -82,9 +311,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(message)
         return
     
-    user_data = await db.get_user(user.id)
+    # 全局限流放在封禁与单用户限流之后，避免被拦下的消息占用全局额度；提示每个用户每分钟最多发一次
+    if rate_limiter.check_global_rate_limit():
+        if rate_limiter.should_notify_global_limit(user.id):
+            await update.message.reply_text("当前消息较多，请稍后再试。")
+        return
+    
+    user_state = await db.get_user_state(user.id)
     
-    if not user_data:
+    if not user_state.exists:
         await db.add_user(
             user_id=user.id,
             username=user.username,
@@ -99,7 +334,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "不过，在你发送第一条消息前，请先完成人机验证。"
         )
         await update.message.reply_text(welcome_message)
-        user_data = await db.get_user(user.id)
+        user_state = await db.get_user_state(user.id)
     else:
         await db.update_user_profile(
             user_id=user.id,
@@ -109,7 +344,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             language_code=user.language_code
         )
 
-    if not user_data.get('is_verified'):
+    if not user_state.is_verified:
         if not config.VERIFICATION_ENABLED:
             await db.update_user_verification(user.id, is_verified=True)
         else:
@@ -133,43 +368,19 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
     
     message = update.message
-    image_bytes = None
 
-    if message.photo:
-        photo_file = await message.photo[-1].get_file()
-        image_bytes = await photo_file.download_as_bytearray()
-    elif message.sticker and not message.sticker.is_animated and not message.sticker.is_video:
-        sticker_file = await message.sticker.get_file()
-        sticker_bytes = await sticker_file.download_as_bytearray()
-        image_bytes = await sticker_to_image(sticker_bytes)
+    # 相册的每条媒体是独立的更新，先缓存凑齐，再整组审查、整组转发
+    if message.media_group_id and build_input_media(message) is not None:
+        media_group_buffer.add(user.id, message.media_group_id, (update, context), _process_user_media_group)
+        return
 
     if message.video or message.animation:
         pass
     else:
         is_exempted = await db.is_exempted(user.id)
         
-        if not is_exempted:
-            analyzing_message = await context.bot.send_message(
-                chat_id=message.chat_id,
-                text="正在通过AI分析内容是否包含垃圾信息...",
-                reply_to_message_id=message.message_id
-            )
-
-            analysis_result = await gemini_service.analyze_message(message, image_bytes)
-            if analysis_result.get("is_spam"):
-                await db.save_filtered_message(
-                    user_id=user.id,
-                    message_id=message.message_id,
-                    content=message.text or message.caption,
-                    reason=analysis_result.get("reason"),
-                    media_type=message.photo and "photo" or message.sticker and "sticker",
-                    media_file_id=message.photo and message.photo[-1].file_id or message.sticker and message.sticker.file_id,
-                )
-                reason = analysis_result.get("reason", "未提供原因")
-                await analyzing_message.edit_text(f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}")
-                return
-            else:
-                await analyzing_message.delete()
+        if not is_exempted and not await _screen_message(context, message, user.id):
+            return
 
     thread_id, is_new = await get_or_create_thread(update, context)
     if not thread_id:
@@ -177,30 +388,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     forwarded_message_id = None
+    # 新话题在创建时已转发并记录了这条消息
     if is_new:
         return
     
-    try:
-        probe_msg = await context.bot.forward_message(
-            chat_id=config.FORUM_GROUP_ID,
-            from_chat_id=config.FORUM_GROUP_ID,
-            message_id=thread_id,
-            message_thread_id=thread_id,
-            disable_notification=True
-        )
-        await context.bot.delete_message(
-            chat_id=config.FORUM_GROUP_ID,
-            message_id=probe_msg.message_id
-        )
-    except BadRequest as e:
-        error_text = e.message.lower()
-        if "message to forward not found" in error_text or \
-           "message not found" in error_text or \
-           "thread not found" in error_text or \
-           "topic not found" in error_text:
-            await handle_invalid_thread(update, context, user.id)
-            return
-        print(f"Topic probe failed with unexpected error: {e}")
+    if not await _ensure_topic_alive(update, context, user.id, thread_id):
+        return
     
     try:
         sent_msg = None
@@ -215,59 +408,58 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             forwarded_message_id = sent_msg.message_id
         else:
             await _resend_message(update, context, thread_id)
-            return
+    except SendRejected as e:
+        print(f"转发消息被发送调度器放弃: {e}")
+        await update.message.reply_text(SEND_BUSY_TEXT)
+        return
     except BadRequest as e:
         if "thread not found" in e.message.lower() or "topic not found" in e.message.lower():
-            await handle_invalid_thread(update, context, user.id)
+            await handle_invalid_thread(update, context, user.id, thread_id)
             return
         else:
             print(f"发送消息时发生未知错误: {e}")
             await update.message.reply_text("发送消息时发生未知错误，请稍后再试。")
             return
+
+    await _log_incoming_message(message, user.id, thread_id)
     
     if message.text and await db.get_autoreply_enabled():
-        knowledge_base_content = await db.get_all_knowledge_content()
-        if knowledge_base_content:
-            autoreply_text = await gemini_service.generate_autoreply(
-                message.text,
-                knowledge_base_content
-            )
+        autoreply_text = await _generate_autoreply(message.text)
+        if autoreply_text:
+            try:
+                await update.message.reply_text(
+                    autoreply_text,
+                    parse_mode='Markdown'
+                )
+            except Exception as e:
+                print(f"Markdown解析失败，使用纯文本: {e}")
+                await update.message.reply_text(autoreply_text)
             
-            if autoreply_text:
+            if forwarded_message_id:
+                admin_notification = (
+                    f"自动回复内容:\n\n"
+                    f"{autoreply_text}"
+                )
                 try:
-                    await update.message.reply_text(
-                        autoreply_text,
+                    await context.bot.send_message(
+                        chat_id=config.FORUM_GROUP_ID,
+                        text=admin_notification,
+                        message_thread_id=thread_id,
+                        reply_to_message_id=forwarded_message_id,
                         parse_mode='Markdown'
                     )
                 except Exception as e:
-                    print(f"Markdown解析失败，使用纯文本: {e}")
-                    await update.message.reply_text(autoreply_text)
-                
-                if forwarded_message_id:
-                    admin_notification = (
-                        f"自动回复内容:\n\n"
-                        f"{autoreply_text}"
-                    )
+                    print(f"发送自动回复通知给管理员失败（Markdown），尝试纯文本: {e}")
                     try:
+                        admin_notification_plain = (
+                            f"自动回复内容:\n\n"
+                            f"{autoreply_text}"
+                        )
                         await context.bot.send_message(
                             chat_id=config.FORUM_GROUP_ID,
-                            text=admin_notification,
+                            text=admin_notification_plain,
                             message_thread_id=thread_id,
-                            reply_to_message_id=forwarded_message_id,
-                            parse_mode='Markdown'
+                            reply_to_message_id=forwarded_message_id
                         )
-                    except Exception as e:
-                        print(f"发送自动回复通知给管理员失败（Markdown），尝试纯文本: {e}")
-                        try:
-                            admin_notification_plain = (
-                                f"自动回复内容:\n\n"
-                                f"{autoreply_text}"
-                            )
-                            await context.bot.send_message(
-                                chat_id=config.FORUM_GROUP_ID,
-                                text=admin_notification_plain,
-                                message_thread_id=thread_id,
-                                reply_to_message_id=forwarded_message_id
-                            )
-                        except Exception as e2:
-                            print(f"发送自动回复通知给管理员失败: {e2}")
+                    except Exception as e2:
+                        print(f"发送自动回复通知给管理员失败: {e2}")
@@ -5,6 +5,7 @@ from typing import Dict, Any, Optional
 from telegram.ext import ContextTypes
 from telegram import constants
 from config import config
+from services import send_scheduler
 from . import data_manager, retry_utils, settings
 
 logger = logging.getLogger(__name__)
@@ -31,6 +32,8 @@ async def send_telegram_message(
             text=text,
             parse_mode=constants.ParseMode.HTML,
             disable_web_page_preview=not link_preview_enabled,
+            rate_limit_args=send_scheduler.PRIORITY_RSS,
+            retry_rate_limit=False,
         )
     except Exception as exc:
         logger.error("向 %s 发送消息时出错: %s", chat_id, exc)
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from datetime import timedelta
 from typing import Callable, Any, TypeVar
 from telegram import error as tg_error
 
@@ -13,13 +14,18 @@ DEFAULT_MAX_DELAY = 60.0
 DEFAULT_BACKOFF_FACTOR = 2.0
 
 
+def retry_after_seconds(exception: tg_error.RetryAfter) -> float:
+    retry_after = exception.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
 def is_retryable_error(exception: Exception) -> bool:
+    # python-telegram-bot 把服务端 5xx 错误也归为 NetworkError
     if isinstance(exception, (tg_error.NetworkError, tg_error.TimedOut)):
         return True
 
-    if isinstance(exception, tg_error.TelegramServerError):
-        return True
-
     if isinstance(exception, tg_error.RetryAfter):
         return True
 
@@ -39,8 +45,10 @@ async def retry_telegram_api(
     initial_delay: float = DEFAULT_INITIAL_DELAY,
     max_delay: float = DEFAULT_MAX_DELAY,
     backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    retry_rate_limit: bool = True,
     **kwargs,
 ) -> Any:
+    # 经过 OutboundScheduler 的调用已由调度器处理 RetryAfter，应传入 retry_rate_limit=False，避免两层重试叠加
     last_exception = None
 
     for attempt in range(max_retries + 1):
@@ -49,7 +57,7 @@ async def retry_telegram_api(
         except Exception as exc:
             last_exception = exc
 
-            if not is_retryable_error(exc):
+            if not is_retryable_error(exc) or (isinstance(exc, tg_error.RetryAfter) and not retry_rate_limit):
                 logger.error("遇到不可重试的错误: %s: %s", type(exc).__name__, exc)
                 raise
 
@@ -63,7 +71,7 @@ async def retry_telegram_api(
                 raise
 
             if isinstance(exc, tg_error.RetryAfter):
-                delay = float(exc.retry_after)
+                delay = retry_after_seconds(exc)
                 logger.warning(
                     "遇到限流错误，等待 %s 秒后重试 (尝试 %s/%s)",
                     delay,
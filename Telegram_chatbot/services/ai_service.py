@@ -1,14 +1,19 @@
 from abc import ABC, abstractmethod
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
 from google.genai import Client as GeminiClient
 from google.genai import types
 from openai import AsyncOpenAI
 import json
 import re
 import random
-import io
-from PIL import Image
 from config import config
-from database.db_manager import db_manager
+from database import settings as db_settings
+from services.verdict_cache import verdict_cache, build_cache_key, build_group_cache_key
+from utils.token_bucket import TokenBucket
 
 
 def _normalize_model_name(raw_name) -> str:
@@ -65,9 +70,67 @@ LOCAL_VERIFICATION_QUESTIONS = [
     {"question": "以下哪个不属于数字？", "correct_answer": "字母", "incorrect_answers": ["1", "2", "3"]}
 ]
 
+# Telegram 限制 callback_data 最长 64 字节，选项需留出 "verify_" 前缀的空间
+MAX_OPTION_BYTES = 48
+
+
+def _build_verification_batch_prompt(count: int) -> str:
+    return f"""
+        # 角色
+        你是一个人机验证（CAPTCHA）问题生成器。
+        # 任务
+        一次生成 {count} 个互不重复的、适合成年人的中文常识性问题，用于区分人类和机器人。
+        # 要求
+        1.  **问题格式多样性**: 约一半为标准直接提问（例如"中国的首都是哪里？"），其余为反向排除提问（例如"以下哪个不属于行星？"）。
+        2.  **主题**: 主题为完全随机的日常通用常识，各问题之间不要重复主题。
+        3.  **难度**: 设定为"绝大多数18岁以上母语为中文的成年人都能立即回答正确"的水平，避免专业或冷门知识。
+        4.  **明确性**: 每个问题只有一个明确无误的正确答案。
+        5.  **答案逻辑**: 每个问题提供一个`correct_answer`和包含三个字符串的列表`incorrect_answers`；反向排除问题中`correct_answer`是不属于该类别的那一项。选项尽量简短。
+        6.  **语言**: 所有内容必须为简体中文。
+        7.  **输出格式**: 严格按照以下JSON格式返回，不要包含任何额外的解释或文字。
+        # JSON格式示例
+        {{
+          "questions": [
+            {{"question": "问题文本", "correct_answer": "正确答案", "incorrect_answers": ["干扰项1", "干扰项2", "干扰项3"]}}
+          ]
+        }}
+        """
+
+
+def _parse_verification_batch(response_text: str) -> list:
+    clean_text = re.sub(r'```json\s*|\s*```', '', response_text or '').strip()
+    data = json.loads(clean_text)
+    items = data.get('questions', []) if isinstance(data, dict) else data
+
+    challenges = []
+    for item in items if isinstance(items, list) else []:
+        try:
+            question = str(item['question']).strip()
+            correct_answer = str(item['correct_answer']).strip()
+            incorrect_answers = [str(answer).strip() for answer in item['incorrect_answers']]
+        except (KeyError, TypeError):
+            continue
+        options = incorrect_answers + [correct_answer]
+        if not question or len(incorrect_answers) != 3 or len(set(options)) != 4:
+            continue
+        if any(not option or len(option.encode('utf-8')) > MAX_OPTION_BYTES for option in options):
+            continue
+        challenges.append({
+            "question": question,
+            "correct_answer": correct_answer,
+            "incorrect_answers": incorrect_answers,
+        })
+    return challenges
+
+
+# 审查没有完成（提供商出错、调度器拒绝）时的结果：不代表内容安全，调用方应暂缓转发
+def deferred_verdict(reason: str) -> dict:
+    return {"is_spam": False, "deferred": True, "reason": reason}
+
+
 class AIProvider(ABC):
     @abstractmethod
-    async def analyze_message(self, text: str, image_bytes: bytes = None) -> dict:
+    async def analyze_message(self, text: str, images: list = None) -> dict:
         pass
 
     @abstractmethod
@@ -78,6 +141,10 @@ class AIProvider(ABC):
     async def generate_unblock_question(self) -> dict:
         pass
 
+    @abstractmethod
+    async def generate_verification_batch(self, count: int) -> list:
+        pass
+
     @abstractmethod
     async def generate_autoreply(self, user_message: str, knowledge_base_content: str) -> str:
         pass
@@ -86,6 +153,9 @@ class AIProvider(ABC):
     async def get_models(self) -> list:
         pass
 
+    async def aclose(self):
+        pass
+
 class GeminiProvider(AIProvider):
     def __init__(self, api_key: str, base_url: str = None):
         client_kwargs = {"api_key": api_key}
@@ -95,16 +165,15 @@ class GeminiProvider(AIProvider):
         self.client = GeminiClient(**client_kwargs)
         self.api_key = api_key
         self.base_url = base_url or None
+
+    async def aclose(self):
+        await self.client.aio.aclose()
+        self.client.close()
         
     async def _get_model_name(self, setting_key: str, default: str) -> str:
-         async with db_manager.get_connection() as db:
-            cursor = await db.execute("SELECT value FROM settings WHERE key = ?", (setting_key,))
-            row = await cursor.fetchone()
-            if row:
-                return row[0]
-            return default
-
-    async def analyze_message(self, text: str, image_bytes: bytes = None) -> dict:
+        return db_settings.get(setting_key, default)
+
+    async def analyze_message(self, text: str, images: list = None) -> dict:
         model_name = await self._get_model_name('gemini_model_filter', 'gemini-2.5-flash')
         content = []
         prompt_parts = [
@@ -118,12 +187,9 @@ class GeminiProvider(AIProvider):
         if text:
             content.append(text)
         
-        if image_bytes:
-            try:
-                image = Image.open(io.BytesIO(image_bytes))
-                content.append(image)
-            except Exception as e:
-                print(f"Error processing image for Gemini: {e}")
+        # 图片已在上游压缩为 JPEG，直接传字节，无需再解码
+        for image_bytes in images or []:
+            content.append(types.Part.from_bytes(data=bytes(image_bytes), mime_type="image/jpeg"))
 
         if not content:
             return {"is_spam": False, "reason": "No content to analyze"}
@@ -152,7 +218,7 @@ class GeminiProvider(AIProvider):
             return result
         except Exception as e:
             print(f"Gemini analysis failed: {e}")
-            return {"is_spam": False, "reason": "Analysis failed"}
+            return deferred_verdict("Analysis failed")
 
     async def generate_verification_challenge(self) -> dict:
         model_name = await self._get_model_name('gemini_model_verification', 'gemini-2.5-flash-lite')
@@ -215,7 +281,29 @@ class GeminiProvider(AIProvider):
     async def generate_unblock_question(self) -> dict:
         return await self.generate_verification_challenge()
 
-    def _get_local_question(self) -> dict:
+    async def generate_verification_batch(self, count: int) -> list:
+        model_name = await self._get_model_name('gemini_model_verification', 'gemini-2.5-flash-lite')
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=model_name,
+                contents=_build_verification_batch_prompt(count)
+            )
+
+            if response.candidates and response.candidates[0].content.parts:
+                response_text = response.candidates[0].content.parts[0].text
+            else:
+                response_text = None
+
+            if not response_text:
+                raise ValueError("Gemini API返回空响应")
+
+            return _parse_verification_batch(response_text)
+        except Exception as e:
+            print(f"批量生成验证问题失败: {e}")
+            return []
+
+    @staticmethod
+    def _get_local_question() -> dict:
         question_data = random.choice(LOCAL_VERIFICATION_QUESTIONS)
 
         correct_answer = question_data['correct_answer']
@@ -297,15 +385,13 @@ class OpenAIProvider(AIProvider):
     def __init__(self, api_key: str, base_url: str):
         self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
 
+    async def aclose(self):
+        await self.client.close()
+
     async def _get_model_name(self, setting_key: str, default: str) -> str:
-         async with db_manager.get_connection() as db:
-            cursor = await db.execute("SELECT value FROM settings WHERE key = ?", (setting_key,))
-            row = await cursor.fetchone()
-            if row:
-                return row[0]
-            return default
-
-    async def analyze_message(self, text: str, image_bytes: bytes = None) -> dict:
+        return db_settings.get(setting_key, default)
+
+    async def analyze_message(self, text: str, images: list = None) -> dict:
         model_name = await self._get_model_name('openai_model_filter', 'gpt-4.1')
         messages = [
             {"role": "system", "content": "你是一个内容审查员。你的任务是分析提供给你的文本和/或图片内容，并判断其是否包含垃圾信息、恶意软件、钓鱼链接、不当言论、辱骂、攻击性词语或任何违反安全政策的内容。\n请严格按照要求，仅以JSON格式返回你的分析结果，不要包含任何额外的解释或标记。\n**输出格式**: 你必须且只能以严格的JSON格式返回你的分析结果，不得包含任何解释性文字或代码块标记。\n**JSON结构**:\n```json\n{\n  \"is_spam\": boolean,\n  \"reason\": \"string\"\n}\n```\n*   `is_spam`: 如果内容违反**任何一条**安全策略，则为 `true`；如果内容完全安全，则为 `false`。\n*   `reason`: 用一句话精准概括判断依据。如果违规，请明确指出违规的类型。如果安全，此字段固定为 `\"内容未发现违规。\"`"},
@@ -315,7 +401,7 @@ class OpenAIProvider(AIProvider):
         if text:
              messages[1]["content"].append({"type": "text", "text": text})
         
-        if image_bytes:
+        for image_bytes in images or []:
              import base64
              base64_image = base64.b64encode(image_bytes).decode('utf-8')
              messages[1]["content"].append({
@@ -343,7 +429,7 @@ class OpenAIProvider(AIProvider):
             return result
         except Exception as e:
             print(f"OpenAI analysis failed: {e}")
-            return {"is_spam": False, "reason": "Analysis failed"}
+            return deferred_verdict("Analysis failed")
 
     async def generate_verification_challenge(self) -> dict:
         model_name = await self._get_model_name('openai_model_verification', 'gpt-4.1-mini')
@@ -399,7 +485,21 @@ class OpenAIProvider(AIProvider):
     async def generate_unblock_question(self) -> dict:
         return await self.generate_verification_challenge()
 
-    def _get_local_question(self) -> dict:
+    async def generate_verification_batch(self, count: int) -> list:
+        model_name = await self._get_model_name('openai_model_verification', 'gpt-4.1-mini')
+        try:
+            response = await self.client.chat.completions.create(
+                model=model_name,
+                messages=[{"role": "user", "content": _build_verification_batch_prompt(count)}],
+                response_format={"type": "json_object"}
+            )
+            return _parse_verification_batch(response.choices[0].message.content)
+        except Exception as e:
+            print(f"OpenAI batch verification failed: {e}")
+            return []
+
+    @staticmethod
+    def _get_local_question() -> dict:
         question_data = random.choice(LOCAL_VERIFICATION_QUESTIONS)
         correct_answer = question_data['correct_answer']
         options = question_data['incorrect_answers'] + [correct_answer]
@@ -469,6 +569,145 @@ class OpenAIProvider(AIProvider):
         return _unique_model_names(fetched_models)
 
 
+PRIORITY_VERIFICATION = 0
+PRIORITY_MODERATION = 1
+PRIORITY_AUTOREPLY = 2
+PRIORITY_BACKGROUND = 3
+
+# 粗略估算：提示词模板约 500 token，中文约 2 字符 1 token，图片按 260 token 计
+PROMPT_OVERHEAD_TOKENS = 500
+IMAGE_TOKENS = 260
+
+
+def _estimate_tokens(*texts, image_bytes: bytes = None, image_count: int = 0) -> int:
+    tokens = PROMPT_OVERHEAD_TOKENS + sum(len(text or "") for text in texts) // 2
+    if image_bytes:
+        image_count += 1
+    return tokens + IMAGE_TOKENS * image_count
+
+
+class AISchedulerRejected(Exception):
+    pass
+
+
+class AICallScheduler:
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(rpm, 60) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm, 60) if tpm > 0 else None
+        self._active = 0
+        self._waiters = []
+        # 仍在排队的请求数；超时或取消的记录留在堆里，等轮到堆顶时才移除，不能用堆的长度判断队列是否已满
+        self._queued = 0
+        self._seq = itertools.count()
+        self._inflight = {}
+        self._wakeup = None
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.coalesced = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    def _dispatch(self):
+        self._wakeup = None
+        while self._waiters and self._active < self.max_concurrency:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            delay = 0.0
+            if self._requests is not None:
+                delay = max(delay, self._requests.delay_for(1))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.delay_for(tokens))
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            if self._requests is not None:
+                self._requests.consume(1)
+            if self._tokens is not None:
+                self._tokens.consume(tokens)
+            self._active += 1
+            self._queued -= 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int, tokens: int):
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise AISchedulerRejected("AI 请求队列已满")
+        if len(self._waiters) >= self.max_queue:
+            self._waiters = [waiter for waiter in self._waiters if not waiter[3].done()]
+            heapq.heapify(self._waiters)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._queued += 1
+        if self._wakeup is None:
+            self._dispatch()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self.release()
+            self.timed_out += 1
+            raise AISchedulerRejected("AI 请求排队超时")
+        finally:
+            if future.cancelled():
+                self._queued -= 1
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        self.admitted += 1
+        self._total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def release(self):
+        self._active -= 1
+        if self._wakeup is None:
+            self._dispatch()
+
+    async def _call(self, priority: int, tokens: int, call):
+        await self.acquire(priority, tokens)
+        try:
+            return await call()
+        finally:
+            self.release()
+
+    async def run(self, priority: int, tokens: int, call, key=None):
+        if key is None:
+            return await self._call(priority, tokens, call)
+
+        # 相同请求正在进行时直接等待同一个结果
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._call(priority, tokens, call))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "coalesced": self.coalesced,
+            "avg_wait_ms": self._total_wait_ms / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+
 class AIService:
     _instance = None
     
@@ -476,60 +715,208 @@ class AIService:
         if cls._instance is None:
             cls._instance = super(AIService, cls).__new__(cls)
             cls._instance.provider = None
+            cls._instance._providers = {}
+            cls._instance._retired = []
+            cls._instance._schedulers = {}
+            db_settings.subscribe(cls._instance._on_setting_changed)
         return cls._instance
 
-    async def get_provider(self) -> AIProvider:
-        async with db_manager.get_connection() as db:
-            cursor = await db.execute("SELECT value FROM settings WHERE key = 'ai_provider'")
-            row = await cursor.fetchone()
-            provider_type = row[0] if row else 'gemini'
-        
+    def _provider_for(self, provider_type: str) -> AIProvider:
         if provider_type == 'gemini':
-            if not config.GEMINI_API_KEY:
-                return None
-            return GeminiProvider(config.GEMINI_API_KEY, config.GEMINI_BASE_URL)
+            api_key, base_url, provider_cls = config.GEMINI_API_KEY, config.GEMINI_BASE_URL, GeminiProvider
         elif provider_type == 'openai':
-            if not config.OPENAI_API_KEY:
-                return None
-            return OpenAIProvider(config.OPENAI_API_KEY, config.OPENAI_BASE_URL)
-        return None
+            api_key, base_url, provider_cls = config.OPENAI_API_KEY, config.OPENAI_BASE_URL, OpenAIProvider
+        else:
+            return None
+        if not api_key:
+            return None
+
+        # 同一组凭据复用同一个客户端，保留底层 HTTP 连接池与 TLS 会话
+        key = (provider_type, api_key, base_url)
+        provider = self._providers.get(key)
+        if provider is None:
+            provider = provider_cls(api_key, base_url)
+            self._providers[key] = provider
+        return provider
+
+    def _on_setting_changed(self, key, value):
+        if key is not None and key != 'ai_provider':
+            return
+        active_type = db_settings.get('ai_provider', 'gemini')
+        for provider_key in [k for k in self._providers if k[0] != active_type]:
+            self._retired.append(self._providers.pop(provider_key))
+        self.provider = None
+
+    async def _close_retired(self):
+        while self._retired:
+            provider = self._retired.pop()
+            try:
+                await provider.aclose()
+            except Exception as e:
+                print(f"关闭 AI 客户端失败: {e}")
+
+    def _scheduler_for(self, provider_type: str) -> AICallScheduler:
+        scheduler = self._schedulers.get(provider_type)
+        if scheduler is None:
+            scheduler = AICallScheduler(
+                config.AI_MAX_CONCURRENCY,
+                config.AI_RPM_LIMIT,
+                config.AI_TPM_LIMIT,
+                config.AI_MAX_QUEUE,
+                config.QUEUE_TIMEOUT,
+            )
+            self._schedulers[provider_type] = scheduler
+        return scheduler
+
+    def scheduler_stats(self) -> dict:
+        stats = [scheduler.stats() for scheduler in self._schedulers.values()]
+        totals = {
+            name: sum(item[name] for item in stats)
+            for name in ("active", "queued", "admitted", "rejected", "timed_out", "coalesced")
+        }
+        totals["max_wait_ms"] = max((item["max_wait_ms"] for item in stats), default=0.0)
+        total_wait = sum(item["avg_wait_ms"] * item["admitted"] for item in stats)
+        totals["avg_wait_ms"] = total_wait / totals["admitted"] if totals["admitted"] else 0.0
+        return totals
+
+    async def _schedule(self, priority: int, tokens: int, call, key=None):
+        scheduler = self._scheduler_for(db_settings.get('ai_provider', 'gemini'))
+        return await scheduler.run(priority, tokens, call, key=key)
+
+    async def get_provider(self) -> AIProvider:
+        if self._retired:
+            await self._close_retired()
+        if self.provider is None:
+            self.provider = self._provider_for(db_settings.get('ai_provider', 'gemini'))
+        return self.provider
+
+    async def close(self):
+        self._retired.extend(self._providers.values())
+        self._providers.clear()
+        self.provider = None
+        await self._close_retired()
+
+    async def get_cached_verdict(self, message) -> dict:
+        if not config.ENABLE_AI_FILTER:
+            return None
+        return await verdict_cache.get(build_cache_key(message))
+
+    async def get_cached_group_verdict(self, messages) -> dict:
+        if not config.ENABLE_AI_FILTER:
+            return None
+        return await verdict_cache.get(build_group_cache_key(messages))
 
-    async def analyze_message(self, message, image_bytes: bytes = None) -> dict:
+    async def analyze_message(self, message, image_bytes: bytes = None, check_cache: bool = True) -> dict:
         if not config.ENABLE_AI_FILTER:
              return {"is_spam": False, "reason": "AI filter disabled"}
+
+        cache_key = build_cache_key(message, image_bytes)
+        if check_cache:
+            cached = await verdict_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         provider = await self.get_provider()
         if not provider:
              return {"is_spam": False, "reason": "No AI provider configured"}
         
         text = message.text if message.text else ""
-        return await provider.analyze_message(text, image_bytes)
+        try:
+            result = await self._schedule(
+                PRIORITY_MODERATION,
+                _estimate_tokens(text, image_bytes=image_bytes),
+                lambda: provider.analyze_message(text, [image_bytes] if image_bytes else None),
+                key=cache_key,
+            )
+        except AISchedulerRejected as e:
+            print(f"AI 审查请求被调度器拒绝: {e}")
+            return deferred_verdict(str(e))
+        verdict_cache.put(cache_key, result)
+        return result
+
+    # 相册整体审查：说明文字合并、多张图片放进同一次调用
+    async def analyze_media_group(self, messages: list, images: list, check_cache: bool = True) -> dict:
+        if not config.ENABLE_AI_FILTER:
+             return {"is_spam": False, "reason": "AI filter disabled"}
+
+        cache_key = build_group_cache_key(messages)
+        if check_cache:
+            cached = await verdict_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        provider = await self.get_provider()
+        if not provider:
+             return {"is_spam": False, "reason": "No AI provider configured"}
+
+        text = "\n".join(message.caption for message in messages if message.caption)
+        try:
+            result = await self._schedule(
+                PRIORITY_MODERATION,
+                _estimate_tokens(text, image_count=len(images)),
+                lambda: provider.analyze_message(text, images),
+                key=cache_key,
+            )
+        except AISchedulerRejected as e:
+            print(f"AI 审查请求被调度器拒绝: {e}")
+            return deferred_verdict(str(e))
+        verdict_cache.put(cache_key, result)
+        return result
 
     async def generate_verification_challenge(self) -> dict:
         provider = await self.get_provider()
         if not provider:
-             return GeminiProvider(None)._get_local_question()
-        return await provider.generate_verification_challenge()
+             return GeminiProvider._get_local_question()
+        try:
+            return await self._schedule(PRIORITY_VERIFICATION, _estimate_tokens(), provider.generate_verification_challenge)
+        except AISchedulerRejected as e:
+            print(f"验证问题请求被调度器拒绝: {e}")
+            return GeminiProvider._get_local_question()
 
     async def generate_unblock_question(self) -> dict:
         provider = await self.get_provider()
         if not provider:
-             return GeminiProvider(None)._get_local_question()
-        return await provider.generate_unblock_question()
+             return GeminiProvider._get_local_question()
+        try:
+            return await self._schedule(PRIORITY_VERIFICATION, _estimate_tokens(), provider.generate_unblock_question)
+        except AISchedulerRejected as e:
+            print(f"解封问题请求被调度器拒绝: {e}")
+            return GeminiProvider._get_local_question()
+
+    async def generate_verification_batch(self, count: int) -> list:
+        provider = await self.get_provider()
+        if not provider:
+            return []
+        try:
+            return await self._schedule(
+                PRIORITY_BACKGROUND,
+                PROMPT_OVERHEAD_TOKENS + count * 80,
+                lambda: provider.generate_verification_batch(count),
+            )
+        except AISchedulerRejected as e:
+            print(f"批量验证问题请求被调度器拒绝: {e}")
+            return []
 
     async def generate_autoreply(self, user_message: str, knowledge_base_content: str) -> str:
         provider = await self.get_provider()
         if not provider:
             return None
-        return await provider.generate_autoreply(user_message, knowledge_base_content)
+        key = hashlib.sha256(f"{user_message}\0{knowledge_base_content}".encode('utf-8')).hexdigest()
+        try:
+            return await self._schedule(
+                PRIORITY_AUTOREPLY,
+                _estimate_tokens(user_message, knowledge_base_content),
+                lambda: provider.generate_autoreply(user_message, knowledge_base_content),
+                key=('autoreply', key),
+            )
+        except AISchedulerRejected as e:
+            print(f"自动回复请求被调度器拒绝: {e}")
+            return None
 
     async def get_available_models(self, provider_type: str) -> list:
-        if provider_type == 'gemini':
-            if not config.GEMINI_API_KEY: return []
-            return await GeminiProvider(config.GEMINI_API_KEY, config.GEMINI_BASE_URL).get_models()
-        elif provider_type == 'openai':
-             if not config.OPENAI_API_KEY: return []
-             return await OpenAIProvider(config.OPENAI_API_KEY, config.OPENAI_BASE_URL).get_models()
-        return []
+        provider = self._provider_for(provider_type)
+        if not provider:
+            return []
+        return await provider.get_models()
 
 ai_service = AIService()
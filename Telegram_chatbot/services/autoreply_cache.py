@@ -0,0 +1,68 @@
+import hashlib
+import time
+from collections import OrderedDict
+from config import config
+from database import settings as db_settings
+from database.knowledge_snapshot import knowledge_snapshot
+from services.verdict_cache import normalize_text
+
+
+def build_autoreply_key(question: str, kb_version: int):
+    question = normalize_text(question)
+    if not question:
+        return None
+    # 知识库版本或自动回复模型变化后旧答案自然失效
+    provider_type = db_settings.get('ai_provider', 'gemini')
+    model_name = db_settings.get(f'{provider_type}_model_autoreply', '')
+    raw = f"v:{kb_version}\nm:{provider_type}/{model_name}\nq:{question}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# 常见问题的自动回复缓存，按（问题, 知识库版本）复用，知识库未变化时不再调用 AI
+class AutoreplyCache:
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, question: str, kb_version: int = None):
+        if kb_version is None:
+            kb_version = knowledge_snapshot.version
+        key = build_autoreply_key(question, kb_version)
+        entry = self._entries.get(key) if key is not None else None
+        if entry is not None:
+            answer, created_at = entry
+            if time.monotonic() - created_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return answer
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, question: str, kb_version: int, answer: str):
+        key = build_autoreply_key(question, kb_version)
+        if key is None or not answer or self.ttl <= 0:
+            return
+        # 生成期间知识库已更新的答案不再缓存
+        if kb_version != knowledge_snapshot.version:
+            return
+        self._entries[key] = (answer, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "kb_version": knowledge_snapshot.version,
+        }
+
+
+autoreply_cache = AutoreplyCache(config.AUTOREPLY_CACHE_MAX_SIZE, config.AUTOREPLY_CACHE_TTL)
@@ -1,12 +1,11 @@
-import time
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.helpers import escape_markdown
 from database import models as db
-from services.gemini_service import gemini_service
+from database.pagination import load_page, page_callback
+from services.challenge_pool import challenge_pool
+from services.session_store import session_store
 from config import config
 
-pending_unblocks = {}
-
 async def block_user(user_id: int, reason: str, admin_id: int, permanent: bool = False):
     await db.add_to_blacklist(user_id, reason, admin_id, permanent)
     return f"用户 {user_id} 已被管理员{'永久' if permanent else ''}拉黑。\n原因: {reason}"
@@ -17,26 +16,14 @@ async def unblock_user(user_id: int):
     return f"用户 {user_id} 已被管理员解封。"
 
 def is_unblock_pending(user_id: int) -> tuple[bool, bool]:
-    if user_id not in pending_unblocks:
-        return False, True
-    
-    session = pending_unblocks[user_id]
-    is_expired = time.time() - session['created_at'] > config.VERIFICATION_TIMEOUT
-    
-    if is_expired:
-        del pending_unblocks[user_id]
+    if session_store.get(user_id, 'unblock') is None:
         return False, True
     
     return True, False
 
 def get_pending_unblock_message(user_id: int):
-    if user_id not in pending_unblocks:
-        return None
-    
-    session = pending_unblocks[user_id]
-    
-    if time.time() - session['created_at'] > config.VERIFICATION_TIMEOUT:
-        del pending_unblocks[user_id]
+    session = session_store.get(user_id, 'unblock')
+    if session is None:
         return None
     
     question = session['question']
@@ -66,17 +53,12 @@ async def start_unblock_process(user_id: int):
                 f"如果您认为这是误操作，请回答以下问题以自动解封：\n\n{question}"
             ), keyboard
     
-    challenge = await gemini_service.generate_unblock_question()
+    challenge = await challenge_pool.take()
     question = challenge['question']
     correct_answer = challenge['correct_answer']
     options = challenge['options']
     
-    pending_unblocks[user_id] = {
-        'answer': correct_answer,
-        'question': question,
-        'options': options,
-        'created_at': time.time()
-    }
+    session_store.put(user_id, 'unblock', question, correct_answer, options)
     
     keyboard = [
         [InlineKeyboardButton(option, callback_data=f"unblock_{option}") for option in options]
@@ -88,22 +70,15 @@ async def start_unblock_process(user_id: int):
     ), InlineKeyboardMarkup(keyboard)
 
 async def verify_unblock_answer(user_id: int, user_answer: str):
-    if user_id not in pending_unblocks:
-        return "解封会话已过期或不存在。", False
-
-    session = pending_unblocks[user_id]
-    
-    if time.time() - session['created_at'] > config.VERIFICATION_TIMEOUT:
-        del pending_unblocks[user_id]
-        return "解封超时，请重新发送消息以获取新问题。", False
+    session = session_store.pop(user_id, 'unblock')
+    if session is None:
+        return "解封会话已过期或不存在，请重新发送消息以获取新问题。", False
 
     if user_answer == session['answer']:
-        del pending_unblocks[user_id]
         await db.remove_from_blacklist(user_id)
         await db.set_user_blacklist_strikes(user_id, 0)
         return "解封成功！您现在可以正常发送消息了。", True
     else:
-        del pending_unblocks[user_id]
         await db.add_to_blacklist(user_id, reason="解封验证失败", blocked_by=config.BOT_ID, permanent=True)
         return "答案错误，解封失败。您已被永久封禁。", False
 
@@ -114,26 +89,20 @@ def _safe_text_for_markdown(text: str) -> str:
     dangerous_chars = r'_*[]()`'
     return "".join(f"\\{char}" if char in dangerous_chars else char for char in text)
 
-async def get_blacklist_keyboard(page: int = 1, per_page: int = 5):
+async def get_blacklist_keyboard(page: int = 1, per_page: int = 5, cursor: str = None, backward: bool = False):
     total_count = await db.get_blacklist_count()
     
     if total_count == 0:
         return "黑名单中没有用户。", None
 
-    total_pages = (total_count + per_page - 1) // per_page
-
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-
-    offset = (page - 1) * per_page
-
-    blacklist_users = await db.get_blacklist_paginated(limit=per_page, offset=offset)
+    blacklist_users, page, has_prev, has_next = await load_page(db.get_blacklist_paginated, per_page, page, cursor, backward)
     
     if not blacklist_users:
         return "黑名单中没有用户。", None
 
+    # 缓存的总数只用于显示，与实际行数短暂不一致时不影响翻页
+    total_pages = max((total_count + per_page - 1) // per_page, page)
+
     keyboard = []
     message = f"黑名单用户列表 (第 {page}/{total_pages} 页)\n\n"
     
@@ -158,17 +127,17 @@ async def get_blacklist_keyboard(page: int = 1, per_page: int = 5):
         ])
     
     navigation_buttons = []
-    if page > 1:
-        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=f"blacklist_page_{page - 1}"))
-    if page < total_pages:
-        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=f"blacklist_page_{page + 1}"))
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=page_callback("blacklist_page_", page - 1, blacklist_users[0], 'blocked_at', 'user_id', backward=True)))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=page_callback("blacklist_page_", page + 1, blacklist_users[-1], 'blocked_at', 'user_id')))
     
     if navigation_buttons:
         keyboard.append(navigation_buttons)
 
     return message, InlineKeyboardMarkup(keyboard)
 
-async def get_all_users_keyboard(page: int = 1, per_page: int = 5, callback_prefix: str = "stats_list_all_users_page_", back_callback: str = "stats_back_to_menu", back_text: str = "返回统计菜单"):
+async def get_all_users_keyboard(page: int = 1, per_page: int = 5, cursor: str = None, backward: bool = False, callback_prefix: str = "stats_list_all_users_page_", back_callback: str = "stats_back_to_menu", back_text: str = "返回统计菜单"):
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     total_count = await db.get_total_users_count()
@@ -176,20 +145,13 @@ async def get_all_users_keyboard(page: int = 1, per_page: int = 5, callback_pref
     if total_count == 0:
         return "没有用户。", None
 
-    total_pages = (total_count + per_page - 1) // per_page
-
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-
-    offset = (page - 1) * per_page
-
-    users = await db.get_all_users_paginated(limit=per_page, offset=offset)
+    users, page, has_prev, has_next = await load_page(db.get_all_users_paginated, per_page, page, cursor, backward)
     
     if not users:
         return "没有用户。", None
 
+    total_pages = max((total_count + per_page - 1) // per_page, page)
+
     keyboard = []
     message = f"所有用户列表 (第 {page}/{total_pages} 页)\n\n"
     
@@ -218,10 +180,10 @@ async def get_all_users_keyboard(page: int = 1, per_page: int = 5, callback_pref
         )
     
     navigation_buttons = []
-    if page > 1:
-        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=f"{callback_prefix}{page - 1}"))
-    if page < total_pages:
-        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=f"{callback_prefix}{page + 1}"))
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=page_callback(callback_prefix, page - 1, users[0], 'created_at', 'user_id', backward=True)))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=page_callback(callback_prefix, page + 1, users[-1], 'created_at', 'user_id')))
     
     back_button = [InlineKeyboardButton(back_text, callback_data=back_callback)]
     keyboard.append(back_button)
@@ -234,7 +196,7 @@ async def get_all_users_keyboard(page: int = 1, per_page: int = 5, callback_pref
     
     return message, InlineKeyboardMarkup(keyboard)
 
-async def get_blacklist_keyboard_detailed(page: int = 1, per_page: int = 5):
+async def get_blacklist_keyboard_detailed(page: int = 1, per_page: int = 5, cursor: str = None, backward: bool = False):
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     total_count = await db.get_blacklist_count()
@@ -242,20 +204,13 @@ async def get_blacklist_keyboard_detailed(page: int = 1, per_page: int = 5):
     if total_count == 0:
         return "黑名单中没有用户。", None
 
-    total_pages = (total_count + per_page - 1) // per_page
-
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-
-    offset = (page - 1) * per_page
-
-    blacklist_users = await db.get_blacklist_paginated(limit=per_page, offset=offset)
+    blacklist_users, page, has_prev, has_next = await load_page(db.get_blacklist_paginated, per_page, page, cursor, backward)
     
     if not blacklist_users:
         return "黑名单中没有用户。", None
 
+    total_pages = max((total_count + per_page - 1) // per_page, page)
+
     keyboard = []
     message = f"黑名单用户列表 (第 {page}/{total_pages} 页)\n\n"
     
@@ -317,10 +272,10 @@ async def get_blacklist_keyboard_detailed(page: int = 1, per_page: int = 5):
         ])
     
     navigation_buttons = []
-    if page > 1:
-        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=f"stats_list_blacklist_page_{page - 1}"))
-    if page < total_pages:
-        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=f"stats_list_blacklist_page_{page + 1}"))
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=page_callback("stats_list_blacklist_page_", page - 1, blacklist_users[0], 'blocked_at', 'user_id', backward=True)))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=page_callback("stats_list_blacklist_page_", page + 1, blacklist_users[-1], 'blocked_at', 'user_id')))
     
     back_button = [InlineKeyboardButton("返回统计菜单", callback_data="stats_back_to_menu")]
     keyboard.append(back_button)
@@ -333,7 +288,7 @@ async def get_blacklist_keyboard_detailed(page: int = 1, per_page: int = 5):
     
     return message, InlineKeyboardMarkup(keyboard)
 
-async def get_exemptions_keyboard(page: int = 1, per_page: int = 5):
+async def get_exemptions_keyboard(page: int = 1, per_page: int = 5, cursor: str = None, backward: bool = False):
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     from datetime import datetime, timezone
     
@@ -342,20 +297,13 @@ async def get_exemptions_keyboard(page: int = 1, per_page: int = 5):
     if total_count == 0:
         return "豁免名单中没有用户。", None
 
-    total_pages = (total_count + per_page - 1) // per_page
-
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-
-    offset = (page - 1) * per_page
-
-    exemptions = await db.get_exemptions_paginated(limit=per_page, offset=offset)
+    exemptions, page, has_prev, has_next = await load_page(db.get_exemptions_paginated, per_page, page, cursor, backward)
     
     if not exemptions:
         return "豁免名单中没有用户。", None
 
+    total_pages = max((total_count + per_page - 1) // per_page, page)
+
     keyboard = []
     message = f"豁免名单 (第 {page}/{total_pages} 页)\n\n"
     
@@ -401,10 +349,10 @@ async def get_exemptions_keyboard(page: int = 1, per_page: int = 5):
         ])
     
     navigation_buttons = []
-    if page > 1:
-        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=f"panel_exemptions_page_{page - 1}"))
-    if page < total_pages:
-        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=f"panel_exemptions_page_{page + 1}"))
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton("上一页", callback_data=page_callback("panel_exemptions_page_", page - 1, exemptions[0], 'created_at', 'user_id', backward=True)))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton("下一页", callback_data=page_callback("panel_exemptions_page_", page + 1, exemptions[-1], 'created_at', 'user_id')))
     
     if navigation_buttons:
         keyboard.append(navigation_buttons)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import random
+from collections import deque
+from config import config
+from database.db_manager import db_manager
+from database.write_buffer import write_buffer
+from services.ai_service import ai_service, LOCAL_VERIFICATION_QUESTIONS
+from services.verdict_cache import normalize_text
+
+# 连续多少批没有产出新题目时暂停补充，避免对模型空转
+MAX_EMPTY_BATCHES = 3
+# 最近发出的 N 道题目不会被重新加入题目池
+RECENT_QUESTIONS = 1000
+
+
+def _to_challenge(question: str, correct_answer: str, incorrect_answers: list) -> dict:
+    options = list(incorrect_answers) + [correct_answer]
+    random.shuffle(options)
+    return {
+        "question": question,
+        "correct_answer": correct_answer,
+        "options": options,
+    }
+
+
+class ChallengePool:
+    def __init__(self, low_watermark: int, high_watermark: int, batch_size: int):
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark + 1)
+        self.batch_size = max(1, batch_size)
+        self._items = deque()
+        self._known = set()
+        self._recent = deque()
+        self._local = {normalize_text(item['question']) for item in LOCAL_VERIFICATION_QUESTIONS}
+        self._refill_task = None
+
+        self.served = 0
+        self.fallbacks = 0
+        self.generated = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    async def load(self):
+        async with db_manager.reader() as db:
+            async with db.execute(
+                'SELECT question, correct_answer, incorrect_answers FROM verification_challenges ORDER BY id'
+            ) as cursor:
+                rows = await cursor.fetchall()
+        self._items.clear()
+        for question, correct_answer, incorrect_answers in rows:
+            self._items.append((question, correct_answer, json.loads(incorrect_answers)))
+            self._known.add(normalize_text(question))
+        logging.info(f"验证题目池已加载 {len(self._items)} 道题目。")
+
+    def start(self):
+        if len(self._items) < self.low_watermark:
+            self._ensure_refill()
+
+    async def take(self) -> dict:
+        if not self._items:
+            self._ensure_refill()
+            self.fallbacks += 1
+            question_data = random.choice(LOCAL_VERIFICATION_QUESTIONS)
+            return _to_challenge(
+                question_data['question'],
+                question_data['correct_answer'],
+                question_data['incorrect_answers'],
+            )
+
+        question, correct_answer, incorrect_answers = self._items.popleft()
+        self._recent.append(normalize_text(question))
+        if len(self._recent) > RECENT_QUESTIONS:
+            self._known.discard(self._recent.popleft())
+        write_buffer.enqueue('DELETE FROM verification_challenges WHERE question = ?', (question,))
+        self.served += 1
+        if len(self._items) < self.low_watermark:
+            self._ensure_refill()
+        return _to_challenge(question, correct_answer, incorrect_answers)
+
+    def _ensure_refill(self):
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def _refill(self):
+        empty_batches = 0
+        while len(self._items) < self.high_watermark and empty_batches < MAX_EMPTY_BATCHES:
+            try:
+                batch = await ai_service.generate_verification_batch(self.batch_size)
+                added = await self._add_batch(batch)
+            except Exception as e:
+                logging.error(f"补充验证题目池失败: {e}")
+                added = 0
+            empty_batches = 0 if added else empty_batches + 1
+
+    async def _add_batch(self, batch: list) -> int:
+        rows = []
+        for item in batch:
+            key = normalize_text(item['question'])
+            # 与本地题库或池内已有题目重复的跳过
+            if key in self._known or key in self._local:
+                self.duplicates += 1
+                continue
+            self._known.add(key)
+            rows.append((item['question'], item['correct_answer'], item['incorrect_answers']))
+        if not rows:
+            return 0
+
+        async with db_manager.writer() as db:
+            await db.executemany(
+                'INSERT OR IGNORE INTO verification_challenges (question, correct_answer, incorrect_answers) VALUES (?, ?, ?)',
+                [(question, correct_answer, json.dumps(incorrect_answers, ensure_ascii=False))
+                 for question, correct_answer, incorrect_answers in rows]
+            )
+            await db.commit()
+        self._items.extend(rows)
+        self.generated += len(rows)
+        return len(rows)
+
+    async def close(self):
+        if self._refill_task is not None and not self._refill_task.done():
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "generated": self.generated,
+            "duplicates": self.duplicates,
+        }
+
+
+challenge_pool = ChallengePool(
+    config.CHALLENGE_POOL_LOW_WATERMARK,
+    config.CHALLENGE_POOL_HIGH_WATERMARK,
+    config.CHALLENGE_POOL_BATCH_SIZE,
+)
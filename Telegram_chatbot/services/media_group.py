@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from config import config
+
+# Telegram 单个相册最多 10 条媒体
+MAX_MEDIA_GROUP_SIZE = 10
+
+
+# 同一相册的消息以独立更新陆续到达，先缓存一个短窗口，再合并为一次 sendMediaGroup。
+# owner 标识消息来源（用户或话题），同一 owner 的相册按顺序发送，之后的普通消息需先等待相册发完
+class MediaGroupBuffer:
+    def __init__(self, window_ms: int, max_items: int = MAX_MEDIA_GROUP_SIZE):
+        self.window = max(0, window_ms) / 1000
+        self.max_items = max_items
+        self._groups = {}
+        self._tasks = set()
+        self._last_task = {}
+
+        self.groups_flushed = 0
+        self.items_flushed = 0
+        self.errors = 0
+
+    def add(self, owner, group_id, item, flush):
+        key = (owner, group_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {"items": [], "flush": flush, "timer": None}
+        group["items"].append(item)
+
+        if group["timer"] is not None:
+            group["timer"].cancel()
+        if len(group["items"]) >= self.max_items:
+            self._flush(key)
+        else:
+            group["timer"] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def _flush(self, key):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        if group["timer"] is not None:
+            group["timer"].cancel()
+        self.groups_flushed += 1
+        self.items_flushed += len(group["items"])
+        owner = key[0]
+        task = asyncio.ensure_future(self._send(self._last_task.get(owner), group["flush"], group["items"]))
+        self._last_task[owner] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda task: self._on_done(owner, task))
+
+    async def _send(self, previous, flush, items):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await flush(items)
+
+    def _on_done(self, owner, task):
+        self._tasks.discard(task)
+        if self._last_task.get(owner) is task:
+            del self._last_task[owner]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logging.error(f"相册发送失败: {task.exception()}")
+
+    async def wait_idle(self, owner):
+        # 同一 owner 发来其他消息说明相册已经发完，立即提交缓存中的相册并等待发送结束，保证先后顺序
+        for key in [key for key in self._groups if key[0] == owner]:
+            self._flush(key)
+        task = self._last_task.get(owner)
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def close(self):
+        for key in list(self._groups):
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._groups),
+            "sending": len(self._tasks),
+            "groups": self.groups_flushed,
+            "avg_items": self.items_flushed / self.groups_flushed if self.groups_flushed else 0.0,
+            "errors": self.errors,
+        }
+
+
+media_group_buffer = MediaGroupBuffer(config.MEDIA_GROUP_WINDOW_MS)
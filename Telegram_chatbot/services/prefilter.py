@@ -0,0 +1,193 @@
+import re
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from config import config
+from database import models as db
+from database import settings as db_settings
+from services.verdict_cache import normalize_text
+
+RULE_TYPES = {"keyword": "关键词", "regex": "正则", "domain": "域名"}
+RULE_ACTIONS = {"block": "拦截", "allow": "放行"}
+
+_DOMAIN_RE = re.compile(r'(?:https?://)?((?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,})(?=[/:?#\s]|$)', re.IGNORECASE)
+_INVITE_RE = re.compile(r'(?:t\.me|telegram\.me|telegram\.dog)/(?:joinchat/|\+)[\w-]+|discord(?:\.gg|app\.com/invite)/[\w-]+', re.IGNORECASE)
+_MENTION_RE = re.compile(r'@\w{4,}')
+# 不含任何文字和数字的消息（纯表情、标点）
+_NO_WORDS_RE = re.compile(r'^\W+$')
+_REPEAT_RE = re.compile(r'(.)\1{%d,}' % config.PREFILTER_REPEAT_LIMIT) if config.PREFILTER_REPEAT_LIMIT > 0 else None
+
+
+def _compile_keywords(keywords):
+    if not keywords:
+        return None
+    # 长词优先，避免短词遮盖长词的命中结果
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    return re.compile("|".join(re.escape(keyword) for keyword in ordered))
+
+
+def _extract_domains(text: str, message) -> set:
+    domains = {match.group(1).lower() for match in _DOMAIN_RE.finditer(text)}
+    for entity in (getattr(message, 'entities', None) or ()) + (getattr(message, 'caption_entities', None) or ()):
+        url = getattr(entity, 'url', None)
+        if url:
+            match = _DOMAIN_RE.search(url)
+            if match:
+                domains.add(match.group(1).lower())
+    return domains
+
+
+def _matches_domain(domains: set, rules: set):
+    for domain in domains:
+        parts = domain.split(".")
+        for i in range(len(parts) - 1):
+            candidate = ".".join(parts[i:])
+            if candidate in rules:
+                return candidate
+    return None
+
+
+class PreFilter:
+    def __init__(self):
+        self.rules = []
+        self._keywords = {"block": None, "allow": None}
+        self._regexes = {"block": [], "allow": []}
+        self._domains = {"block": set(), "allow": set()}
+
+        self.decided_spam = 0
+        self.decided_ham = 0
+        self.passed = 0
+        self._total_us = 0.0
+
+    async def load(self):
+        rules = await db.get_prefilter_rules()
+        keywords = {"block": [], "allow": []}
+        regexes = {"block": [], "allow": []}
+        domains = {"block": set(), "allow": set()}
+
+        for rule in rules:
+            action = rule["action"] if rule["action"] in RULE_ACTIONS else "block"
+            pattern = rule["pattern"]
+            if rule["rule_type"] == "keyword":
+                keywords[action].append(normalize_text(pattern))
+            elif rule["rule_type"] == "regex":
+                try:
+                    regexes[action].append((re.compile(pattern, re.IGNORECASE), pattern))
+                except re.error as e:
+                    print(f"本地过滤规则 #{rule['id']} 正则无效，已跳过: {e}")
+            elif rule["rule_type"] == "domain":
+                domains[action].add(pattern.lower().lstrip("."))
+
+        self.rules = rules
+        self._keywords = {action: _compile_keywords(words) for action, words in keywords.items()}
+        self._regexes = regexes
+        self._domains = domains
+
+    def _match(self, action: str, text: str, normalized: str, domains: set):
+        keyword_re = self._keywords[action]
+        if keyword_re is not None:
+            match = keyword_re.search(normalized)
+            if match:
+                return f"命中{RULE_ACTIONS[action]}关键词「{match.group(0)}」"
+        domain = _matches_domain(domains, self._domains[action])
+        if domain:
+            return f"命中{RULE_ACTIONS[action]}域名「{domain}」"
+        for regex, pattern in self._regexes[action]:
+            if regex.search(text):
+                return f"命中{RULE_ACTIONS[action]}正则「{pattern}」"
+        return None
+
+    def _evaluate(self, message):
+        text = getattr(message, 'text', None) or getattr(message, 'caption', None) or ""
+        normalized = normalize_text(text)
+        domains = _extract_domains(text, message)
+
+        # 拦截规则优先，避免夹带放行域名绕过拦截
+        reason = self._match("block", text, normalized, domains)
+        if reason:
+            return {"is_spam": True, "reason": reason}
+        reason = self._match("allow", text, normalized, domains)
+        if reason:
+            return {"is_spam": False, "reason": reason}
+
+        if not db_settings.get_bool('prefilter_heuristics_enabled', True):
+            return None
+
+        # 内置规则只负责放行明显无害的内容；邀请链接、重复字符等可疑特征交给 AI 判断，
+        # 直接拦截仅限管理员配置的规则
+        if _INVITE_RE.search(text) or (_REPEAT_RE is not None and _REPEAT_RE.search(normalized)):
+            return None
+
+        has_media = bool(getattr(message, 'photo', None) or getattr(message, 'sticker', None))
+        if has_media or domains or _MENTION_RE.search(text):
+            return None
+        if _NO_WORDS_RE.match(normalized):
+            return {"is_spam": False, "reason": "纯表情或符号内容"}
+        if 0 < len(normalized) <= config.PREFILTER_HAM_MAX_LENGTH:
+            return {"is_spam": False, "reason": "短文本"}
+        return None
+
+    def evaluate(self, message):
+        if not db_settings.get_bool('prefilter_enabled', True):
+            return None
+
+        started = time.perf_counter()
+        verdict = self._evaluate(message)
+        self._total_us += (time.perf_counter() - started) * 1_000_000
+
+        if verdict is None:
+            self.passed += 1
+            return None
+        if verdict["is_spam"]:
+            self.decided_spam += 1
+        else:
+            self.decided_ham += 1
+        verdict["stage"] = "prefilter"
+        return verdict
+
+    def stats(self) -> dict:
+        total = self.decided_spam + self.decided_ham + self.passed
+        return {
+            "rules": len(self.rules),
+            "decided_spam": self.decided_spam,
+            "decided_ham": self.decided_ham,
+            "passed": self.passed,
+            "decided_ratio": (self.decided_spam + self.decided_ham) / total if total else 0.0,
+            "avg_us": self._total_us / total if total else 0.0,
+        }
+
+
+def build_prefilter_panel():
+    enabled = db_settings.get_bool('prefilter_enabled', True)
+    heuristics = db_settings.get_bool('prefilter_heuristics_enabled', True)
+    lines = [
+        "本地过滤规则",
+        "",
+        f"本地过滤: {'已启用' if enabled else '已禁用'}",
+        f"内置启发式规则: {'已启用' if heuristics else '已禁用'}（纯表情放行；邀请链接、重复字符转交 AI）",
+        "",
+    ]
+    if prefilter.rules:
+        for rule in prefilter.rules:
+            lines.append(
+                f"#{rule['id']} [{RULE_ACTIONS.get(rule['action'], rule['action'])}]"
+                f" {RULE_TYPES.get(rule['rule_type'], rule['rule_type'])}: {rule['pattern']}"
+            )
+    else:
+        lines.append("暂无自定义规则。")
+    lines.extend([
+        "",
+        "添加规则: /prefilter add <keyword|regex|domain> <block|allow> <内容>",
+        "删除规则: /prefilter delete <ID>",
+    ])
+
+    keyboard = [
+        [
+            InlineKeyboardButton("关闭本地过滤" if enabled else "开启本地过滤", callback_data="prefilter_toggle_enabled"),
+            InlineKeyboardButton("关闭启发式" if heuristics else "开启启发式", callback_data="prefilter_toggle_heuristics"),
+        ],
+        [InlineKeyboardButton("返回主面板", callback_data="panel_back")],
+    ]
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+prefilter = PreFilter()
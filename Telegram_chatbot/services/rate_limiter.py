@@ -1,40 +1,109 @@
-import asyncio
 import time
-from collections import defaultdict, deque
 from config import config
 
+
+# GCRA 限流：每个 key 只保存一个理论到达时间（TAT），内存占用与速率上限无关
+class GCRALimiter:
+    def __init__(self, limit: int, period: float, shards: int = 64):
+        self.limit = limit
+        self.period = period
+        self.emission_interval = period / limit if limit > 0 else 0.0
+        # 允许在一个周期内突发 limit 条
+        self.burst_tolerance = period - self.emission_interval
+        self._shards = [{} for _ in range(max(1, shards))]
+        self._next_shard = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def _shard(self, key) -> dict:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, key, now: float = None) -> bool:
+        if not self.enabled:
+            return True
+        now = time.monotonic() if now is None else now
+        shard = self._shard(key)
+        tat = max(shard.get(key, now), now)
+        if tat - now > self.burst_tolerance:
+            return False
+        shard[key] = tat + self.emission_interval
+        return True
+
+    def forget(self, key):
+        self._shard(key).pop(key, None)
+
+    def sweep(self, now: float = None, shards: int = 1) -> int:
+        # TAT 已过去的 key 与从未出现过的 key 完全等价，可以直接删除；每次只清理若干分片，避免单次停顿过长
+        now = time.monotonic() if now is None else now
+        removed = 0
+        for _ in range(min(shards, len(self._shards))):
+            shard = self._shards[self._next_shard]
+            self._next_shard = (self._next_shard + 1) % len(self._shards)
+            idle = [key for key, tat in shard.items() if tat <= now]
+            for key in idle:
+                del shard[key]
+            removed += len(idle)
+        return removed
+
+
 class RateLimiter:
     def __init__(self):
-        self.user_message_timestamps = defaultdict(lambda: deque())
         self.max_messages_per_minute = config.MAX_MESSAGES_PER_MINUTE
-        self.user_warnings = {}
-        self.lock = asyncio.Lock()
-    
+        self.user_limiter = GCRALimiter(config.MAX_MESSAGES_PER_MINUTE, 60.0, config.RATE_LIMIT_SHARDS)
+        self.global_limiter = GCRALimiter(config.RATE_LIMIT_GLOBAL_PER_MINUTE, 60.0, 1)
+        # 全局限流提示：每个用户每分钟最多一次，避免高峰期回复本身把发送额度耗尽
+        self.global_notices = GCRALimiter(1, 60.0, config.RATE_LIMIT_SHARDS)
+        self.user_warnings = set()
+        self.evicted = 0
+        # 每次清理的分片数，保证大约一分钟轮完所有分片
+        shards = config.RATE_LIMIT_SHARDS
+        self.sweep_shards = max(1, -(-shards * config.RATE_LIMIT_SWEEP_INTERVAL // 60))
+
     async def check_user_rate_limit(self, user_id: int) -> tuple[bool, bool]:
-        async with self.lock:
-            now = time.time()
-            timestamps = self.user_message_timestamps[user_id]
-            while timestamps and timestamps[0] < now - 60.0:
-                timestamps.popleft()
-            is_over_limit = len(timestamps) >= self.max_messages_per_minute
-            if is_over_limit:
-                was_warned = self.user_warnings.get(user_id, False)
-                return True, was_warned
-            else:
-                timestamps.append(now)
-                if user_id in self.user_warnings:
-                    del self.user_warnings[user_id]
-                return False, False
-    
+        # 单事件循环内没有 await 点，检查与更新天然是原子的，不需要加锁
+        if not self.user_limiter.hit(user_id):
+            return True, user_id in self.user_warnings
+        self.user_warnings.discard(user_id)
+        return False, False
+
+    def check_global_rate_limit(self) -> bool:
+        return not self.global_limiter.hit(None)
+
+    def should_notify_global_limit(self, user_id: int) -> bool:
+        return self.global_notices.hit(user_id)
+
     async def mark_user_warned(self, user_id: int):
-        async with self.lock:
-            self.user_warnings[user_id] = True
-    
+        self.user_warnings.add(user_id)
+
     async def clear_user_warning(self, user_id: int):
-        async with self.lock:
-            if user_id in self.user_warnings:
-                del self.user_warnings[user_id]
-            if user_id in self.user_message_timestamps:
-                del self.user_message_timestamps[user_id]
+        self.user_warnings.discard(user_id)
+        self.user_limiter.forget(user_id)
+
+    def sweep_idle(self, now: float = None, shards: int = None) -> int:
+        now = time.monotonic() if now is None else now
+        removed = self.user_limiter.sweep(now, shards or self.sweep_shards)
+        self.global_notices.sweep(now, shards or self.sweep_shards)
+        if self.user_warnings:
+            # 计数已清空的用户下一条消息必然放行并清除警告，这里提前释放
+            self.user_warnings = {user_id for user_id in self.user_warnings
+                                  if user_id in self.user_limiter}
+        self.evicted += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "tracked_users": len(self.user_limiter),
+            "warned_users": len(self.user_warnings),
+            "evicted": self.evicted,
+        }
+
 
 rate_limiter = RateLimiter()
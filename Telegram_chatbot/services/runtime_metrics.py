@@ -0,0 +1,71 @@
+from database.write_buffer import write_buffer
+from database.user_cache import user_cache
+from database.row_counts import row_counts
+from services.verdict_cache import verdict_cache
+from services.prefilter import prefilter
+from services.ai_service import ai_service
+from services.challenge_pool import challenge_pool
+from services.session_store import session_store
+from services.rate_limiter import rate_limiter
+from services.topic_health import topic_health
+from services.send_scheduler import outbound_scheduler
+from services.update_processor import update_processor
+from services.media_group import media_group_buffer
+from utils.media_converter import image_prep_stats
+from services.autoreply_cache import autoreply_cache
+
+
+def build_runtime_metrics_text() -> str:
+    buffer_stats = write_buffer.stats()
+    cache_stats = user_cache.stats()
+    verdict_stats = verdict_cache.stats()
+    prefilter_stats = prefilter.stats()
+    ai_stats = ai_service.scheduler_stats()
+    pool_stats = challenge_pool.stats()
+    session_stats = session_store.stats()
+    limiter_stats = rate_limiter.stats()
+    topic_stats = topic_health.stats()
+    send_stats = outbound_scheduler.stats()
+    update_stats = update_processor.stats()
+    album_stats = media_group_buffer.stats()
+    image_stats = image_prep_stats()
+    autoreply_stats = autoreply_cache.stats()
+    count_stats = row_counts.stats()
+    lines = [
+        "运行指标",
+        f"写入队列积压: {buffer_stats['queue_depth']} 条",
+        f"批量刷盘: {buffer_stats['flush_count']} 次 / {buffer_stats['flushed_rows']} 条"
+        f" (合并 {buffer_stats['coalesced_rows']} 条, 失败 {buffer_stats['failed_flushes']} 次, 丢弃 {buffer_stats['dropped_rows']} 条)",
+        f"刷盘耗时: 平均 {buffer_stats['avg_flush_ms']:.1f} ms, 最大 {buffer_stats['max_flush_ms']:.1f} ms",
+        f"用户状态缓存: {cache_stats['size']} 个用户, 命中率 {cache_stats['hit_ratio']:.1%}"
+        f" ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})",
+        f"本地预过滤: 直接判定 {prefilter_stats['decided_ratio']:.1%}"
+        f" (拦截 {prefilter_stats['decided_spam']}, 放行 {prefilter_stats['decided_ham']}, 转交 AI {prefilter_stats['passed']}),"
+        f" 平均 {prefilter_stats['avg_us']:.1f} µs",
+        f"AI 审查缓存: 命中率 {verdict_stats['hit_ratio']:.1%}"
+        f" (内存 {verdict_stats['memory_hits']}, 数据库 {verdict_stats['db_hits']}, 未命中 {verdict_stats['misses']})",
+        f"AI 调用: 进行中 {ai_stats['active']}, 排队 {ai_stats['queued']}, 已放行 {ai_stats['admitted']},"
+        f" 合并 {ai_stats['coalesced']}, 拒绝 {ai_stats['rejected'] + ai_stats['timed_out']}",
+        f"AI 排队等待: 平均 {ai_stats['avg_wait_ms']:.1f} ms, 最大 {ai_stats['max_wait_ms']:.1f} ms",
+        f"验证题目池: 剩余 {pool_stats['size']} 道, 已发放 {pool_stats['served']}, 本地兜底 {pool_stats['fallbacks']},"
+        f" 已生成 {pool_stats['generated']} (去重 {pool_stats['duplicates']})",
+        f"验证会话: 进行中 {session_stats['size']}, 已过期 {session_stats['expired']}, 超限淘汰 {session_stats['evicted']},"
+        f" 启动恢复 {session_stats['restored']}",
+        f"限流状态: 跟踪 {limiter_stats['tracked_users']} 个用户, 已警告 {limiter_stats['warned_users']},"
+        f" 空闲清理 {limiter_stats['evicted']}",
+        f"话题探测缓存: {topic_stats['size']} 个话题, 免探测 {topic_stats['hit_ratio']:.1%}"
+        f" ({topic_stats['hits']}/{topic_stats['hits'] + topic_stats['misses']}), 失效 {topic_stats['invalidations']}",
+        f"更新处理: 进行中 {update_stats['active']}, 排队 {update_stats['pending'] - update_stats['active']},"
+        f" 已处理 {update_stats['processed']}, 丢弃 {update_stats['dropped']}, 平均等待 {update_stats['avg_wait_ms']:.0f} ms",
+        f"出站发送: 已发送 {send_stats['sent']}, 排队 {send_stats['queued']}, 限速等待 {send_stats['throttled']} 次"
+        f" (平均 {send_stats['avg_wait_ms']:.0f} ms, 最大 {send_stats['max_wait_ms']:.0f} ms), RetryAfter {send_stats['retry_after']} 次,"
+        f" 放弃 {send_stats['rejected']} 次",
+        f"相册聚合: 已发送 {album_stats['groups']} 组 (平均 {album_stats['avg_items']:.1f} 条), 等待中 {album_stats['pending']},"
+        f" 失败 {album_stats['errors']}",
+        f"审查图片预处理: {image_stats['count']} 张, 平均 {image_stats['avg_in_kb']:.0f} KB → {image_stats['avg_out_kb']:.0f} KB,"
+        f" 耗时 {image_stats['avg_ms']:.1f} ms",
+        f"自动回复缓存: {autoreply_stats['size']} 条, 命中率 {autoreply_stats['hit_ratio']:.1%}"
+        f" ({autoreply_stats['hits']}/{autoreply_stats['hits'] + autoreply_stats['misses']}), 知识库版本 {autoreply_stats['kb_version']}",
+        f"列表总数缓存: {count_stats['cached']} 张表, 累计 COUNT 查询 {count_stats['queries']} 次",
+    ]
+    return "\n".join(lines)
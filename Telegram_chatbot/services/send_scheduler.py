@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+from config import config
+from rss.retry_utils import retry_after_seconds
+from utils.token_bucket import TokenBucket
+
+# 数值越小越先发送；未指定 rate_limit_args 的请求按用户消息转发处理
+PRIORITY_ADMIN_REPLY = 0
+PRIORITY_USER_FORWARD = 1
+PRIORITY_RSS = 2
+PRIORITY_SPINNER = 3
+
+# 只有发送/编辑消息的接口受洪水限制，其余接口（回调应答、删除消息等）直接放行
+THROTTLED_ENDPOINT_PREFIXES = ("send", "copy", "forward", "edit")
+MAX_GROUP_BUCKETS = 1000
+
+
+class SendRejected(TelegramError):
+    # 发送队列已满或排队超时，请求没有发出
+    pass
+
+
+def _is_group_chat(chat_id) -> bool:
+    if isinstance(chat_id, str):
+        if chat_id.startswith("@"):
+            return True
+        try:
+            chat_id = int(chat_id)
+        except ValueError:
+            return False
+    return isinstance(chat_id, int) and chat_id < 0
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    def __init__(self, global_per_second: int, group_per_minute: int, max_retries: int,
+                 forum_group_id=None, forum_group_per_minute: int = None, max_queue: int = 0, max_wait: dict = None):
+        self.global_per_second = global_per_second
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.forum_group_id = str(forum_group_id) if forum_group_id is not None else None
+        self.forum_group_per_minute = group_per_minute if forum_group_per_minute is None else forum_group_per_minute
+        # max_queue 为每个优先级的排队上限（0 表示不限制）；max_wait 为各优先级最长排队秒数
+        self.max_queue = max_queue
+        self.max_wait = max_wait or {}
+        self._global = TokenBucket(global_per_second, 1) if global_per_second > 0 else None
+        self._groups = OrderedDict()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._paused_until = 0.0
+
+        self.sent = 0
+        self.throttled = 0
+        self.retry_after = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+    def _group_bucket(self, chat_id):
+        if not _is_group_chat(chat_id):
+            return None
+        key = str(chat_id)
+        per_minute = self.forum_group_per_minute if key == self.forum_group_id else self.group_per_minute
+        if per_minute <= 0:
+            return None
+        bucket = self._groups.get(key)
+        if bucket is None:
+            bucket = TokenBucket(per_minute, 60)
+            self._groups[key] = bucket
+            # 长时间未发送的群组令牌桶早已回满，淘汰后重建等价
+            while len(self._groups) > MAX_GROUP_BUCKETS:
+                self._groups.popitem(last=False)
+        else:
+            self._groups.move_to_end(key)
+        return bucket
+
+    def _delay_for(self, bucket) -> float:
+        delay = self._paused_until - time.monotonic()
+        if self._global is not None:
+            delay = max(delay, self._global.delay_for(1))
+        if bucket is not None:
+            delay = max(delay, bucket.delay_for(1))
+        return delay
+
+    def _consume(self, bucket):
+        if self._global is not None:
+            self._global.consume(1)
+        if bucket is not None:
+            bucket.consume(1)
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        waiting = []
+        next_delay = None
+        self._waiters.sort()
+        for index, entry in enumerate(self._waiters):
+            _, _, chat_id, future = entry
+            if future.done():
+                continue
+            bucket = self._group_bucket(chat_id)
+            delay = self._delay_for(bucket)
+            if delay <= 0:
+                self._consume(bucket)
+                future.set_result(None)
+                continue
+
+            waiting.append(entry)
+            next_delay = delay if next_delay is None else min(next_delay, delay)
+            if self._delay_for(None) > 0:
+                # 全局配额耗尽时保持优先级顺序，后面的请求不再插队
+                waiting.extend(item for item in self._waiters[index + 1:] if not item[3].done())
+                break
+
+        self._waiters = waiting
+        if waiting:
+            self._wakeup = asyncio.get_running_loop().call_later(next_delay, self._dispatch)
+
+    async def _acquire(self, priority: int, chat_id):
+        bucket = self._group_bucket(chat_id)
+        if not self._waiters and self._delay_for(bucket) <= 0:
+            self._consume(bucket)
+            return
+
+        if self.max_queue > 0:
+            queued = sum(1 for entry in self._waiters if entry[0] == priority and not entry[3].done())
+            if queued >= self.max_queue:
+                self.rejected += 1
+                raise SendRejected("发送队列已满")
+
+        self.throttled += 1
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((priority, next(self._seq), chat_id, future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait.get(priority) or None)
+        except asyncio.TimeoutError:
+            # 超时的 future 已被取消，_dispatch 会跳过它
+            self.timed_out += 1
+            raise SendRejected("发送排队超时")
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else PRIORITY_USER_FORWARD
+        throttled = endpoint.startswith(THROTTLED_ENDPOINT_PREFIXES)
+        chat_id = data.get("chat_id")
+
+        for attempt in range(self.max_retries + 1):
+            if throttled:
+                await self._acquire(priority, chat_id)
+            else:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                self.retry_after += 1
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(exc)
+                logging.warning(f"{endpoint} 触发 Telegram 限流，暂停发送 {delay} 秒后重试 (尝试 {attempt + 1}/{self.max_retries})")
+                # 限流期间暂停所有发送，避免其他请求继续触发 RetryAfter
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                continue
+
+            if throttled:
+                self.sent += 1
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "retry_after": self.retry_after,
+            "rejected": self.rejected + self.timed_out,
+            "avg_wait_ms": self._total_wait_ms / self.throttled if self.throttled else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+
+outbound_scheduler = OutboundScheduler(
+    config.SEND_GLOBAL_PER_SECOND,
+    config.SEND_GROUP_PER_MINUTE,
+    config.SEND_MAX_RETRIES,
+    forum_group_id=config.FORUM_GROUP_ID,
+    forum_group_per_minute=config.SEND_FORUM_GROUP_PER_MINUTE,
+    max_queue=config.SEND_MAX_QUEUE,
+    max_wait={
+        PRIORITY_ADMIN_REPLY: config.SEND_MAX_WAIT,
+        PRIORITY_USER_FORWARD: config.SEND_MAX_WAIT,
+        PRIORITY_RSS: config.SEND_RSS_MAX_WAIT,
+        PRIORITY_SPINNER: config.SEND_MAX_WAIT,
+    },
+)
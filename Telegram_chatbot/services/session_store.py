@@ -0,0 +1,159 @@
+import heapq
+import json
+import logging
+import time
+from config import config
+from database.db_manager import db_manager
+from database.write_buffer import write_buffer
+
+
+class SessionStore:
+    def __init__(self, timeout: int, max_entries: int):
+        self.timeout = timeout
+        self.max_entries = max(1, max_entries)
+        self._sessions = {}
+        # (expires_at, user_id)，会话被替换后旧条目留在堆中，清理时按 expires_at 比对跳过
+        self._expiry_heap = []
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.restored = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def load(self):
+        now = time.time()
+        async with db_manager.writer() as db:
+            await db.execute('DELETE FROM verification_sessions WHERE expires_at <= ?', (now,))
+            await db.commit()
+        async with db_manager.reader() as db:
+            async with db.execute(
+                'SELECT user_id, kind, question, answer, options, attempts, created_at, expires_at '
+                'FROM verification_sessions ORDER BY expires_at'
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+        self._sessions.clear()
+        self._expiry_heap = []
+        for user_id, kind, question, answer, options, attempts, created_at, expires_at in rows:
+            try:
+                options = json.loads(options) if options else []
+                created_at = float(created_at)
+                expires_at = float(expires_at)
+            except (TypeError, ValueError):
+                continue
+            if not options:
+                continue
+            self._sessions[user_id] = {
+                'kind': kind,
+                'question': question,
+                'answer': answer,
+                'options': options,
+                'attempts': attempts or 0,
+                'created_at': created_at,
+                'expires_at': expires_at,
+            }
+            self._expiry_heap.append((expires_at, user_id))
+        heapq.heapify(self._expiry_heap)
+        self.restored = len(self._sessions)
+        logging.info(f"已恢复 {self.restored} 个未完成的验证会话。")
+
+    def get(self, user_id: int, kind: str):
+        session = self._sessions.get(user_id)
+        if session is None or session['kind'] != kind:
+            return None
+        if session['expires_at'] <= time.time():
+            self._remove(user_id)
+            self.expired += 1
+            return None
+        return session
+
+    def put(self, user_id: int, kind: str, question: str, answer: str, options: list, attempts: int = 0):
+        now = time.time()
+        session = {
+            'kind': kind,
+            'question': question,
+            'answer': answer,
+            'options': options,
+            'attempts': attempts,
+            'created_at': now,
+            'expires_at': now + self.timeout,
+        }
+        self._sessions[user_id] = session
+        heapq.heappush(self._expiry_heap, (session['expires_at'], user_id))
+        self.created += 1
+        self._persist(user_id, session)
+
+        if len(self._sessions) > self.max_entries:
+            self._evict()
+        # 同一用户反复换题会在堆中留下过期条目，过多时重建
+        if len(self._expiry_heap) > 2 * len(self._sessions) + 1024:
+            self._rebuild_heap()
+        return session
+
+    def pop(self, user_id: int, kind: str):
+        session = self._sessions.get(user_id)
+        if session is None or session['kind'] != kind:
+            return None
+        self._remove(user_id)
+        return session
+
+    def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, user_id = heapq.heappop(self._expiry_heap)
+            session = self._sessions.get(user_id)
+            if session is not None and session['expires_at'] == expires_at:
+                del self._sessions[user_id]
+                removed += 1
+        if removed:
+            self.expired += removed
+            write_buffer.enqueue('DELETE FROM verification_sessions WHERE expires_at <= ?', (now,))
+        return removed
+
+    def _evict(self):
+        # 超出上限时淘汰最早到期的会话
+        while len(self._sessions) > self.max_entries and self._expiry_heap:
+            expires_at, user_id = heapq.heappop(self._expiry_heap)
+            session = self._sessions.get(user_id)
+            if session is not None and session['expires_at'] == expires_at:
+                self._remove(user_id)
+                self.evicted += 1
+
+    def _rebuild_heap(self):
+        self._expiry_heap = [(session['expires_at'], user_id) for user_id, session in self._sessions.items()]
+        heapq.heapify(self._expiry_heap)
+
+    def _remove(self, user_id: int):
+        self._sessions.pop(user_id, None)
+        write_buffer.enqueue(
+            'DELETE FROM verification_sessions WHERE user_id = ?', (user_id,),
+            key=('verification_session', user_id)
+        )
+
+    def _persist(self, user_id: int, session: dict):
+        write_buffer.enqueue(
+            'INSERT OR REPLACE INTO verification_sessions '
+            '(user_id, kind, question, answer, options, attempts, created_at, expires_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (user_id, session['kind'], session['question'], session['answer'],
+             json.dumps(session['options'], ensure_ascii=False), session['attempts'],
+             session['created_at'], session['expires_at']),
+            key=('verification_session', user_id)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._sessions),
+            "heap_size": len(self._expiry_heap),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "restored": self.restored,
+        }
+
+
+session_store = SessionStore(config.VERIFICATION_TIMEOUT, config.VERIFICATION_SESSION_MAX_ENTRIES)
@@ -37,6 +37,8 @@ ADMIN_PRIVATE_COMMANDS: tuple[CommandSpec, ...] = (
     ("view_filtered", "查看拦截消息"),
     ("autoreply", "管理自动回复"),
     ("exempt", "管理用户豁免"),
+    ("prefilter", "管理本地过滤规则"),
+    ("search", "搜索消息记录"),
 )
 
 RSS_PRIVATE_COMMANDS: tuple[CommandSpec, ...] = (
@@ -73,6 +75,8 @@ ADMIN_GROUP_COMMANDS: tuple[CommandSpec, ...] = (
     ("view_filtered", "查看拦截消息"),
     ("autoreply", "管理自动回复"),
     ("exempt", "管理用户豁免"),
+    ("prefilter", "管理本地过滤规则"),
+    ("search", "搜索消息记录"),
 )
 
 
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -7,6 +8,7 @@ from telegram.helpers import escape_markdown
 
 from config import config
 from database import models as db
+from services.topic_health import topic_health
 
 
 def build_direct_contact_url(username: str | None) -> str | None:
@@ -34,13 +36,31 @@ def build_user_info_markdown(user) -> str:
     )
 
 
-async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE) -> tuple[int, bool]:
+# 正在创建话题的用户，同一用户的并发调用等待同一个创建任务，避免重复建话题
+_creating_threads = {}
+
+
+async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, forward=None) -> tuple[int, bool]:
     user = update.effective_user
-    user_data = await db.get_user(user.id)
+    thread_id = await db.get_user_thread_id(user.id)
+
+    if thread_id:
+        return thread_id, False
+
+    task = _creating_threads.get(user.id)
+    if task is not None:
+        # 话题由先到的调用创建，并已转发它自己的消息；本次调用的消息仍需由调用方转发
+        return await asyncio.shield(task), False
 
-    if user_data and user_data.get('thread_id'):
-        return user_data['thread_id'], False
+    task = asyncio.ensure_future(_create_thread(update, context, forward))
+    _creating_threads[user.id] = task
+    task.add_done_callback(lambda _: _creating_threads.pop(user.id, None))
+    thread_id = await asyncio.shield(task)
+    return thread_id, thread_id is not None
 
+
+async def _create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, forward=None):
+    user = update.effective_user
     topic_name = f"{user.first_name} (ID: {user.id})"
     try:
         topic = await context.bot.create_forum_topic(
@@ -48,6 +68,7 @@ async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYP
             name=topic_name
         )
         thread_id = topic.message_thread_id
+        topic_health.mark_alive(thread_id)
 
         await db.update_user_thread_id(user.id, thread_id)
 
@@ -56,13 +77,17 @@ async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYP
         except Exception as e:
             print(f"发送用户信息卡片失败: {e}")
 
-        from handlers.user_handler import _resend_message
-        await _resend_message(update, context, thread_id)
+        # 默认转发触发创建的这条消息；相册由调用方传入整组转发
+        if forward is None:
+            from handlers.user_handler import _forward_user_message
+            await _forward_user_message(update, context, thread_id)
+        else:
+            await forward(thread_id)
 
-        return thread_id, True
+        return thread_id
     except Exception as e:
         print(f"创建话题失败: {e}")
-        return None, False
+        return None
 
 
 async def build_user_info_card_keyboard(
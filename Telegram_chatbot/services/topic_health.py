@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+from config import config
+
+
+class TopicHealthCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        # thread_id -> 最近一次确认话题存在的时间
+        self._alive = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def is_alive(self, thread_id: int) -> bool:
+        confirmed_at = self._alive.get(thread_id)
+        if confirmed_at is not None and time.monotonic() - confirmed_at < self.ttl:
+            self._alive.move_to_end(thread_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def mark_alive(self, thread_id: int):
+        if self.ttl <= 0:
+            return
+        self._alive[thread_id] = time.monotonic()
+        self._alive.move_to_end(thread_id)
+        while len(self._alive) > self.max_size:
+            self._alive.popitem(last=False)
+
+    def invalidate(self, thread_id: int):
+        if self._alive.pop(thread_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._alive),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+topic_health = TopicHealthCache(config.TOPIC_HEALTH_CACHE_MAX_SIZE, config.TOPIC_HEALTH_TTL)
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import sys
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import config
+
+
+def _ordering_key(update):
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    message = update.effective_message
+    # 管理群组内按话题串行，同一话题的回复保持顺序
+    if chat is not None and chat.id == config.FORUM_GROUP_ID and message is not None and message.message_thread_id:
+        return ("thread", message.message_thread_id)
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+# 不同用户的更新并发处理，同一用户（或同一话题）的更新按到达顺序串行处理
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_workers: int, max_queue: int, queue_timeout: float):
+        # PTB 自带的信号量在排队之前获取，不能带超时，这里放开交给下面的槽位控制
+        super().__init__(sys.maxsize)
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._slots = None
+        self._workers = None
+        self._tails = {}
+        self._active = 0
+
+        self.processed = 0
+        self.dropped = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        self._workers = asyncio.Semaphore(self.max_workers)
+
+    async def shutdown(self) -> None:
+        self._tails.clear()
+
+    async def do_process_update(self, update, coroutine) -> None:
+        # 先登记顺序再排队，保证同一 key 的更新按到达顺序执行
+        key = _ordering_key(update)
+        previous = self._tails.get(key) if key is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._tails[key] = done
+
+        try:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                coroutine.close()
+                logging.warning(f"更新队列已满，等待 {self.queue_timeout} 秒后仍无空位，丢弃更新 {getattr(update, 'update_id', None)}")
+                return
+
+            try:
+                if previous is not None:
+                    await previous
+                async with self._workers:
+                    wait_ms = (time.perf_counter() - started) * 1000
+                    self._total_wait_ms += wait_ms
+                    self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+                    self.processed += 1
+                    self._active += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self._active -= 1
+            finally:
+                self._slots.release()
+        finally:
+            if previous is not None and not previous.done():
+                # 被丢弃或取消的更新没有等到前一个更新结束，完成信号要跟随前一个，否则后续更新会越过它并发执行
+                previous.add_done_callback(lambda _: self._release(key, done))
+            else:
+                self._release(key, done)
+
+    def _release(self, key, done):
+        done.set_result(None)
+        if key is not None and self._tails.get(key) is done:
+            del self._tails[key]
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "pending": self.current_concurrent_updates,
+            "keys": len(self._tails),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "avg_wait_ms": self._total_wait_ms / self.processed if self.processed else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+
+update_processor = KeyedUpdateProcessor(config.MAX_WORKERS, config.QUEUE_MAX_SIZE, config.QUEUE_TIMEOUT)
@@ -0,0 +1,151 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from config import config
+from database.db_manager import db_manager
+from database.write_buffer import write_buffer
+from database import settings as db_settings
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 这些结果说明模型没有给出有效判断，不能缓存
+UNCACHEABLE_REASONS = {"Analysis failed", "No content to analyze"}
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def build_cache_key(message, image_bytes: bytes = None):
+    parts = []
+    text = normalize_text(getattr(message, 'text', None))
+    if text:
+        parts.append(f"t:{text}")
+
+    photo = getattr(message, 'photo', None)
+    sticker = getattr(message, 'sticker', None)
+    if photo:
+        parts.append(f"p:{photo[-1].file_unique_id}")
+    elif sticker and not sticker.is_animated and not sticker.is_video:
+        parts.append(f"s:{sticker.file_unique_id}")
+    elif image_bytes:
+        parts.append(f"i:{hashlib.sha256(image_bytes).hexdigest()}")
+
+    if not parts:
+        return None
+
+    # 切换提供商或审查模型后旧结论自然失效
+    provider_type = db_settings.get('ai_provider', 'gemini')
+    model_name = db_settings.get(f'{provider_type}_model_filter', '')
+    parts.insert(0, f"m:{provider_type}/{model_name}")
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+def build_group_cache_key(messages):
+    parts = []
+    for message in messages:
+        caption = normalize_text(getattr(message, 'caption', None))
+        if caption:
+            parts.append(f"t:{caption}")
+        photo = getattr(message, 'photo', None)
+        if photo:
+            parts.append(f"p:{photo[-1].file_unique_id}")
+    if not parts:
+        return None
+
+    provider_type = db_settings.get('ai_provider', 'gemini')
+    model_name = db_settings.get(f'{provider_type}_model_filter', '')
+    parts.insert(0, f"m:{provider_type}/{model_name}/group")
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+class VerdictCache:
+    def __init__(self, max_size: int, ttl: int, max_rows: int):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _remember(self, key: str, is_spam: bool, reason: str, created_at: float):
+        self._entries[key] = (is_spam, reason, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str):
+        if key is None:
+            return None
+
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return {"is_spam": entry[0], "reason": entry[1]}
+            del self._entries[key]
+
+        async with db_manager.reader() as db:
+            async with db.execute(
+                'SELECT is_spam, reason, created_at FROM ai_verdict_cache WHERE cache_key = ? AND created_at > ?',
+                (key, now - self.ttl)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        self._remember(key, bool(row[0]), row[1], row[2])
+        return {"is_spam": bool(row[0]), "reason": row[1]}
+
+    def put(self, key: str, result: dict):
+        if key is None or not isinstance(result, dict) or "is_spam" not in result:
+            return
+        reason = result.get("reason")
+        if result.get("deferred") or reason in UNCACHEABLE_REASONS:
+            return
+
+        is_spam = bool(result.get("is_spam"))
+        created_at = time.time()
+        self._remember(key, is_spam, reason, created_at)
+        write_buffer.enqueue(
+            'INSERT OR REPLACE INTO ai_verdict_cache (cache_key, is_spam, reason, created_at) VALUES (?, ?, ?, ?)',
+            (key, 1 if is_spam else 0, reason, created_at),
+            key=('ai_verdict', key)
+        )
+        self.stores += 1
+
+    async def prune(self):
+        async with db_manager.writer() as db:
+            await db.execute('DELETE FROM ai_verdict_cache WHERE created_at <= ?', (time.time() - self.ttl,))
+            await db.execute('''
+                DELETE FROM ai_verdict_cache
+                WHERE cache_key NOT IN (
+                    SELECT cache_key FROM ai_verdict_cache ORDER BY created_at DESC LIMIT ?
+                )
+            ''', (self.max_rows,))
+            await db.commit()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+
+verdict_cache = VerdictCache(config.VERDICT_CACHE_MAX_SIZE, config.VERDICT_CACHE_TTL, config.VERDICT_CACHE_DB_MAX_ROWS)
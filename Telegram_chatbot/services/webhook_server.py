@@ -0,0 +1,130 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from config import config
+from services.update_processor import update_processor
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# 本地调试：WEBHOOK_ENABLED=true 且 WEBHOOK_URL 留空时不会向 Telegram 注册，可直接投递录制的更新 JSON：
+#   curl -X POST -H 'Content-Type: application/json' -H 'X-Telegram-Bot-Api-Secret-Token: <token>' \
+#        --data @update.json http://127.0.0.1:8443/telegram/webhook
+
+
+class WebhookServer:
+    def __init__(self, app: Application):
+        self.app = app
+        self.draining = False
+        self.received = 0
+        self.rejected = 0
+        self._runner = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if config.WEBHOOK_SECRET_TOKEN:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, config.WEBHOOK_SECRET_TOKEN):
+                self.rejected += 1
+                return web.Response(status=403)
+        # 停机排空期间返回 503，Telegram 会在稍后重新投递
+        if self.draining:
+            return web.Response(status=503)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.app.bot)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            self.rejected += 1
+            logging.warning(f"Webhook 收到无法解析的更新: {e}")
+            return web.Response(status=400)
+
+        await self.app.update_queue.put(update)
+        self.received += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        stats = update_processor.stats()
+        body = {
+            "status": "draining" if self.draining else "ok",
+            "running": self.app.running,
+            "update_queue": self.app.update_queue.qsize(),
+            "updates_active": stats["active"],
+            "updates_pending": stats["pending"],
+            "received": self.received,
+            "rejected": self.rejected,
+        }
+        return web.json_response(body, status=503 if self.draining or not self.app.running else 200)
+
+    def build_app(self) -> web.Application:
+        web_app = web.Application(client_max_size=config.WEBHOOK_MAX_BODY_SIZE)
+        web_app.router.add_post(config.WEBHOOK_PATH, self.handle_update)
+        web_app.router.add_get(config.WEBHOOK_HEALTH_PATH, self.handle_health)
+        return web_app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, config.WEBHOOK_LISTEN, config.WEBHOOK_PORT)
+        await site.start()
+        logging.info(f"Webhook 服务已监听 {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _register_webhook(app: Application):
+    if not config.WEBHOOK_URL:
+        logging.warning("WEBHOOK_URL 未设置，不向 Telegram 注册 Webhook，仅接受本地投递的更新。")
+        return
+    url = config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH
+    await app.bot.set_webhook(
+        url=url,
+        secret_token=config.WEBHOOK_SECRET_TOKEN or None,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logging.info(f"已向 Telegram 注册 Webhook: {url}")
+
+
+async def run_webhook(app: Application):
+    server = WebhookServer(app)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        await _register_webhook(app)
+        await server.start()
+
+        await stop_event.wait()
+
+        # 先拒绝新的更新，再等已接收的更新全部处理完
+        server.draining = True
+        logging.info(
+            f"Webhook 正在停止，等待 {app.update_queue.qsize()} 个排队更新和"
+            f" {update_processor.stats()['pending']} 个进行中的更新处理完成..."
+        )
+    finally:
+        await server.stop()
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    logging.info("Webhook 服务已停止")
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from telegram import Chat, Message
+
+from config import config
+from database.db_manager import db_manager
+from handlers import user_handler
+from services.ai_service import ai_service, AICallScheduler, AISchedulerRejected
+
+
+class BlockingProvider:
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def analyze_message(self, text, images=None):
+        await self.release.wait()
+        return {"is_spam": False, "reason": "内容未发现违规。"}
+
+
+def _message(message_id: int, text: str):
+    return Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=1000, type=Chat.PRIVATE),
+        text=text,
+    )
+
+
+class AIOverloadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        db_manager.db_path = os.path.join(self._tmpdir.name, 'test.db')
+        await db_manager.initialize()
+
+        self.provider = BlockingProvider()
+        self._patches = [
+            mock.patch.object(config, 'ENABLE_AI_FILTER', True),
+            mock.patch.object(ai_service, 'provider', self.provider),
+            mock.patch.object(ai_service, '_retired', []),
+            # 1 个并发、最多 1 个排队：第三个审查请求会被拒绝
+            mock.patch.dict(ai_service._schedulers, {'gemini': AICallScheduler(1, 0, 0, 1, 30)}),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        self.provider.release.set()
+        await asyncio.sleep(0)
+        for patch in reversed(self._patches):
+            patch.stop()
+        await db_manager.close()
+        self._tmpdir.cleanup()
+
+    async def test_rejected_moderation_is_not_forwarded(self):
+        busy = [
+            asyncio.create_task(ai_service.analyze_message(_message(i, f"排队中的消息内容 {i}"), check_cache=False))
+            for i in (1, 2)
+        ]
+        await asyncio.sleep(0)
+
+        analyzing_message = mock.AsyncMock()
+        context = SimpleNamespace(bot=mock.AsyncMock())
+        context.bot.send_message.return_value = analyzing_message
+
+        with mock.patch.object(user_handler.db, 'save_filtered_message') as save_filtered:
+            allowed = await user_handler._screen_message(context, _message(3, "这条消息在审查队列满时到达"), 42)
+
+        self.assertFalse(allowed)
+        save_filtered.assert_not_called()
+        analyzing_message.edit_text.assert_awaited_once()
+        self.assertIn("暂未转发", analyzing_message.edit_text.await_args.args[0])
+        # 只发送了“正在分析”提示，没有向论坛群组转发任何内容
+        forwarded = [call for call in context.bot.send_message.await_args_list if call.kwargs.get("chat_id") == config.FORUM_GROUP_ID]
+        self.assertEqual(forwarded, [])
+
+        self.provider.release.set()
+        results = await asyncio.gather(*busy)
+        self.assertTrue(all(not result.get("deferred") for result in results))
+
+
+class AICallSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_timed_out_waiters_free_queue_slots(self):
+        scheduler = AICallScheduler(1, 0, 0, 2, 0.05)
+        await scheduler.acquire(0, 1)
+        for _ in range(2):
+            with self.assertRaisesRegex(AISchedulerRejected, "超时"):
+                await scheduler.acquire(0, 1)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+        # 超时的请求不再占用排队名额，新的请求可以正常排队并在释放后获得执行
+        waiting = asyncio.create_task(scheduler.acquire(0, 1))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.stats()["queued"], 1)
+        scheduler.release()
+        await waiting
+        self.assertEqual(scheduler.stats()["rejected"], 0)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
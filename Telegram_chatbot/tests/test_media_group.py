@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from services.media_group import MediaGroupBuffer
+
+
+class MediaGroupBufferTest(unittest.IsolatedAsyncioTestCase):
+    async def test_later_message_waits_for_album(self):
+        buffer = MediaGroupBuffer(window_ms=1000)
+        events = []
+
+        async def flush(items):
+            events.append(f"start {items}")
+            await asyncio.sleep(0.05)
+            events.append(f"end {items}")
+
+        buffer.add(1, "album", "photo", flush)
+        # 同一用户随后发来普通消息：相册立即提交，并在其发送完成后才继续
+        await buffer.wait_idle(1)
+        events.append("text")
+        self.assertEqual(events, ["start ['photo']", "end ['photo']", "text"])
+        self.assertEqual(buffer.stats()["sending"], 0)
+
+    async def test_albums_of_same_owner_are_sent_in_order(self):
+        buffer = MediaGroupBuffer(window_ms=0, max_items=1)
+        events = []
+
+        async def slow(items):
+            await asyncio.sleep(0.05)
+            events.append(items[0])
+
+        async def fast(items):
+            events.append(items[0])
+
+        buffer.add(1, "first", "a", slow)
+        buffer.add(1, "second", "b", fast)
+        buffer.add(2, "other", "c", fast)
+        await buffer.close()
+        self.assertEqual(events, ["c", "a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
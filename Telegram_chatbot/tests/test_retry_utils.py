@@ -0,0 +1,41 @@
+import unittest
+
+from telegram.error import NetworkError, RetryAfter
+
+from rss import retry_utils
+from services.send_scheduler import SendRejected
+
+
+class RetryTelegramApiTest(unittest.IsolatedAsyncioTestCase):
+    async def _call(self, errors, **kwargs):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return "ok"
+
+        try:
+            return await retry_utils.retry_telegram_api(send, initial_delay=0, **kwargs), len(calls)
+        except Exception as exc:
+            return exc, len(calls)
+
+    async def test_send_rejected_is_not_retried(self):
+        result, calls = await self._call([SendRejected("发送队列已满")], retry_rate_limit=False)
+        self.assertIsInstance(result, SendRejected)
+        self.assertEqual(calls, 1)
+
+    async def test_retry_after_is_left_to_scheduler(self):
+        result, calls = await self._call([RetryAfter(0)], retry_rate_limit=False)
+        self.assertIsInstance(result, RetryAfter)
+        self.assertEqual(calls, 1)
+
+    async def test_network_errors_are_still_retried(self):
+        result, calls = await self._call([NetworkError("boom")], retry_rate_limit=False)
+        self.assertEqual(result, "ok")
+        self.assertEqual(calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+from services.send_scheduler import OutboundScheduler, SendRejected, PRIORITY_USER_FORWARD
+
+FORUM_GROUP_ID = -100123
+
+
+async def _send():
+    return True
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def _scheduler(self, **kwargs):
+        return OutboundScheduler(0, 20, 0, forum_group_id=FORUM_GROUP_ID, **kwargs)
+
+    async def _request(self, scheduler, chat_id):
+        return await scheduler.process_request(_send, (), {}, "sendMessage", {"chat_id": chat_id}, PRIORITY_USER_FORWARD)
+
+    async def test_forum_group_limit_is_separate(self):
+        scheduler = self._scheduler(forum_group_per_minute=2, max_wait={PRIORITY_USER_FORWARD: 0.05})
+        await self._request(scheduler, FORUM_GROUP_ID)
+        await self._request(scheduler, FORUM_GROUP_ID)
+        with self.assertRaises(SendRejected):
+            await self._request(scheduler, FORUM_GROUP_ID)
+        # 其他群组仍按 SEND_GROUP_PER_MINUTE 计算
+        for _ in range(3):
+            await self._request(scheduler, -100456)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+    async def test_queue_depth_is_bounded(self):
+        scheduler = self._scheduler(forum_group_per_minute=1, max_queue=1)
+        await self._request(scheduler, FORUM_GROUP_ID)
+        waiting = asyncio.create_task(self._request(scheduler, FORUM_GROUP_ID))
+        await asyncio.sleep(0)
+        with self.assertRaises(SendRejected):
+            await self._request(scheduler, FORUM_GROUP_ID)
+        waiting.cancel()
+        await scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
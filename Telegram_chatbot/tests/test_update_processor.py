@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from services.update_processor import KeyedUpdateProcessor
+
+_next_update_id = 0
+
+
+def _update(user_id: int) -> Update:
+    global _next_update_id
+    _next_update_id += 1
+    user = User(user_id, "test", False)
+    message = Message(_next_update_id, datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=user, text="hi")
+    return Update(_next_update_id, message=message)
+
+
+class KeyedUpdateProcessorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_dropped_update_keeps_user_order(self):
+        processor = KeyedUpdateProcessor(max_workers=2, max_queue=0, queue_timeout=0.05)
+        await processor.initialize()
+        events = []
+        release_a = asyncio.Event()
+        release_x = asyncio.Event()
+
+        async def handler(name, release=None):
+            events.append(f"start {name}")
+            if release is not None:
+                await release.wait()
+            events.append(f"end {name}")
+
+        a = asyncio.create_task(processor.do_process_update(_update(1), handler("A", release_a)))
+        x = asyncio.create_task(processor.do_process_update(_update(2), handler("X", release_x)))
+        await asyncio.sleep(0.01)
+        # 两个槽位都被占用，B 等待超时被丢弃
+        await processor.do_process_update(_update(1), handler("B"))
+        self.assertEqual(processor.stats()["dropped"], 1)
+
+        c = asyncio.create_task(processor.do_process_update(_update(1), handler("C")))
+        release_x.set()
+        await x
+        await asyncio.sleep(0.01)
+        self.assertNotIn("start C", events)
+
+        release_a.set()
+        await asyncio.gather(a, c)
+        self.assertLess(events.index("end A"), events.index("start C"))
+        self.assertNotIn("start B", events)
+        self.assertEqual(processor.stats()["keys"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from database import models
+from database.db_manager import db_manager
+from database.row_counts import row_counts
+from database.write_buffer import WriteBehindBuffer
+
+INSERT_MESSAGE = 'INSERT INTO messages (user_id, message_id, content, direction) VALUES (?, ?, ?, ?)'
+
+
+class WriteBufferTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        db_manager.db_path = os.path.join(self._tmpdir.name, 'test.db')
+        await db_manager.initialize()
+
+    async def asyncTearDown(self):
+        await db_manager.close()
+        self._tmpdir.cleanup()
+
+    async def _message_count(self) -> int:
+        async with db_manager.reader() as db:
+            async with db.execute('SELECT COUNT(*) FROM messages') as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def test_poison_row_is_isolated_and_dropped(self):
+        buffer = WriteBehindBuffer(max_batch=100, flush_interval_ms=10, max_pending=100, max_retries=2)
+        buffer._closed = True
+        buffer.enqueue(INSERT_MESSAGE, (1, 1, 'a', 'incoming'))
+        # direction 为 NOT NULL 列
+        buffer.enqueue(INSERT_MESSAGE, (1, 2, 'bad', None))
+        buffer.enqueue(INSERT_MESSAGE, (1, 3, 'b', 'incoming'))
+
+        await buffer.flush()
+        self.assertEqual(await self._message_count(), 2)
+        self.assertEqual(buffer.queue_depth, 1)
+
+        await buffer.flush()
+        self.assertEqual(buffer.queue_depth, 0)
+        self.assertEqual(buffer.dropped_rows, 1)
+        self.assertEqual(buffer.flushed_rows, 2)
+
+    async def test_queue_is_bounded(self):
+        buffer = WriteBehindBuffer(max_batch=2, flush_interval_ms=10, max_pending=3, max_retries=2)
+        buffer._closed = True
+        for i in range(5):
+            buffer.enqueue(INSERT_MESSAGE, (1, i, 'x', 'incoming'))
+        buffer.enqueue('UPDATE users SET last_active = ? WHERE user_id = ?', ('now', 1), key=('touch', 1))
+
+        self.assertEqual(buffer.queue_depth, 3)
+        self.assertEqual(buffer.dropped_rows, 3)
+
+    async def test_dropped_filtered_message_resets_cached_count(self):
+        buffer = WriteBehindBuffer(max_batch=100, flush_interval_ms=10, max_pending=100, max_retries=1)
+        buffer._closed = True
+        await models.add_user(1, 'test', 'Test', None, 'zh')
+        row_counts.invalidate('filtered_messages')
+        self.assertEqual(await models.get_filtered_messages_count(), 0)
+
+        with mock.patch.object(models, 'write_buffer', buffer):
+            await models.save_filtered_message(1, 1, 'spam', '广告')
+            # user_id 为 NOT NULL 列，这条记录最终会被丢弃
+            await models.save_filtered_message(None, 2, 'spam', None)
+        self.assertEqual(await models.get_filtered_messages_count(), 2)
+
+        await buffer.flush()
+        self.assertEqual(buffer.dropped_rows, 1)
+        self.assertEqual(await models.get_filtered_messages_count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
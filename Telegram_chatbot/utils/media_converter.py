@@ -1,14 +1,61 @@
 from PIL import Image
+import asyncio
 import io
+import time
+from config import config
 
-async def sticker_to_image(file: bytes) -> bytes:
+_stats = {"count": 0, "bytes_in": 0, "bytes_out": 0, "total_ms": 0.0}
+
+
+def pick_photo_size(photo_sizes, min_side: int):
+    # Telegram 为同一张图片提供多档尺寸，取长边不小于 min_side 的最小一档，没有则取最大一档
+    for size in sorted(photo_sizes, key=lambda size: size.width * size.height):
+        if max(size.width, size.height) >= min_side:
+            return size
+    return photo_sizes[-1]
+
+def _shrink_image(data: bytes, max_side: int, quality: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as img:
+        # 已经是足够小的 JPEG 时原样使用，不再重新编码
+        if img.format == 'JPEG' and img.mode == 'RGB' and max(img.size) <= max_side:
+            return data
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((max_side, max_side))
+        output_buffer = io.BytesIO()
+        img.save(output_buffer, format='JPEG', quality=quality, optimize=True)
+        return output_buffer.getvalue()
+
+# 统一缩放并压缩为 JPEG，在线程池中执行，避免阻塞事件循环；结果直接交给 AI 提供商使用
+async def prepare_image(data: bytes) -> bytes:
+    started = time.perf_counter()
     try:
-        with Image.open(io.BytesIO(file)) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            output_buffer = io.BytesIO()
-            img.save(output_buffer, format='PNG')
-            return output_buffer.getvalue()
+        result = await asyncio.to_thread(
+            _shrink_image, bytes(data), config.IMAGE_ANALYSIS_MAX_SIDE, config.IMAGE_ANALYSIS_JPEG_QUALITY
+        )
     except Exception as e:
-        print(f"Error converting sticker to image: {e}")
+        print(f"Error preparing image for analysis: {e}")
         return None
+    _stats["count"] += 1
+    _stats["bytes_in"] += len(data)
+    _stats["bytes_out"] += len(result)
+    _stats["total_ms"] += (time.perf_counter() - started) * 1000
+    return result
+
+async def download_photo_for_analysis(photo_sizes) -> bytes:
+    photo_file = await pick_photo_size(photo_sizes, config.IMAGE_ANALYSIS_MAX_SIDE).get_file()
+    buffer = io.BytesIO()
+    await photo_file.download_to_memory(buffer)
+    return await prepare_image(buffer.getvalue())
+
+async def sticker_to_image(file: bytes) -> bytes:
+    return await prepare_image(file)
+
+def image_prep_stats() -> dict:
+    count = _stats["count"]
+    return {
+        "count": count,
+        "avg_in_kb": _stats["bytes_in"] / count / 1024 if count else 0.0,
+        "avg_out_kb": _stats["bytes_out"] / count / 1024 if count else 0.0,
+        "avg_ms": _stats["total_ms"] / count if count else 0.0,
+    }
@@ -1,15 +1,28 @@
-from telegram import Update
+from telegram import Update, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
 from telegram.ext import ContextTypes
 from config import config
 
-async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_web_page_preview=False):
+MEDIA_ATTRIBUTES = ("photo", "animation", "video", "document", "audio", "voice", "video_note", "sticker")
+
+def get_media_info(message):
+    for media_type in MEDIA_ATTRIBUTES:
+        media = getattr(message, media_type, None)
+        if not media:
+            continue
+        if media_type == "photo":
+            return media_type, media[-1].file_id
+        return media_type, media.file_id
+    return None, None
+
+async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_web_page_preview=False, rate_limit_args=None):
     if message.text:
         return await bot.send_message(
             chat_id=chat_id,
             text=message.text,
             entities=message.entities,
             message_thread_id=thread_id,
-            disable_web_page_preview=disable_web_page_preview
+            disable_web_page_preview=disable_web_page_preview,
+            rate_limit_args=rate_limit_args
         )
     elif message.photo:
         return await bot.send_photo(
@@ -17,7 +30,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             photo=message.photo[-1].file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.animation:
         return await bot.send_animation(
@@ -25,7 +39,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             animation=message.animation.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.video:
         return await bot.send_video(
@@ -33,7 +48,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             video=message.video.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.document:
         return await bot.send_document(
@@ -41,7 +57,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             document=message.document.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.audio:
         return await bot.send_audio(
@@ -49,7 +66,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             audio=message.audio.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.voice:
         return await bot.send_voice(
@@ -57,19 +75,41 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             voice=message.voice.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.video_note:
         return await bot.send_video_note(
             chat_id=chat_id,
             video_note=message.video_note.file_id,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     elif message.sticker:
         return await bot.send_sticker(
             chat_id=chat_id,
             sticker=message.sticker.file_id,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            rate_limit_args=rate_limit_args
         )
     return None
 
+def build_input_media(message):
+    if message.photo:
+        return InputMediaPhoto(message.photo[-1].file_id, caption=message.caption, caption_entities=message.caption_entities)
+    elif message.video:
+        return InputMediaVideo(message.video.file_id, caption=message.caption, caption_entities=message.caption_entities)
+    elif message.document:
+        return InputMediaDocument(message.document.file_id, caption=message.caption, caption_entities=message.caption_entities)
+    elif message.audio:
+        return InputMediaAudio(message.audio.file_id, caption=message.caption, caption_entities=message.caption_entities)
+    return None
+
+async def send_media_group_by_messages(bot, messages, chat_id, thread_id=None, rate_limit_args=None):
+    messages = sorted(messages, key=lambda message: message.message_id)
+    return await bot.send_media_group(
+        chat_id=chat_id,
+        media=[build_input_media(message) for message in messages],
+        message_thread_id=thread_id,
+        rate_limit_args=rate_limit_args
+    )